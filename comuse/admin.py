@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Piece, Like, Bookmark, Comment
+from .models import Piece, Like, Bookmark, Comment, Tag
 
 
 admin.site.register(Piece)
 admin.site.register(Like)
 admin.site.register(Bookmark)
 admin.site.register(Comment)
+admin.site.register(Tag)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ComuseConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "comuse"
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,272 @@
+import shutil
+import subprocess
+import threading
+import wave
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from myapp.startup import lazy_import
+
+np = lazy_import("numpy")
+
+ANALYSIS_RATE = 22050
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+SEGMENT_SECONDS = 0.1
+BLOCK_SEGMENTS = 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+ANALYSIS_FIELDS = ("duration", "loudness", "bpm", "musical_key")
+MEL_BANDS = 40
+MFCC_COEFFICIENTS = 20
+EMBEDDING_DIM = 2 * MFCC_COEFFICIENTS
+MIN_BPM = 60
+MAX_BPM = 200
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+
+class DecodeError(Exception):
+    pass
+
+
+WAVE_SAMPLE_TYPES = {1: "uint8", 2: "int16", 4: "int32"}
+
+
+def read_wave(source, chunk_seconds):
+    with wave.open(source) as audio:
+        rate, channels, width = audio.getframerate(), audio.getnchannels(), audio.getsampwidth()
+        dtype = WAVE_SAMPLE_TYPES.get(width)
+        if dtype is None:
+            raise DecodeError("Unsupported sample width: %d bytes" % width)
+        offset = 128 if width == 1 else 0
+        scale = float(2 ** (8 * width - 1))
+        while True:
+            data = audio.readframes(int(rate * chunk_seconds))
+            if not data:
+                return
+            samples = np.frombuffer(data, dtype=dtype).astype(np.float32) - offset
+            yield rate, samples.reshape(-1, channels).mean(axis=1) / scale
+
+
+def feed(source, pipe):
+    try:
+        shutil.copyfileobj(source, pipe)
+        pipe.close()
+    except (BrokenPipeError, ValueError):
+        pass
+
+
+def read_ffmpeg(source, chunk_seconds):
+    command = [
+        settings.FFMPEG_BINARY, "-v", "error", "-i", "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(ANALYSIS_RATE), "pipe:1",
+    ]
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as exc:
+        raise DecodeError("Cannot run %s: %s" % (settings.FFMPEG_BINARY, exc))
+    threading.Thread(target=feed, args=(source, process.stdin), daemon=True).start()
+    chunk_bytes = int(ANALYSIS_RATE * chunk_seconds) * 4
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            yield ANALYSIS_RATE, np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32)
+        if process.wait() != 0:
+            raise DecodeError(process.stderr.read().decode(errors="replace").strip())
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def decode(name, chunk_seconds=None):
+    chunk_seconds = chunk_seconds or settings.AUDIO_CHUNK_SECONDS
+    with default_storage.open(name) as source:
+        try:
+            with wave.open(source) as audio:
+                supported = audio.getsampwidth() in WAVE_SAMPLE_TYPES
+        except (wave.Error, EOFError):
+            supported = False
+        source.seek(0)
+        if supported:
+            yield from read_wave(source, chunk_seconds)
+        else:
+            yield from read_ffmpeg(source, chunk_seconds)
+
+
+def biquad_power(b, a, freqs, rate):
+    z = np.exp(-2j * np.pi * freqs / rate)
+    return np.abs((b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)) ** 2
+
+
+def k_weighting(freqs, rate):
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / rate
+    alpha = np.sin(w0) / np.sqrt(2)
+    root = 2 * np.sqrt(gain) * alpha
+    shelf = biquad_power(
+        [gain * ((gain + 1) + (gain - 1) * np.cos(w0) + root), -2 * gain * ((gain - 1) + (gain + 1) * np.cos(w0)), gain * ((gain + 1) + (gain - 1) * np.cos(w0) - root)],
+        [(gain + 1) - (gain - 1) * np.cos(w0) + root, 2 * ((gain - 1) - (gain + 1) * np.cos(w0)), (gain + 1) - (gain - 1) * np.cos(w0) - root],
+        freqs, rate,
+    )
+    w0 = 2 * np.pi * 38.0 / rate
+    alpha = np.sin(w0)
+    highpass = biquad_power(
+        [(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2],
+        [1 + alpha, -2 * np.cos(w0), 1 - alpha],
+        freqs, rate,
+    )
+    return shelf * highpass
+
+
+def pitch_classes(freqs):
+    classes = np.full(len(freqs), -1)
+    audible = (freqs >= 55) & (freqs <= 4200)
+    classes[audible] = np.round(12 * np.log2(freqs[audible] / 440.0) + 9).astype(int) % 12
+    return classes
+
+
+def mel_filterbank(freqs, bands):
+    mels = 2595 * np.log10(1 + freqs / 700)
+    edges = np.linspace(mels[1], mels[-1], bands + 2)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    return np.maximum(0, np.minimum((mels - lower) / (center - lower), (upper - mels) / (upper - center)))
+
+
+def dct_matrix(bands, coefficients):
+    n = np.arange(bands)
+    return np.cos(np.pi / bands * (n + 0.5) * np.arange(coefficients)[:, None]) * np.sqrt(2 / bands)
+
+
+class Analysis:
+    def __init__(self, rate):
+        self.rate = rate
+        self.samples = 0
+        self.segment = int(rate * SEGMENT_SECONDS)
+        freqs = np.fft.rfftfreq(self.segment, 1 / rate)
+        doubled = np.full(len(freqs), 2.0)
+        doubled[0] = 1.0
+        if self.segment % 2 == 0:
+            doubled[-1] = 1.0
+        self.segment_weights = k_weighting(freqs, rate) * doubled / self.segment ** 2
+        self.window = np.hanning(FRAME_SIZE).astype(np.float32)
+        freqs = np.fft.rfftfreq(FRAME_SIZE, 1 / rate)
+        self.pitch_classes = pitch_classes(freqs)
+        self.filterbank = mel_filterbank(freqs, MEL_BANDS)
+        self.cepstrum = dct_matrix(MEL_BANDS, MFCC_COEFFICIENTS + 1)[1:]
+        self.mfcc_frames = 0
+        self.mfcc_sum = np.zeros(MFCC_COEFFICIENTS)
+        self.mfcc_squares = np.zeros(MFCC_COEFFICIENTS)
+        self.powers = []
+        self.onsets = []
+        self.chroma = np.zeros(12)
+        self.spectrum = None
+        self.segment_rest = np.zeros(0, dtype=np.float32)
+        self.frame_rest = np.zeros(0, dtype=np.float32)
+
+    def feed(self, chunk):
+        self.samples += len(chunk)
+
+        buffer = np.concatenate([self.segment_rest, chunk])
+        count = len(buffer) // self.segment
+        segments = buffer[:count * self.segment].reshape(count, self.segment)
+        self.powers.append(np.abs(np.fft.rfft(segments, axis=1)) ** 2 @ self.segment_weights)
+        self.segment_rest = buffer[count * self.segment:]
+
+        buffer = np.concatenate([self.frame_rest, chunk])
+        if len(buffer) < FRAME_SIZE:
+            self.frame_rest = buffer
+            return
+        frames = np.lib.stride_tricks.sliding_window_view(buffer, FRAME_SIZE)[::HOP_SIZE]
+        magnitudes = np.abs(np.fft.rfft(frames * self.window, axis=1))
+        audible = self.pitch_classes >= 0
+        self.chroma += np.bincount(self.pitch_classes[audible], weights=(magnitudes[:, audible] ** 2).sum(axis=0), minlength=12)
+        mfcc = np.log(magnitudes ** 2 @ self.filterbank.T + 1e-10) @ self.cepstrum.T
+        self.mfcc_frames += len(mfcc)
+        self.mfcc_sum += mfcc.sum(axis=0)
+        self.mfcc_squares += (mfcc ** 2).sum(axis=0)
+        compressed = np.log1p(magnitudes)
+        previous = compressed[:1] if self.spectrum is None else self.spectrum[None]
+        self.onsets.append(np.maximum(np.diff(np.vstack([previous, compressed]), axis=0), 0).sum(axis=1))
+        self.spectrum = compressed[-1]
+        self.frame_rest = buffer[len(frames) * HOP_SIZE:]
+
+    def loudness(self):
+        powers = np.concatenate(self.powers) if self.powers else np.zeros(0)
+        if len(powers) >= BLOCK_SEGMENTS:
+            powers = np.convolve(powers, np.full(BLOCK_SEGMENTS, 1 / BLOCK_SEGMENTS), mode="valid")
+        elif len(powers):
+            powers = powers.mean(keepdims=True)
+        with np.errstate(divide="ignore"):
+            levels = -0.691 + 10 * np.log10(powers)
+        gated = powers[levels > ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+        gated = powers[(levels > ABSOLUTE_GATE) & (levels > threshold)]
+        return float(-0.691 + 10 * np.log10(gated.mean()))
+
+    def tempo(self):
+        envelope = np.concatenate(self.onsets) if self.onsets else np.zeros(0)
+        fps = self.rate / HOP_SIZE
+        shortest, longest = int(fps * 60 / MAX_BPM), int(np.ceil(fps * 60 / MIN_BPM))
+        if len(envelope) <= longest + 1:
+            return None
+        envelope = envelope - envelope.mean()
+        spectrum = np.fft.rfft(envelope, 2 * len(envelope))
+        correlation = np.fft.irfft(np.abs(spectrum) ** 2)[:len(envelope)]
+        if correlation[0] <= 0:
+            return None
+        lags = np.arange(shortest, longest + 1)
+        prior = np.exp(-0.5 * np.log2(fps * 60 / lags / 120.0) ** 2)
+        best = lags[np.argmax(correlation[lags] * prior)]
+        left, center, right = correlation[best - 1:best + 2]
+        curvature = left - 2 * center + right
+        lag = best + (0.5 * (left - right) / curvature if curvature < 0 else 0)
+        return float(60 * fps / lag)
+
+    def key(self):
+        if not self.chroma.any():
+            return ""
+        candidates = [
+            (np.corrcoef(self.chroma, np.roll(profile, tonic))[0, 1], PITCH_CLASSES[tonic] + suffix)
+            for profile, suffix in ((MAJOR_PROFILE, ""), (MINOR_PROFILE, "m"))
+            for tonic in range(12)
+        ]
+        return max(candidates)[1]
+
+    def embedding(self):
+        if not self.mfcc_frames:
+            return None
+        mean = self.mfcc_sum / self.mfcc_frames
+        spread = np.sqrt(np.maximum(self.mfcc_squares / self.mfcc_frames - mean ** 2, 0))
+        vector = np.concatenate([mean, spread]).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def result(self):
+        return {
+            "duration": self.samples / self.rate,
+            "loudness": self.loudness(),
+            "bpm": self.tempo(),
+            "musical_key": self.key(),
+            "embedding": self.embedding(),
+        }
+
+
+def analyze(name, chunk_seconds=None):
+    analysis = None
+    for rate, chunk in decode(name, chunk_seconds):
+        if analysis is None:
+            analysis = Analysis(rate)
+        analysis.feed(chunk)
+    if analysis is None:
+        raise DecodeError("No audio in %s" % name)
+    return analysis.result()
@@ -0,0 +1,305 @@
+import bisect
+import fcntl
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import unicodedata
+from array import array
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+
+from .models import Piece, Like
+from registration.models import Friendship
+
+User = get_user_model()
+
+PIECE = 0
+USER = 1
+KINDS = {PIECE: "piece", USER: "user"}
+MAGIC = b"ACP1"
+HEADER = struct.Struct("<4s4x6q")
+HEADER_SIZE = 64
+BATCH_SIZE = 1000
+
+
+def normalize(text):
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def terms(label):
+    key = normalize(label)
+    found = {key} if key else set()
+    for i in range(1, len(key)):
+        if key[i - 1] == " ":
+            found.add(key[i:])
+    return found
+
+
+def user_entries(queryset):
+    for users in batched(queryset.values_list("pk", "username").order_by("pk").iterator(), BATCH_SIZE):
+        followers = dict(
+            Friendship.objects.filter(following_id__in=[pk for pk, _ in users], follower__is_active=True)
+            .order_by().values_list("following_id").annotate(n=Count("pk"))
+        )
+        for pk, username in users:
+            yield USER, pk, username, followers.get(pk, 0)
+
+
+def piece_entries(queryset):
+    for pieces in batched(queryset.values_list("pk", "title").order_by("pk").iterator(), BATCH_SIZE):
+        likes = Like.objects.counts([pk for pk, _ in pieces])
+        for pk, title in pieces:
+            yield PIECE, pk, title, likes.get(pk, 0)
+
+
+def index_entries():
+    return itertools.chain(
+        user_entries(User.objects.filter(is_active=True)),
+        piece_entries(Piece.objects.filter(user__is_active=True)),
+    )
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def write_snapshot(filename, entries, heavy_size, top_size):
+    rows = sorted(
+        (term.encode(), kind, pk, label.encode(), score)
+        for kind, pk, label, score in entries
+        for term in terms(label)
+    )
+    keys = [row[0] for row in rows]
+    scores = [row[4] for row in rows]
+    heavy = []
+
+    def rank(i):
+        return scores[i], -i
+
+    def visit(lo, hi, depth):
+        if hi - lo <= heavy_size:
+            return heapq.nlargest(top_size, range(lo, hi), key=rank)
+        boundary = len(keys[hi - 1]) == depth or keys[hi - 1][depth] & 0xC0 != 0x80
+        position = len(heavy)
+        if depth and boundary:
+            heavy.append(None)
+        candidates = []
+        i = lo
+        while i < hi and len(keys[i]) == depth:
+            candidates.append(i)
+            i += 1
+        while i < hi:
+            j = bisect.bisect_left(keys, keys[i][:depth] + bytes([keys[i][depth] + 1]), i, hi)
+            candidates.extend(visit(i, j, depth + 1))
+            i = j
+        top = heapq.nlargest(top_size, candidates, key=rank)
+        if depth and boundary:
+            heavy[position] = (keys[lo][:depth], top)
+        return top
+
+    visit(0, len(rows), 0)
+
+    def offsets(blobs):
+        return array("q", itertools.accumulate((len(blob) for blob in blobs), initial=0))
+
+    labels = [row[3] for row in rows]
+    prefixes = [prefix for prefix, _ in heavy]
+    tops = array("q", [i for _, top in heavy for i in top + [-1] * (top_size - len(top))])
+    sections = [
+        offsets(keys), offsets(labels),
+        array("q", [row[1] for row in rows]), array("q", [row[2] for row in rows]), array("q", scores),
+        offsets(prefixes), tops,
+    ]
+    blobs = [b"".join(keys), b"".join(labels), b"".join(prefixes)]
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory)
+    with os.fdopen(descriptor, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(rows), len(heavy), top_size, *map(len, blobs)).ljust(HEADER_SIZE, b"\0"))
+        for section in sections:
+            f.write(section.tobytes())
+        for blob in blobs:
+            f.write(blob)
+    return temporary, len(rows)
+
+
+class Blobs:
+    def __init__(self, view, offsets):
+        self.view = view
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.view[self.offsets[i]:self.offsets[i + 1]])
+
+
+class Snapshot:
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, heavy, self.top_size, *blob_sizes = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError("%s is not an autocomplete snapshot" % filename)
+        view = memoryview(self.map)
+        position = HEADER_SIZE
+        sections = []
+        for length in (count + 1, count + 1, count, count, count, heavy + 1, heavy * self.top_size):
+            sections.append(view[position:position + 8 * length].cast("q"))
+            position += 8 * length
+        blobs = []
+        for size in blob_sizes:
+            blobs.append(view[position:position + size])
+            position += size
+        key_offsets, label_offsets, self.kinds, self.ids, self.scores, heavy_offsets, self.tops = sections
+        self.keys = Blobs(blobs[0], key_offsets)
+        self.labels = Blobs(blobs[1], label_offsets)
+        self.prefixes = Blobs(blobs[2], heavy_offsets)
+
+    def top(self, prefix):
+        i = bisect.bisect_left(self.prefixes, prefix)
+        if i < len(self.prefixes) and self.prefixes[i] == prefix:
+            return [row for row in self.tops[i * self.top_size:(i + 1) * self.top_size] if row >= 0]
+        return None
+
+    def scan(self, prefix):
+        lo = bisect.bisect_left(self.keys, prefix)
+        return range(lo, bisect.bisect_left(self.keys, prefix + b"\xff", lo))
+
+    def entry(self, row):
+        return self.kinds[row], self.ids[row], self.labels[row].decode(), self.scores[row]
+
+
+class PrefixIndex:
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.Lock()
+        self.state = None
+        self.snapshot = None
+        self.overlay = {}
+        self.overlay_terms = []
+        self.records = 0
+
+    def file(self, suffix):
+        return "%s.%s" % (self.path, suffix)
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.local, open(self.file("lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stat(self, suffix):
+        try:
+            stat = os.stat(self.file(suffix))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def stamp(self):
+        return self.stat("snapshot"), self.stat("journal")
+
+    def load(self):
+        stamp = self.stamp()
+        if stamp == self.state:
+            return
+        if self.state is None or stamp[0] != self.state[0]:
+            self.snapshot = Snapshot(self.file("snapshot")) if stamp[0] else None
+        overlay = {}
+        self.records = 0
+        if stamp[1]:
+            with open(self.file("journal"), "rb") as f:
+                for line in f:
+                    kind, pk, label, score = json.loads(line)
+                    overlay[kind, pk] = None if label is None else (label, score)
+                    self.records += 1
+        self.overlay = overlay
+        self.overlay_terms = sorted(
+            (term.encode(), kind, pk, entry[0], entry[1])
+            for (kind, pk), entry in overlay.items() if entry is not None
+            for term in terms(entry[0])
+        )
+        self.state = stamp
+
+    def apply(self, changes):
+        changes = list(changes)
+        if not changes:
+            return False
+        with self.locked():
+            with open(self.file("journal"), "ab") as f:
+                f.write(b"".join(json.dumps(change, ensure_ascii=False).encode() + b"\n" for change in changes))
+            self.load()
+            return self.records >= settings.AUTOCOMPLETE_JOURNAL_LIMIT
+
+    def rebuild(self, entries=None):
+        with self.locked():
+            replayed = self.stat("journal")[1] if self.stat("journal") else 0
+        temporary, count = write_snapshot(
+            self.file("snapshot"), index_entries() if entries is None else entries,
+            settings.AUTOCOMPLETE_HEAVY_PREFIX, settings.AUTOCOMPLETE_TOP,
+        )
+        with self.locked():
+            tail = b""
+            if self.stat("journal"):
+                with open(self.file("journal"), "rb") as f:
+                    f.seek(replayed)
+                    tail = f.read()
+            os.replace(temporary, self.file("snapshot"))
+            descriptor, journal = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(tail)
+            os.replace(journal, self.file("journal"))
+            self.state = None
+        return count
+
+    def search(self, query, limit=None):
+        limit = limit or settings.AUTOCOMPLETE_LIMIT
+        prefix = normalize(query).encode()
+        if not prefix:
+            return []
+        self.load()
+        found = {}
+        if self.snapshot is not None:
+            rows = self.snapshot.top(prefix)
+            if rows is not None:
+                self.collect(rows, found)
+            if rows is None or len(found) < limit and len(rows) == self.snapshot.top_size:
+                rows = heapq.nlargest(limit + len(self.overlay), self.snapshot.scan(prefix), key=lambda row: (self.snapshot.scores[row], -row))
+                self.collect(rows, found)
+        lo = bisect.bisect_left(self.overlay_terms, (prefix,))
+        hi = bisect.bisect_left(self.overlay_terms, (prefix + b"\xff",), lo)
+        for _, kind, pk, label, score in self.overlay_terms[lo:hi]:
+            found[kind, pk] = (label, score)
+        ranked = heapq.nsmallest(limit, found.items(), key=lambda item: (-item[1][1], item[1][0]))
+        return [{"kind": KINDS[kind], "id": pk, "label": label} for (kind, pk), (label, _) in ranked]
+
+    def collect(self, rows, found):
+        for row in rows:
+            kind, pk, label, score = self.snapshot.entry(row)
+            if (kind, pk) not in self.overlay:
+                found[kind, pk] = (label, score)
+
+
+_indexes = {}
+
+
+def autocomplete_index():
+    path = settings.AUTOCOMPLETE_PATH
+    if path not in _indexes:
+        _indexes[path] = PrefixIndex(path)
+    return _indexes[path]
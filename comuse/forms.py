@@ -1,4 +1,5 @@
 import django.forms as forms
+from .audio import PITCH_CLASSES
 from .models import Piece, Comment
 
 class PieceForm(forms.ModelForm):
@@ -9,4 +10,32 @@ class PieceForm(forms.ModelForm):
 class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
-        fields = ("content",)
\ No newline at end of file
+        fields = ("content",)
+
+
+class PieceFilterForm(forms.Form):
+    KEY_CHOICES = [("", "指定なし")] + [(name + suffix, name + suffix) for suffix in ("", "m") for name in PITCH_CLASSES]
+
+    min_minutes = forms.FloatField(required=False, min_value=0, label="長さ(分)から")
+    max_minutes = forms.FloatField(required=False, min_value=0, label="長さ(分)まで")
+    min_bpm = forms.FloatField(required=False, min_value=0, label="BPMから")
+    max_bpm = forms.FloatField(required=False, min_value=0, label="BPMまで")
+    min_loudness = forms.FloatField(required=False, max_value=0, label="ラウドネス(LUFS)から")
+    max_loudness = forms.FloatField(required=False, max_value=0, label="ラウドネス(LUFS)まで")
+    key = forms.ChoiceField(required=False, choices=KEY_CHOICES, label="キー")
+
+    def filter(self, queryset):
+        data = self.cleaned_data
+        ranges = {
+            "duration__gte": data["min_minutes"] and data["min_minutes"] * 60,
+            "duration__lte": data["max_minutes"] and data["max_minutes"] * 60,
+            "bpm__gte": data["min_bpm"],
+            "bpm__lte": data["max_bpm"],
+            "loudness__gte": data["min_loudness"],
+            "loudness__lte": data["max_loudness"],
+            "musical_key": data["key"] or None,
+        }
+        return queryset.filter(**{lookup: value for lookup, value in ranges.items() if value is not None})
+
+    def has_filters(self):
+        return self.is_valid() and any(value not in (None, "") for value in self.cleaned_data.values())
@@ -0,0 +1,143 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .autocomplete import normalize
+from .models import Mention, PieceTag, Tag
+
+User = get_user_model()
+
+TAG_PATTERN = re.compile(r"(?<![\w&#＃])[#＃](\w+)")
+MENTION_PATTERN = re.compile(r"(?<![\w.@＠])[@＠]([\w.+-]+)")
+TAG_CLOUD_KEY = "tag-cloud"
+
+
+def tag_name(text):
+    name = normalize(text)
+    if name.isdigit() or len(name) > Tag._meta.get_field("name").max_length:
+        return None
+    return name
+
+
+def extract_tags(text):
+    return list(dict.fromkeys(name for name in map(tag_name, TAG_PATTERN.findall(text)) if name))
+
+
+def extract_mentions(text):
+    return list(dict.fromkeys(unicodedata.normalize("NFKC", name) for name in MENTION_PATTERN.findall(text)))
+
+
+def tag_ids(names):
+    ids = dict(Tag.objects.filter(name__in=names).values_list("name", "pk"))
+    missing = [name for name in names if name not in ids]
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        ids.update(Tag.objects.filter(name__in=missing).values_list("name", "pk"))
+    return ids
+
+
+def mentioned_users(names):
+    candidates = set(names) | {name.rstrip(".") for name in names}
+    users = dict(User.objects.filter(username__in=candidates, is_active=True).values_list("username", "pk"))
+    resolved = {}
+    for name in names:
+        pk = users.get(name) or users.get(name.rstrip("."))
+        if pk is not None:
+            resolved[name] = pk
+    return resolved
+
+
+def sync(queryset, fields, wanted, created):
+    stale = []
+    if not created:
+        for pk, *key in queryset.values_list("pk", *fields):
+            if wanted.pop(tuple(key), None) is None:
+                stale.append(pk)
+    if stale:
+        queryset.model.objects.filter(pk__in=stale).delete()
+    if wanted:
+        queryset.model.objects.bulk_create(
+            [queryset.model(created_at=created_at, **dict(zip(fields, key))) for key, created_at in wanted.items()],
+            ignore_conflicts=True,
+        )
+
+
+def index_pieces(pieces, created=False):
+    tags = {piece.pk: extract_tags(piece.caption) for piece in pieces}
+    mentions = {piece.pk: extract_mentions(piece.caption) for piece in pieces}
+    if created and not any(tags.values()) and not any(mentions.values()):
+        return
+    ids = tag_ids(set().union(*tags.values()))
+    users = mentioned_users(set().union(*mentions.values()))
+    piece_ids = [piece.pk for piece in pieces]
+    sync(
+        PieceTag.objects.filter(piece_id__in=piece_ids), ("piece_id", "tag_id"),
+        {(piece.pk, ids[name]): piece.created_at for piece in pieces for name in tags[piece.pk]},
+        created,
+    )
+    sync(
+        Mention.objects.filter(piece_id__in=piece_ids, comment__isnull=True), ("piece_id", "user_id"),
+        {
+            (piece.pk, users[name]): piece.created_at
+            for piece in pieces for name in mentions[piece.pk]
+            if name in users and users[name] != piece.user_id
+        },
+        created,
+    )
+
+
+def index_comments(comments):
+    mentions = {comment.pk: extract_mentions(comment.content) for comment in comments}
+    if not any(mentions.values()):
+        return
+    users = mentioned_users(set().union(*mentions.values()))
+    Mention.objects.bulk_create(
+        [
+            Mention(user_id=users[name], piece_id=comment.target_id, comment_id=comment.pk, created_at=comment.created_at)
+            for comment in comments for name in mentions[comment.pk]
+            if name in users and users[name] != comment.user_id
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill(queryset, index, batch_size=1000):
+    last = 0
+    count = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last).order_by("pk")[:batch_size])
+        if not batch:
+            return count
+        with transaction.atomic():
+            index(batch)
+        last = batch[-1].pk
+        count += len(batch)
+
+
+def tag_cloud():
+    cloud = cache.get(TAG_CLOUD_KEY)
+    if cloud is None:
+        cloud = list(
+            PieceTag.objects.filter(piece__user__is_active=True).values_list("tag__name")
+            .annotate(n=Count("pk")).order_by("-n", "tag__name")[:settings.TAG_CLOUD_SIZE]
+        )
+        cache.set(TAG_CLOUD_KEY, cloud, settings.TAG_COUNT_TIMEOUT)
+    return cloud
+
+
+def tag_count_key(tag_id):
+    return "tag-count:%s" % tag_id
+
+
+def tag_count(tag):
+    key = tag_count_key(tag.pk)
+    count = cache.get(key)
+    if count is None:
+        count = PieceTag.objects.filter(tag=tag, piece__user__is_active=True).count()
+        cache.set(key, count, settings.TAG_COUNT_TIMEOUT)
+    return count
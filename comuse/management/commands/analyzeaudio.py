@@ -0,0 +1,76 @@
+import multiprocessing
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+
+from comuse.audio import ANALYSIS_FIELDS, DecodeError, analyze, np
+from comuse.models import Piece
+from comuse.search import invalidate_search
+from comuse.vectors import vector_store
+
+
+def analyze_file(name):
+    if not apps.ready:
+        django.setup()
+    try:
+        return name, analyze(name), None
+    except (DecodeError, OSError) as exc:
+        return name, None, str(exc)
+
+
+class Command(BaseCommand):
+    help = "Decode uploaded audio once and store duration, loudness, tempo, key and the similarity embedding."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--all", action="store_true", help="Re-analyze pieces that already have results.")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy is required for audio analysis.")
+        pieces = Piece.objects.exclude(uploadedFile="").exclude(uploadedFile__isnull=True)
+        if not options["all"]:
+            pieces = pieces.filter(analyzed_at__isnull=True)
+        names = sorted(set(pieces.values_list("uploadedFile", flat=True)))
+        self.stdout.write("Analyzing %d files with %d processes." % (len(names), options["processes"]))
+
+        if options["processes"] <= 1:
+            analyzed, failed = self.collect(map(analyze_file, names), options["batch_size"])
+        else:
+            connections.close_all()
+            with multiprocessing.Pool(options["processes"]) as pool:
+                analyzed, failed = self.collect(pool.imap_unordered(analyze_file, names), options["batch_size"])
+        self.stdout.write("Analyzed %d pieces, %d files failed." % (analyzed, failed))
+
+    def collect(self, results, batch_size):
+        analyzed = failed = 0
+        batch = []
+        for name, result, error in results:
+            if error:
+                failed += 1
+                self.stderr.write("%s: %s" % (name, error))
+                continue
+            batch.append((name, result))
+            if len(batch) >= batch_size:
+                analyzed += self.store(batch)
+                batch = []
+        analyzed += self.store(batch)
+        return analyzed, failed
+
+    def store(self, batch):
+        now = timezone.now()
+        store = vector_store()
+        updated = 0
+        with transaction.atomic():
+            for name, result in batch:
+                pieces = Piece.objects.filter(uploadedFile=name)
+                if result["embedding"] is not None:
+                    for piece_id in pieces.values_list("pk", flat=True):
+                        store.add(piece_id, result["embedding"])
+                updated += pieces.update(analyzed_at=now, **{field: result[field] for field in ANALYSIS_FIELDS})
+        invalidate_search()
+        return updated
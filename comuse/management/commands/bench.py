@@ -0,0 +1,255 @@
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.utils import timezone
+
+from comuse.audio import EMBEDDING_DIM, np
+from comuse.autocomplete import PIECE, USER, PrefixIndex
+from comuse.models import Piece
+from comuse.ratelimit import RateLimiter, TokenBucket
+from comuse.vectors import VectorStore
+
+User = get_user_model()
+
+LEGACY_FEED_TEMPLATE = """{% extends "base.html" %}
+{% block content %}
+{% for piece in piece_list %}
+<div class="tweetbox">
+    <ul class="topbar">
+        <li><a href="{% url 'registration:user_profile' username=piece.user %}">投稿者:{{ piece.user }}</a></li>
+        <li style="width: 30%; margin: 0% 1%;"><p>作成日:{{ piece.created_at }}</p></li>
+    </ul>
+    <h3 class="contents">タイトル:{{ piece.title }}</h3>
+    <p class="contents">{{ piece.caption | linebreaksbr }}</p>
+    <ul class="bottombar">
+        <li><a href="{% url 'comuse:detail' piece.pk %}"><i class="bi bi-eye-fill"></i>詳細</a></li>
+        {% if request.user == piece.user %}
+            <li><a href="{% url 'comuse:delete' piece.pk %}"><i class="bi bi-trash-fill"></i>削除</a></li>
+        {% endif %}
+        <div class="minibuttons" style="width: 12%;">
+            {% if piece.id in user_like_list %}
+                <button id="piece-{{piece.id}}" class="likebtn" data-url="{% url 'comuse:unlike' piece.id %}" data-pk={{piece.pk}} data-is-liked="true"><i class="bi bi-heart-fill"></i></button>
+                <span id="liketxt_{{piece.id}}">いいね解除</span>
+            {% else %}
+                <button id="piece-{{piece.id}}" class="likebtn" data-url="{% url 'comuse:like' piece.id %}" data-pk={{piece.pk}} data-is-liked="false"><i class="bi bi-heart"></i></button>
+                <span id="liketxt_{{piece.id}}">いいね！</span>
+            {% endif %}
+        </div>
+        <span style="min-width: 12%; margin: 1%;">いいね数:<span id="count_{{piece.id}}">{{ piece.liked_count }}</span></span>
+        <div class="minibuttons" style="width: 20%;">
+            {% if piece.id in user_bookmark_list %}
+                <button id="piece-{{piece.id}}" class="bmbtn" data-url="{% url 'comuse:deleteBookmark' piece.id %}" data-pk={{piece.pk}} data-is-bookmarked="true"><i class="bi bi-bookmark-fill"></i></button>
+                <span id="bmtxt_{{piece.id}}">ブックマーク解除</span>
+            {% else %}
+                <button id="piece-{{piece.id}}" class="bmbtn" data-url="{% url 'comuse:bookmark' piece.id %}" data-pk={{piece.pk}} data-is-bookmarked="false"><i class="bi bi-bookmark"></i></button>
+                <span id="bmtxt_{{piece.id}}">ブックマーク</span>
+            {% endif %}
+        </div>
+    </ul>
+</div>
+{% endfor %}
+{% endblock %}"""
+
+STARTUP_SCRIPT = """
+import sys
+import time
+started = time.perf_counter()
+import django
+django.setup()
+loaded = time.perf_counter()
+if "warm" in sys.argv:
+    from myapp.startup import warm
+    warm()
+print(loaded - started, time.perf_counter() - loaded)
+"""
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+class Command(BaseCommand):
+    help = "Run micro-benchmarks. Targets: render, ratelimit, vectors, autocomplete, imports."
+
+    def add_arguments(self, parser):
+        parser.add_argument("target", choices=["render", "ratelimit", "vectors", "autocomplete", "imports"])
+        parser.add_argument("--items", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--hits", type=int, default=10000)
+        parser.add_argument("--vectors", type=int, default=50000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument("--entries", type=int, default=200000)
+        parser.add_argument("--changes", type=int, default=500)
+        parser.add_argument("--top", type=int, default=15)
+
+    def handle(self, *args, **options):
+        getattr(self, "bench_" + options["target"])(**options)
+
+    def bench_render(self, items, repeat, **options):
+        user = User(pk=1, username="bench")
+        pieces = []
+        for pk in range(1, items + 1):
+            piece = Piece(pk=pk, user=user, title="title %d" % pk, caption="caption\n%d" % pk, created_at=timezone.now())
+            piece._liked_count = pk % 7
+            pieces.append(piece)
+        request = RequestFactory().get("/")
+        request.user = user
+        liked = [pk for pk in range(1, items + 1, 2)]
+        bookmarked = [pk for pk in range(1, items + 1, 3)]
+
+        legacy = engines["django"].from_string(LEGACY_FEED_TEMPLATE)
+        legacy_context = {"piece_list": pieces, "user_like_list": liked, "user_bookmark_list": bookmarked, "unread_notification_count": 0}
+        current = get_template("comuse/home.html")
+        current_context = {"piece_list": pieces, "user_like_list": set(liked), "user_bookmark_list": set(bookmarked), "unread_notification_count": 0}
+
+        before = timed(lambda: legacy.render(legacy_context, request), repeat)
+        after = timed(lambda: current.render(current_context, request), repeat)
+        scale = 100 / items
+        self.stdout.write("feed render, %d items, best of %d" % (items, repeat))
+        self.stdout.write("  {%% url %%} markup:    %.2f ms per 100 items" % (before * 1000 * scale))
+        self.stdout.write("  precompiled tags:    %.2f ms per 100 items" % (after * 1000 * scale))
+        self.stdout.write("  speedup:             %.1fx" % (before / after))
+
+    def bench_ratelimit(self, hits, repeat, **options):
+        limiter = RateLimiter()
+        bucket = TokenBucket()
+
+        def shared():
+            for i in range(hits):
+                limiter.hit("bench", i % 100, "1000/m")
+
+        def local():
+            for i in range(hits):
+                bucket.hit("bench:%d" % (i % 100), 1000, 60)
+
+        self.stdout.write("rate limit check, %d hits over 100 clients, best of %d" % (hits, repeat))
+        self.stdout.write("  sliding window (cache): %.1f us per check" % (timed(shared, repeat) / hits * 1e6))
+        self.stdout.write("  token bucket (memory):  %.1f us per check" % (timed(local, repeat) / hits * 1e6))
+
+    def bench_vectors(self, vectors, queries, k, **options):
+        if np is None:
+            raise CommandError("NumPy is required for the vectors benchmark.")
+        random = np.random.default_rng(0)
+        centers = random.normal(size=(max(1, vectors // 250), EMBEDDING_DIM))
+        data = centers[random.integers(0, len(centers), vectors)] + random.normal(scale=0.6, size=(vectors, EMBEDDING_DIM))
+        data = (data / np.linalg.norm(data, axis=1, keepdims=True)).astype(np.float32)
+        probes = data[random.integers(0, vectors, queries)] + random.normal(scale=0.1, size=(queries, EMBEDDING_DIM)).astype(np.float32)
+
+        directory = tempfile.mkdtemp()
+        try:
+            store = VectorStore(os.path.join(directory, "bench"))
+            started = time.perf_counter()
+            inserts = min(vectors, 1000)
+            for pk in range(1, inserts + 1):
+                store.add(pk, data[pk - 1])
+            insert_time = (time.perf_counter() - started) / inserts
+            with store.locked():
+                store.allocate(vectors)
+                store.load()
+                store.matrix[:vectors] = data
+                store.ids[:vectors] = np.arange(1, vectors + 1)
+                store.flush()
+                store.touch()
+            started = time.perf_counter()
+            clusters = store.train()
+            train_time = time.perf_counter() - started
+
+            exact = [{pk for pk, _ in store.brute_force(probe, k)} for probe in probes]
+            brute_time = timed(lambda: [store.brute_force(probe, k) for probe in probes], 1) / queries
+            self.stdout.write("vector search, %d x %d float32, %d queries, top %d" % (vectors, EMBEDDING_DIM, queries, k))
+            self.stdout.write("  incremental insert:  %.2f ms" % (insert_time * 1000))
+            self.stdout.write("  train %d lists:     %.2f s" % (clusters, train_time))
+            self.stdout.write("  brute force:         %.3f ms per query" % (brute_time * 1000))
+            for nprobe in (1, 2, 4, 8, 16):
+                found = [{pk for pk, _ in store.search(probe, k, probes=nprobe)} for probe in probes]
+                recall = np.mean([len(hit & truth) / len(truth) for hit, truth in zip(found, exact)])
+                latency = timed(lambda: [store.search(probe, k, probes=nprobe) for probe in probes], 1) / queries
+                self.stdout.write("  ivf nprobe=%-2d        %.3f ms per query, recall@%d %.3f" % (nprobe, latency * 1000, k, recall))
+        finally:
+            shutil.rmtree(directory)
+
+    def bench_autocomplete(self, entries, queries, changes, **options):
+        generator = random.Random(0)
+        syllables = ["ka", "ra", "mu", "so", "ne", "lo", "ve", "ti", "ba", "do", "shi", "ren", "moon", "blue", "night", "夜", "空", "の", "歌", "光"]
+
+        def word():
+            return "".join(generator.choice(syllables) for _ in range(generator.randint(1, 4)))
+
+        labels = [" ".join(word() for _ in range(generator.randint(1, 3))) for _ in range(entries)]
+        rows = [(USER if pk % 10 == 0 else PIECE, pk, label, int(generator.paretovariate(1.2))) for pk, label in enumerate(labels, start=1)]
+        prefixes = [label[:generator.randint(1, 4)] for label in generator.sample(labels, min(queries, entries))]
+
+        directory = tempfile.mkdtemp()
+        try:
+            index = PrefixIndex(os.path.join(directory, "autocomplete"))
+            started = time.perf_counter()
+            terms = index.rebuild(rows)
+            build_time = time.perf_counter() - started
+            index.search("warmup")
+            self.stdout.write("autocomplete, %d entries (%d terms), %d queries" % (entries, terms, len(prefixes)))
+            self.stdout.write("  snapshot build:      %.2f s" % build_time)
+            self.report_latencies("snapshot", index, prefixes)
+            index.apply((PIECE, entries + pk, word(), 0) for pk in range(changes))
+            index.search("warmup")
+            self.report_latencies("+%d journal" % changes, index, prefixes)
+            naive = timed(lambda: [sorted((label for label in labels if label.startswith(prefix)))[:8] for prefix in prefixes[:20]], 1) / 20
+            self.stdout.write("  linear scan:         %.2f ms per query" % (naive * 1000))
+        finally:
+            shutil.rmtree(directory)
+
+    def report_latencies(self, name, index, prefixes):
+        latencies = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            index.search(prefix)
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        p50, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+        self.stdout.write("  %-20s p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (name + ":", p50 * 1000, p99 * 1000, latencies[-1] * 1000))
+
+    def startup(self, *flags, warm=False):
+        return subprocess.run(
+            [sys.executable, *flags, "-c", STARTUP_SCRIPT] + (["warm"] if warm else []),
+            cwd=settings.BASE_DIR, env=dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE),
+            capture_output=True, text=True, check=True,
+        )
+
+    def bench_imports(self, repeat, top, **options):
+        timings = [[float(value) for value in self.startup(warm=True).stdout.split()] for _ in range(repeat)]
+        setup, warm = min(setup for setup, _ in timings), min(warm for _, warm in timings)
+        modules = []
+        for line in self.startup("-X", "importtime").stderr.splitlines():
+            fields = line.removeprefix("import time:").split("|")
+            if len(fields) == 3 and fields[0].strip().isdigit():
+                modules.append((int(fields[0]), int(fields[1]), fields[2].rstrip()))
+        packages = Counter()
+        for own, _, name in modules:
+            packages[name.strip().split(".")[0]] += own
+        self.stdout.write("startup, best of %d fresh interpreters" % repeat)
+        self.stdout.write("  django.setup():      %.1f ms" % (setup * 1000))
+        self.stdout.write("  warm():              %.1f ms" % (warm * 1000))
+        self.stdout.write("  setup imports:       %d modules, %.1f ms self time under -X importtime" % (len(modules), sum(own for own, _, _ in modules) / 1000))
+        self.stdout.write("  heaviest packages (self time):")
+        for name, own in packages.most_common(top):
+            self.stdout.write("    %-30s %7.1f ms" % (name, own / 1000))
+        self.stdout.write("  heaviest top-level imports (cumulative):")
+        for _, cumulative, name in sorted((module for module in modules if not module[2].startswith("  ")), key=lambda module: -module[1])[:top]:
+            self.stdout.write("    %-30s %7.1f ms" % (name.strip(), cumulative / 1000))
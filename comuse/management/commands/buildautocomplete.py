@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from comuse.autocomplete import autocomplete_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the autocomplete snapshot from titles and usernames, folding in the change journal."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = autocomplete_index().rebuild()
+        self.stdout.write("Indexed %d terms in %.1f s." % (count, time.perf_counter() - started))
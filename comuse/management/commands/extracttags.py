@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from comuse.hashtags import backfill, index_comments, index_pieces
+from comuse.models import Piece, Comment
+
+
+class Command(BaseCommand):
+    help = "Extract #tags and @mentions from existing captions and comments, streaming rows in primary key order."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pieces = backfill(Piece.objects.only("pk", "user_id", "caption", "created_at"), index_pieces, options["batch_size"])
+        self.stdout.write("Indexed %d pieces." % pieces)
+        comments = Comment.objects.filter(Q(content__contains="@") | Q(content__contains="＠"))
+        comments = backfill(comments.only("pk", "user_id", "target_id", "content", "created_at"), index_comments, options["batch_size"])
+        self.stdout.write("Indexed %d comments with mentions." % comments)
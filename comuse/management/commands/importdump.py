@@ -0,0 +1,249 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from comuse.models import Piece, Like, Bookmark, Comment
+from comuse.hashtags import backfill, index_comments, index_pieces
+from comuse.search import invalidate_search, search_text
+from comuse.tasks import rebuild_autocomplete
+from jobs.queue import enqueue
+from registration.models import Friendship
+from registration.summary import rebuild_in_batches
+
+User = get_user_model()
+
+FLUSH_ORDER = ("user", "piece", "like", "bookmark", "comment", "friendship")
+
+
+def parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+class Command(BaseCommand):
+    help = "Bulk import users, pieces, likes, bookmarks, comments and friendships from NDJSON/CSV dumps."
+
+    def add_arguments(self, parser):
+        parser.add_argument("dump")
+        parser.add_argument("--model", choices=FLUSH_ORDER, help="Row type of a CSV dump.")
+        parser.add_argument("--user", help="Owner of rows that carry no user column.")
+        parser.add_argument("--source", default="import", help="Prefix for the import keys of this platform.")
+        parser.add_argument("--media-dir", help="Directory the uploadedFile paths in the dump are relative to.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--checkpoint", help="Progress file used to resume. Defaults to <dump>.checkpoint.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.user_ids = {}
+        self.pending = {model: [] for model in FLUSH_ORDER}
+        self.skipped = 0
+        self.checkpoint = options["checkpoint"] or options["dump"] + ".checkpoint"
+        self.touched = self.read_touched()
+        done = self.read_checkpoint()
+        if done:
+            self.stdout.write("Resuming after line %d." % done)
+
+        started = time.monotonic()
+        imported = 0
+        line_no = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as self.pool:
+            for line_no, model, row in self.read_rows():
+                if line_no <= done:
+                    continue
+                self.pending[model].append(row)
+                imported += 1
+                if imported % options["batch_size"] == 0:
+                    self.flush(line_no)
+                    self.report(imported, started)
+            self.flush(line_no)
+        self.report(imported, started)
+        if self.skipped:
+            self.stderr.write("Skipped %d rows whose target piece is not in the dump or an earlier batch." % self.skipped)
+        self.finalize()
+        for path in (self.checkpoint, self.checkpoint + ".users"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def read_rows(self):
+        path = self.options["dump"]
+        with open(path, newline="", encoding="utf-8") as dump:
+            if path.endswith(".csv"):
+                if not self.options["model"]:
+                    raise CommandError("--model is required for CSV dumps.")
+                for line_no, row in enumerate(csv.DictReader(dump), start=1):
+                    yield line_no, self.options["model"], row
+            else:
+                for line_no, line in enumerate(dump, start=1):
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    model = row.get("model")
+                    if model not in FLUSH_ORDER:
+                        raise CommandError("Unknown model %r on line %d." % (model, line_no))
+                    yield line_no, model, row
+
+    def read_checkpoint(self):
+        if not os.path.exists(self.checkpoint):
+            return 0
+        with open(self.checkpoint) as f:
+            return json.load(f)["line"]
+
+    def read_touched(self):
+        if not os.path.exists(self.checkpoint + ".users"):
+            return set()
+        with open(self.checkpoint + ".users") as f:
+            return {int(line) for line in f if line.strip()}
+
+    def record_touched(self):
+        new = set(self.user_ids.values()) - self.touched
+        if new:
+            with open(self.checkpoint + ".users", "a") as f:
+                f.write("".join("%d\n" % pk for pk in sorted(new)))
+                f.flush()
+                os.fsync(f.fileno())
+            self.touched |= new
+
+    def write_checkpoint(self, line_no):
+        tmp_path = self.checkpoint + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"line": line_no}, f)
+        os.replace(tmp_path, self.checkpoint)
+
+    def report(self, imported, started):
+        elapsed = max(time.monotonic() - started, 1e-9)
+        self.stdout.write("%d rows in %.1fs (%.0f rows/s)" % (imported, elapsed, imported / elapsed))
+
+    def flush(self, line_no):
+        with transaction.atomic():
+            for model in FLUSH_ORDER:
+                rows = self.pending[model]
+                if rows:
+                    getattr(self, "import_" + model)(rows)
+                    self.pending[model] = []
+        self.record_touched()
+        self.write_checkpoint(line_no)
+
+    def import_key(self, source_id):
+        return "%s:%s" % (self.options["source"], source_id)
+
+    def owner(self, row):
+        username = row.get("user") or self.options["user"]
+        if not username:
+            raise CommandError("Row has no user column; pass --user.")
+        return username
+
+    def resolve_users(self, usernames):
+        missing = {name for name in usernames if name not in self.user_ids}
+        if missing:
+            found = User.objects.filter(username__in=missing).values_list("username", "pk")
+            self.user_ids.update(found)
+            new_users = [User(username=name, password=make_password(None)) for name in missing - set(self.user_ids)]
+            if new_users:
+                User.objects.bulk_create(new_users, ignore_conflicts=True)
+                self.user_ids.update(User.objects.filter(username__in=missing).values_list("username", "pk"))
+        return self.user_ids
+
+    def resolve_pieces(self, source_ids):
+        keys = {self.import_key(source_id) for source_id in source_ids}
+        return dict(Piece.objects.filter(import_key__in=keys).values_list("import_key", "pk"))
+
+    def created_at(self, row):
+        value = row.get("created_at")
+        return (parse_datetime(value) if value else None) or timezone.now()
+
+    def copy_media(self, source):
+        if not source or not self.options["media_dir"]:
+            return None
+        with open(os.path.join(self.options["media_dir"], source), "rb") as f:
+            return default_storage.save(os.path.basename(source), File(f))
+
+    def import_user(self, rows):
+        users = [
+            User(username=row["username"], email=row.get("email", ""), password=make_password(None))
+            for row in rows
+        ]
+        User.objects.bulk_create(users, ignore_conflicts=True)
+
+    def import_piece(self, rows):
+        user_ids = self.resolve_users(self.owner(row) for row in rows)
+        files = self.pool.map(self.copy_media, [row.get("uploadedFile") for row in rows])
+        pieces = [
+            Piece(
+                user_id=user_ids[self.owner(row)],
+                title=row["title"][:50],
+                caption=row.get("caption", ""),
+                search_text=search_text(row["title"][:50], row.get("caption", "")),
+                uploadedFile=name,
+                commentAllowance=parse_bool(row.get("commentAllowance", False)),
+                created_at=self.created_at(row),
+                import_key=self.import_key(row["id"]),
+            )
+            for row, name in zip(rows, files)
+        ]
+        Piece.objects.bulk_create(pieces, ignore_conflicts=True)
+
+    def import_targeted(self, model, rows):
+        user_ids = self.resolve_users(self.owner(row) for row in rows)
+        piece_ids = self.resolve_pieces(row["target_id"] for row in rows)
+        objs = []
+        for row in rows:
+            target_id = piece_ids.get(self.import_key(row["target_id"]))
+            if target_id is None:
+                self.skipped += 1
+                continue
+            obj = model(target_id=target_id, user_id=user_ids[self.owner(row)])
+            if model is Comment:
+                obj.content = row["content"]
+                obj.created_at = self.created_at(row)
+            objs.append(obj)
+        if model is Comment:
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+        else:
+            model.objects.bulk_create_sharded(objs, ignore_conflicts=True)
+
+    def import_like(self, rows):
+        self.import_targeted(Like, rows)
+
+    def import_bookmark(self, rows):
+        self.import_targeted(Bookmark, rows)
+
+    def import_comment(self, rows):
+        self.import_targeted(Comment, rows)
+
+    def import_friendship(self, rows):
+        usernames = []
+        for row in rows:
+            usernames += [row.get("following__username") or row.get("following"), row.get("follower__username") or row.get("follower")]
+        user_ids = self.resolve_users(usernames)
+        friendships = [
+            Friendship(following_id=user_ids[following], follower_id=user_ids[follower], created_at=self.created_at(row))
+            for row, following, follower in zip(rows, usernames[::2], usernames[1::2])
+            if following != follower
+        ]
+        Friendship.objects.bulk_create(friendships, ignore_conflicts=True)
+
+    def finalize(self):
+        self.record_touched()
+        rebuilt = rebuild_in_batches(self.touched, self.options["batch_size"])
+        self.stdout.write("Rebuilt %d profile summaries." % rebuilt)
+        enqueue(rebuild_autocomplete)
+        invalidate_search()
+        tagged = backfill(Piece.objects.filter(import_key__isnull=False), index_pieces, self.options["batch_size"])
+        backfill(Comment.objects.filter(target__import_key__isnull=False), index_comments, self.options["batch_size"])
+        self.stdout.write("Extracted tags and mentions from %d pieces." % tagged)
+        if connection.vendor in ("sqlite", "postgresql"):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
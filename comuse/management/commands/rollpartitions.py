@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from comuse.models import Piece, Comment
+from comuse.partitions import month_start, roll_forward
+
+
+class Command(BaseCommand):
+    help = "Move pieces and comments from months that left the hot window into the archive partition."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, default=settings.HOT_PARTITION_MONTHS, help="Whole months kept hot, besides the current one.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = month_start(timezone.now(), options["months"])
+        for model in (Piece, Comment):
+            moved = roll_forward(model, cutoff, options["batch_size"])
+            self.stdout.write("Archived %d %s rows created before %s" % (moved, model._meta.model_name, cutoff.date()))
@@ -0,0 +1,66 @@
+import os
+import random
+import signal
+import sys
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer, get_internal_wsgi_application
+
+from myapp.startup import warm
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the WSGI application from forked workers that share a warmed parent: imports, URL resolvers and compiled "
+        "templates. Requests are handled by Django's development WSGIServer, one at a time per worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("addrport", nargs="?", default="127.0.0.1:8000")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, addrport, workers, **options):
+        host, _, port = addrport.rpartition(":")
+        if not port.isdigit():
+            raise CommandError("%r is not a valid address:port." % addrport)
+        application = get_internal_wsgi_application()
+        stats = warm()
+        server = WSGIServer((host or "127.0.0.1", int(port)), WSGIRequestHandler)
+        server.set_app(application)
+        self.stdout.write("Warmed %d templates in %.0f ms; serving http://%s:%s/ with %d workers" % (
+            stats["templates"], stats["seconds"] * 1000, host or "127.0.0.1", port, workers,
+        ))
+        children = set()
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        try:
+            while True:
+                while not stopping and len(children) < workers:
+                    pid = os.fork()
+                    if pid == 0:
+                        random.seed()
+                        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+                        signal.signal(signal.SIGINT, signal.SIG_IGN)
+                        server.serve_forever()
+                        sys.exit(0)
+                    children.add(pid)
+                if not children:
+                    break
+                try:
+                    pid, _ = os.wait()
+                except ChildProcessError:
+                    break
+                children.discard(pid)
+                if not stopping:
+                    self.stderr.write("Worker %d exited; restarting" % pid)
+        finally:
+            server.server_close()
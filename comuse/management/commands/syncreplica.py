@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto its local replicas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("aliases", nargs="*", help="Replica aliases. Defaults to every alias in DATABASE_REPLICAS.")
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        aliases = options["aliases"] or settings.DATABASE_REPLICAS
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError("%s is not listed in DATABASE_REPLICAS." % alias)
+            replica = connections[alias]
+            if primary.vendor != "sqlite" or replica.vendor != "sqlite":
+                raise CommandError("syncreplica only copies SQLite databases; use the server's own replication for %s." % alias)
+            primary.ensure_connection()
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            self.stdout.write("Synced %s" % alias)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from comuse.audio import np
+from comuse.vectors import vector_store
+
+
+class Command(BaseCommand):
+    help = "Cluster the stored embeddings into inverted lists for approximate similarity search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lists", type=int, help="Number of inverted lists. Defaults to the square root of the vector count.")
+        parser.add_argument("--iterations", type=int, default=10)
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy is required for the vector index.")
+        store = vector_store()
+        if not store.exists():
+            raise CommandError("No embeddings stored yet. Run analyzeaudio first.")
+        clusters = store.train(options["lists"], options["iterations"])
+        self.stdout.write("Trained %d inverted lists over %d vectors." % (clusters, len(store.live_rows())))
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("comuse", "0007_upload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="piece",
+            name="import_key",
+            field=models.CharField(
+                blank=True, editable=False, max_length=100, null=True, unique=True
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.7 on 2026-10-19 13:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comuse", "0009_like_bookmark_without_db_constraints"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="archived",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="piece",
+            name="archived",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                condition=models.Q(("archived", False)),
+                fields=["target", "-created_at", "-id"],
+                name="comment_hot_target_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(fields=["-created_at", "-id"], name="piece_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(
+                condition=models.Q(("archived", False)),
+                fields=["-created_at", "-id"],
+                name="piece_hot_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.7 on 2026-10-19 13:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comuse", "0010_piece_comment_archive_partitions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="piece",
+            name="analyzed_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="piece",
+            name="bpm",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="piece",
+            name="duration",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="piece",
+            name="loudness",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="piece",
+            name="musical_key",
+            field=models.CharField(blank=True, editable=False, max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(fields=["duration"], name="piece_duration_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(fields=["bpm"], name="piece_bpm_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(fields=["loudness"], name="piece_loudness_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(fields=["musical_key", "bpm"], name="piece_key_bpm_idx"),
+        ),
+    ]
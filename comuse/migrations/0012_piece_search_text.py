@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:10
+
+import unicodedata
+
+from django.db import migrations, models
+
+
+def normalize(text):
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def fill_search_text(apps, schema_editor):
+    Piece = apps.get_model("comuse", "Piece")
+    pieces = []
+    for piece in Piece.objects.only("title", "caption").iterator(chunk_size=1000):
+        piece.search_text = "%s\n%s" % (normalize(piece.title), normalize(piece.caption))
+        pieces.append(piece)
+        if len(pieces) == 1000:
+            Piece.objects.bulk_update(pieces, ["search_text"])
+            pieces = []
+    Piece.objects.bulk_update(pieces, ["search_text"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comuse", "0011_piece_audio_analysis"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="piece",
+            name="search_text",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+    ]
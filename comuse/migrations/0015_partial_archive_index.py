@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comuse", "0014_explicit_created_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="piece",
+            name="piece_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="piece",
+            index=models.Index(
+                condition=models.Q(("archived", True)),
+                fields=["-created_at", "-id"],
+                name="piece_archive_created_idx",
+            ),
+        ),
+    ]
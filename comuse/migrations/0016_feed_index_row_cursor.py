@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-19 15:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comuse", "0015_partial_archive_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="mention",
+            name="mention_feed_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="piecetag",
+            name="piece_tag_feed_idx",
+        ),
+        migrations.AddIndex(
+            model_name="mention",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="mention_feed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="piecetag",
+            index=models.Index(
+                fields=["tag", "-created_at", "-id"], name="piece_tag_feed_idx"
+            ),
+        ),
+    ]
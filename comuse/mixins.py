@@ -0,0 +1,138 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import urlencode
+
+from myapp.routers import is_pinned, replica_reads
+from notifications.counters import unread_count
+from .partitions import decode_cursor, encode_cursor
+from .viewer import viewer_state
+
+
+USERS_VERSION_KEY = "users:version"
+ESI_CAPABILITY = "ESI/1.0"
+
+
+def queryset_version(queryset):
+    version = queryset.order_by().aggregate(last=Max("pk"), count=Count("pk"))
+    return version["last"], version["count"]
+
+
+def users_version():
+    version = cache.get(USERS_VERSION_KEY)
+    if version is None:
+        cache.add(USERS_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(USERS_VERSION_KEY)
+    return version
+
+
+def invalidate_users():
+    cache.set(USERS_VERSION_KEY, time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(USERS_VERSION_KEY, time.time_ns(), None))
+
+
+class ConditionalGetMixin:
+    def get_etag_parts(self):
+        raise NotImplementedError
+
+    def get_etag(self):
+        user = self.request.user
+        parts = [
+            user.pk,
+            user.username,
+            unread_count(user.pk) if user.is_authenticated else 0,
+            self.request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+            getattr(staticfiles_storage, "manifest_hash", ""),
+            users_version(),
+            *self.get_etag_parts(),
+        ]
+        return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class EdgeShellMixin:
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.edge_shell = request.user.is_authenticated and ESI_CAPABILITY in request.META.get("HTTP_SURROGATE_CAPABILITY", "")
+
+    def get_viewer_state_params(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        if not self.edge_shell:
+            return super().get(request, *args, **kwargs)
+        self.object = self.get_object()
+        response = self.render_to_response(self.get_context_data(object=self.object))
+        patch_cache_control(response, private=True, no_cache=True)
+        response["Surrogate-Control"] = 'max-age=%d, content="%s"' % (settings.EDGE_SHELL_TIMEOUT, ESI_CAPABILITY)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.edge_shell:
+            context["edge_shell"] = True
+            context["viewer_state_url"] = "%s?%s" % (reverse("comuse:viewer_state"), urlencode(self.get_viewer_state_params()))
+        return context
+
+
+class ReplicaReadMixin:
+    def dispatch(self, request, *args, **kwargs):
+        use_replica = bool(settings.DATABASE_REPLICAS)
+        if use_replica and request.user.is_authenticated:
+            use_replica = not is_pinned(request.user.pk)
+        with replica_reads(use_replica):
+            response = super().dispatch(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)):
+                response.render()
+        return response
+
+
+class KeysetPageMixin:
+    page_size = 30
+
+    def page_state(self, queryset):
+        page = queryset.only("pk", "created_at").keyset_page(self.page_size + 1, decode_cursor(self.request.GET.get("before")))
+        user = self.request.user if self.request.user.is_authenticated else None
+        ids = [piece.pk for piece in page]
+        return ids, viewer_state(user, ids[:self.page_size])
+
+    def page_objects(self, rows):
+        return rows
+
+    def get_context_data(self, **kwargs):
+        page = self.object_list.keyset_page(self.page_size + 1, decode_cursor(self.request.GET.get("before")))
+        items = self.page_objects(page[:self.page_size])
+        kwargs["object_list"] = items
+        kwargs[self.get_context_object_name(self.object_list)] = items
+        kwargs["next_cursor"] = encode_cursor(page[self.page_size - 1]) if len(page) > self.page_size else None
+        return super().get_context_data(**kwargs)
+
+
+class FeedIndexPageMixin(KeysetPageMixin):
+    def page_objects(self, rows):
+        return list(dict.fromkeys(row.piece for row in rows))
+
+
+class ViewerStateListMixin:
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        user = self.request.user if self.request.user.is_authenticated else None
+        state = viewer_state(user, [piece.pk for piece in context["object_list"]])
+        context["user_like_list"] = {pk for pk, values in state.items() if values["is_liked"]}
+        context["user_bookmark_list"] = {pk for pk, values in state.items() if values["is_bookmarked"]}
+        return context
@@ -1,17 +1,40 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.core.files import File
 from django.core.validators import FileExtensionValidator
+from django.utils import timezone
 import os
-import datetime
+import uuid
+
+from .partitions import PartitionedQuerySet
+from .sharding import ShardedManager
 
 
 def up_dir_path(instance, filename):
-    date_time = datetime.datetime.now()
-    date_dir = date_time.strftime('%Y/%m/%d')
-    time_stamp = date_time.strftime('%H%M%S')
-    new_filename = time_stamp + filename
-    dir_path = os.path.join("files", date_dir, new_filename)
-    return dir_path
+    return os.path.join("files", filename)
+
+
+class PieceQuerySet(PartitionedQuerySet):
+    def with_like_counts(self):
+        clone = self._chain()
+        clone._with_like_counts = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._with_like_counts = getattr(self, "_with_like_counts", False)
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if fetched and getattr(self, "_with_like_counts", False):
+            pieces = [piece for piece in self._result_cache if isinstance(piece, Piece)]
+            counts = Like.objects.counts([piece.pk for piece in pieces])
+            for piece in pieces:
+                piece._liked_count = counts.get(piece.pk, 0)
 
 
 class Piece(models.Model):
@@ -19,8 +42,28 @@ class Piece(models.Model):
     title = models.CharField(max_length=50)
     uploadedFile = models.FileField(blank=True, null=True, upload_to=up_dir_path, validators=[FileExtensionValidator(["mp3",])])
     caption = models.TextField(max_length=1000)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     commentAllowance = models.BooleanField(default=False)
+    import_key = models.CharField(max_length=100, blank=True, null=True, unique=True, editable=False)
+    archived = models.BooleanField(default=False, editable=False)
+    duration = models.FloatField(blank=True, null=True, editable=False)
+    loudness = models.FloatField(blank=True, null=True, editable=False)
+    bpm = models.FloatField(blank=True, null=True, editable=False)
+    musical_key = models.CharField(max_length=3, blank=True, editable=False)
+    analyzed_at = models.DateTimeField(blank=True, null=True, editable=False)
+    search_text = models.TextField(blank=True, editable=False)
+
+    objects = PieceQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], condition=models.Q(archived=True), name="piece_archive_created_idx"),
+            models.Index(fields=["-created_at", "-id"], condition=models.Q(archived=False), name="piece_hot_created_idx"),
+            models.Index(fields=["duration"], name="piece_duration_idx"),
+            models.Index(fields=["bpm"], name="piece_bpm_idx"),
+            models.Index(fields=["loudness"], name="piece_loudness_idx"),
+            models.Index(fields=["musical_key", "bpm"], name="piece_key_bpm_idx"),
+        ]
 
     def __str__(self):
         return self.caption
@@ -28,10 +71,18 @@ class Piece(models.Model):
     def __str__(self):
         return self.title
 
+    @property
+    def liked_count(self):
+        if not hasattr(self, "_liked_count"):
+            self._liked_count = Like.objects.for_target(self.pk).count()
+        return self._liked_count
+
 
 class Like(models.Model):
-    target = models.ForeignKey(Piece, related_name="likes", on_delete=models.CASCADE)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="likes", on_delete=models.CASCADE)
+    target = models.ForeignKey(Piece, related_name="likes", on_delete=models.CASCADE, db_constraint=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="likes", on_delete=models.CASCADE, db_constraint=False)
+
+    objects = ShardedManager()
 
     class Meta:
         constraints = [
@@ -40,8 +91,10 @@ class Like(models.Model):
 
 
 class Bookmark(models.Model):
-    target = models.ForeignKey(Piece, related_name="bookmarks", on_delete=models.CASCADE)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="bookmarks", on_delete=models.CASCADE)
+    target = models.ForeignKey(Piece, related_name="bookmarks", on_delete=models.CASCADE, db_constraint=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="bookmarks", on_delete=models.CASCADE, db_constraint=False)
+
+    objects = ShardedManager()
 
     class Meta:
         constraints = [
@@ -53,7 +106,92 @@ class Comment(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField(max_length=400)
     target = models.ForeignKey(Piece, related_name="comments", on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    archived = models.BooleanField(default=False, editable=False)
+
+    objects = PartitionedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["target", "-created_at", "-id"], condition=models.Q(archived=False), name="comment_hot_target_idx"),
+        ]
 
     def __str__(self):
         return self.content
+
+
+class FeedIndexQuerySet(models.QuerySet):
+    def keyset_page(self, size, before=None):
+        queryset = self.filter(piece__user__is_active=True).order_by("-created_at", "-pk")
+        if before is not None:
+            created_at, pk = before
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset[:size])
+        found = Piece.objects.select_related("user").with_like_counts().in_bulk({row.piece_id for row in rows})
+        rows = [row for row in rows if row.piece_id in found]
+        for row in rows:
+            row.piece = found[row.piece_id]
+        return rows
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class PieceTag(models.Model):
+    piece = models.ForeignKey(Piece, related_name="piece_tags", on_delete=models.CASCADE)
+    tag = models.ForeignKey(Tag, related_name="piece_tags", on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    objects = FeedIndexQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tag", "piece"], name="piece_tag_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["tag", "-created_at", "-id"], name="piece_tag_feed_idx"),
+        ]
+
+
+class Mention(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="mentions", on_delete=models.CASCADE)
+    piece = models.ForeignKey(Piece, related_name="mentions", on_delete=models.CASCADE)
+    comment = models.ForeignKey(Comment, related_name="mentions", blank=True, null=True, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    objects = FeedIndexQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "piece"], condition=Q(comment__isnull=True), name="mention_caption_unique"),
+            models.UniqueConstraint(fields=["user", "comment"], name="mention_comment_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-id"], name="mention_feed_idx"),
+        ]
+
+
+class Upload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="uploads", on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    length = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
+    def clean(self):
+        try:
+            FileExtensionValidator(["mp3",])(File(None, name=self.filename))
+        except ValidationError as e:
+            raise ValidationError({"filename": e.messages})
+
+    @property
+    def is_complete(self):
+        return self.offset == self.length
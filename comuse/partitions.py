@@ -0,0 +1,53 @@
+import datetime
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def encode_cursor(obj, field="created_at"):
+    return "%d_%d" % ((getattr(obj, field) - EPOCH) // MICROSECOND, obj.pk)
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = (int(part) for part in cursor.split("_"))
+    except (AttributeError, ValueError):
+        return None
+    return EPOCH + micros * MICROSECOND, pk
+
+
+def month_start(moment, months_back=0):
+    moment = timezone.localtime(moment)
+    month = moment.year * 12 + moment.month - 1 - months_back
+    return moment.replace(year=month // 12, month=month % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class PartitionedQuerySet(models.QuerySet):
+    def hot(self):
+        return self.filter(archived=False)
+
+    def archive(self):
+        return self.filter(archived=True)
+
+    def keyset_page(self, size, before=None):
+        queryset = self.order_by("-created_at", "-pk")
+        if before is not None:
+            created_at, pk = before
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+        rows = list(queryset.hot()[:size])
+        if len(rows) < size:
+            rows += list(queryset.archive()[:size - len(rows)])
+        return rows
+
+
+def roll_forward(model, cutoff, batch_size):
+    moved = 0
+    while True:
+        ids = list(model.objects.hot().filter(created_at__lt=cutoff).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return moved
+        moved += model.objects.filter(pk__in=ids).update(archived=True)
@@ -0,0 +1,106 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.http import JsonResponse
+from django.shortcuts import render
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+THROTTLED_MESSAGE = "リクエストが多すぎます。しばらくしてから再度お試しください。"
+
+
+def parse_rate(rate):
+    count, period = rate.split("/")
+    multiplier = period[:-1] or "1"
+    return int(count), int(multiplier) * PERIODS[period[-1]]
+
+
+class TokenBucket:
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (limit, now))
+            tokens = min(limit, tokens + (now - updated) * limit / period)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, 0 if allowed else math.ceil((1 - tokens) * period / limit)
+
+
+class SlidingWindow:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def usable(self):
+        return self.alias in settings.CACHES and not isinstance(caches[self.alias], BaseDatabaseCache)
+
+    def hit(self, key, limit, period):
+        cache = caches[self.alias]
+        now = time.time()
+        window, elapsed = divmod(now, period)
+        current_key = "ratelimit:%s:%d" % (key, window)
+        previous = cache.get("ratelimit:%s:%d" % (key, window - 1), 0)
+        if cache.add(current_key, 1, period * 2):
+            current = 1
+        else:
+            current = cache.incr(current_key)
+        allowed = previous * (period - elapsed) / period + current <= limit
+        return allowed, 0 if allowed else math.ceil(period - elapsed)
+
+
+class RateLimiter:
+    def __init__(self, alias="default"):
+        self.shared = SlidingWindow(alias)
+        self.local = TokenBucket()
+
+    def hit(self, scope, ident, rate):
+        limit, period = parse_rate(rate)
+        key = "%s:%s" % (scope, ident)
+        if self.shared.usable():
+            try:
+                return self.shared.hit(key, limit, period)
+            except Exception:
+                pass
+        return self.local.hit(key, limit, period)
+
+
+limiter = RateLimiter(getattr(settings, "RATELIMIT_CACHE", "default"))
+
+
+def client_ident(request):
+    if request.user.is_authenticated:
+        return "user:%s" % request.user.pk
+    return "ip:%s" % request.META.get("REMOTE_ADDR", "")
+
+
+class RateLimitMixin:
+    ratelimit_scope = None
+    ratelimit_methods = ("POST",)
+    ratelimit_json = False
+
+    def dispatch(self, request, *args, **kwargs):
+        rate = settings.RATELIMITS.get(self.ratelimit_scope)
+        if rate and request.method in self.ratelimit_methods:
+            allowed, retry_after = limiter.hit(self.ratelimit_scope, client_ident(request), rate)
+            if not allowed:
+                response = self.throttled(request)
+                response["Retry-After"] = str(retry_after)
+                return response
+        return super().dispatch(request, *args, **kwargs)
+
+    def throttled(self, request):
+        if self.ratelimit_json:
+            return JsonResponse({"error": THROTTLED_MESSAGE}, status=429)
+        return render(request, "429.html", {"message": THROTTLED_MESSAGE}, status=429)
@@ -0,0 +1,75 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import StrIndex
+from django.db.models.lookups import LessThan
+
+from .autocomplete import normalize
+from .models import Piece
+
+VERSION_KEY = "search:version"
+
+
+def search_text(title, caption):
+    return "%s\n%s" % (normalize(title), normalize(caption))
+
+
+def search_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_search():
+    cache.set(VERSION_KEY, time.time_ns(), None)
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time_ns(), None))
+
+
+def search_queryset(query, filter_form=None):
+    queryset = Piece.objects.filter(user__is_active=True)
+    if query:
+        in_title = LessThan(StrIndex("search_text", Value(query)), StrIndex("search_text", Value("\n")))
+        queryset = queryset.filter(search_text__contains=query).annotate(
+            title_match=Case(When(in_title, then=Value(1)), default=Value(0), output_field=IntegerField())
+        ).order_by("-title_match", "-created_at", "-pk")
+    else:
+        queryset = queryset.order_by("-created_at", "-pk")
+    if filter_form is not None:
+        queryset = filter_form.filter(queryset)
+    return queryset
+
+
+def ranked_rows(queryset, query):
+    if query:
+        return list(queryset.values_list("pk", "title_match")[:settings.SEARCH_CACHE_MAX_RESULTS])
+    return [(pk, 0) for pk in queryset.values_list("pk", flat=True)[:settings.SEARCH_CACHE_MAX_RESULTS]]
+
+
+def merge_newer(rows, titles, ids):
+    newer = [pk for pk, title_match in rows if title_match]
+    ids = newer + ids[:titles] + [pk for pk, title_match in rows if not title_match] + ids[titles:]
+    return list(dict.fromkeys(ids))[:settings.SEARCH_CACHE_MAX_RESULTS]
+
+
+def ranked_ids(query, filter_form):
+    query = normalize(query or "")
+    filters = filter_form.cleaned_data if filter_form.has_filters() else {}
+    digest = hashlib.sha1(repr((query, sorted(filters.items()))).encode()).hexdigest()
+    key = "search:%s:%s" % (search_version(), digest)
+    queryset = search_queryset(query, filter_form if filters else None)
+    cached = cache.get(key)
+    if cached is None:
+        last = Piece.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+        rows = ranked_rows(queryset, query)
+        cached = last, sum(1 for _, title_match in rows if title_match), [pk for pk, _ in rows]
+        cache.set(key, cached, settings.SEARCH_CACHE_TIMEOUT)
+    last, titles, ids = cached
+    if Piece.objects.filter(pk__gt=last).exists():
+        return merge_newer(ranked_rows(queryset.filter(pk__gt=last), query), titles, ids)
+    return ids
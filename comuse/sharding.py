@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import Count
+
+SHARDED_MODELS = {("comuse", "like"), ("comuse", "bookmark")}
+
+
+def shard_alias(alias):
+    return None if alias == DEFAULT_DB_ALIAS else alias
+
+
+def shard_aliases():
+    return [shard_alias(alias) for alias in settings.ENGAGEMENT_SHARDS]
+
+
+def shard_for(target_id):
+    aliases = settings.ENGAGEMENT_SHARDS
+    return shard_alias(aliases[int(target_id) % len(aliases)])
+
+
+def group_by_shard(target_ids):
+    groups = defaultdict(list)
+    for target_id in target_ids:
+        groups[shard_for(target_id)].append(target_id)
+    return groups
+
+
+def is_sharded(model):
+    return (model._meta.app_label, model._meta.model_name) in SHARDED_MODELS
+
+
+class ShardedManager(models.Manager):
+    def for_target(self, target_id):
+        return self.using(shard_for(target_id)).filter(target_id=target_id)
+
+    def scatter(self, **filters):
+        return [self.using(alias).filter(**filters) for alias in shard_aliases()]
+
+    def gather(self, target_ids, **filters):
+        return [self.using(alias).filter(target_id__in=ids, **filters) for alias, ids in group_by_shard(target_ids).items()]
+
+    def target_ids(self, **filters):
+        found = set()
+        for queryset in self.scatter(**filters):
+            found.update(queryset.values_list("target_id", flat=True))
+        return found
+
+    def counts(self, target_ids):
+        counts = {}
+        for queryset in self.gather(target_ids):
+            counts.update(queryset.order_by().values_list("target_id").annotate(n=Count("pk")))
+        return counts
+
+    def bulk_create_sharded(self, objs, **kwargs):
+        groups = defaultdict(list)
+        for obj in objs:
+            groups[shard_for(obj.target_id)].append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(group, **kwargs)
+
+
+class EngagementShardRouter:
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if is_sharded(model) and isinstance(instance, model) and instance.target_id is not None:
+            return shard_for(instance.target_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(obj1) or is_sharded(obj2):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if (app_label, model_name) in SHARDED_MODELS:
+            return True if db in settings.ENGAGEMENT_SHARDS else None
+        if db in settings.ENGAGEMENT_SHARDS and db != DEFAULT_DB_ALIAS:
+            return False
+        return None
@@ -0,0 +1,77 @@
+import functools
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .forms import CommentForm
+
+
+def version_key(piece_id):
+    return "detail-shell:version:%s" % piece_id
+
+
+def shell_version(piece_id):
+    key = version_key(piece_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+COMMENT_ACTIONS = re.compile(r"<!--comment-actions:(\d+):(\d+)-->")
+
+
+def invalidate_shell(*piece_ids):
+    def bump():
+        version = time.time_ns()
+        cache.set_many({version_key(piece_id): version for piece_id in piece_ids}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def render_fragments(piece, comment_page):
+    comment_list, next_comment_cursor = comment_page()
+    context = {"piece": piece, "comment_list": comment_list, "next_comment_cursor": next_comment_cursor}
+    return {
+        "piece": render_to_string("comuse/detail_piece.html", context),
+        "comments": render_to_string("comuse/detail_comments.html", context),
+    }
+
+
+def render_shell(piece, comment_page):
+    key = "detail-shell:%s:%s" % (piece.pk, shell_version(piece.pk))
+    shell = cache.get(key)
+    if shell is None:
+        shell = render_fragments(piece, comment_page)
+        cache.set(key, shell, settings.DETAIL_SHELL_TIMEOUT)
+    return shell
+
+
+def punch_comment_actions(comments, piece, user=None):
+    def action(match):
+        comment_id, author_id = match.groups()
+        if user is not None and int(author_id) != user.pk:
+            return ""
+        link = format_html(
+            '...<a href="{}" style="font-size: 2rem;"><i class="bi bi-trash-fill"></i>コメントを削除</a>',
+            reverse("comuse:deleteComment", args=[piece.pk, comment_id]),
+        )
+        if user is None:
+            return format_html('<span data-owner="{}" hidden>{}</span>', author_id, link)
+        return link
+
+    return mark_safe(COMMENT_ACTIONS.sub(action, comments))
+
+
+@functools.cache
+def comment_field():
+    return str(CommentForm()["content"])
@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from jobs.models import Job
+from jobs.queue import enqueue
+from .audio import np
+from .autocomplete import PIECE, USER, autocomplete_index, piece_entries, user_entries
+from .hashtags import index_comments, index_pieces
+from .mixins import invalidate_users
+from .models import Piece, Like, Bookmark, Comment, Upload
+from .search import invalidate_search, search_text
+from .sharding import shard_aliases, shard_for
+from .shells import invalidate_shell
+from .tasks import analyze_piece, delete_file, expire_uploads, rebuild_autocomplete
+from .vectors import vector_store
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Piece)
+def remember_replaced_file(sender, instance, **kwargs):
+    instance._replaced_file = None
+    instance._file_changed = instance._title_changed = instance._caption_changed = instance.pk is None
+    if instance.pk is None:
+        return
+    previous, title, caption = Piece.objects.filter(pk=instance.pk).values_list("uploadedFile", "title", "caption").first() or (None, None, None)
+    instance._title_changed = title != instance.title
+    instance._caption_changed = caption != instance.caption
+    if (previous or "") != (instance.uploadedFile.name or ""):
+        instance._replaced_file = previous or None
+        instance._file_changed = True
+        instance.duration = instance.loudness = instance.bpm = instance.analyzed_at = None
+        instance.musical_key = ""
+
+
+@receiver(pre_save, sender=Piece)
+def fill_search_text(sender, instance, **kwargs):
+    instance.search_text = search_text(instance.title, instance.caption)
+
+
+@receiver(post_save, sender=Piece)
+def index_caption(sender, instance, created, raw=False, **kwargs):
+    if getattr(instance, "_caption_changed", False) and not raw:
+        index_pieces([instance], created=created)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_mentions(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        index_comments([instance])
+
+
+@receiver(post_save, sender=Piece)
+def delete_replaced_file(sender, instance, **kwargs):
+    if getattr(instance, "_replaced_file", None):
+        enqueue(delete_file, [instance._replaced_file])
+
+
+@receiver(post_save, sender=Piece)
+def analyze_uploaded_file(sender, instance, raw=False, **kwargs):
+    if instance.uploadedFile and not raw and getattr(instance, "_file_changed", False):
+        enqueue(analyze_piece, [instance.pk])
+
+
+@receiver(post_save, sender=Upload)
+def schedule_upload_expiry(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and not Job.objects.filter(name=expire_uploads.job_name, status=Job.QUEUED).exists():
+        enqueue(expire_uploads, delay=settings.UPLOAD_EXPIRE_AFTER)
+
+
+@receiver(post_delete, sender=Piece)
+def delete_piece_file(sender, instance, **kwargs):
+    if instance.uploadedFile:
+        enqueue(delete_file, [instance.uploadedFile.name])
+
+
+@receiver(post_delete, sender=Piece)
+def delete_piece_embedding(sender, instance, **kwargs):
+    if np is not None:
+        pk = instance.pk
+        transaction.on_commit(lambda: vector_store().remove(pk))
+
+
+@receiver(post_delete, sender=Piece)
+def delete_sharded_engagement(sender, instance, **kwargs):
+    if shard_for(instance.pk) is not None:
+        for model in (Like, Bookmark):
+            model.objects.for_target(instance.pk)._raw_delete(shard_for(instance.pk))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_engagement(sender, instance, **kwargs):
+    for alias in shard_aliases():
+        if alias is not None:
+            for model in (Like, Bookmark):
+                model.objects.using(alias).filter(user_id=instance.pk)._raw_delete(alias)
+
+
+@receiver(post_save, sender=Piece)
+@receiver(post_delete, sender=Piece)
+def invalidate_piece_shell(sender, instance, **kwargs):
+    invalidate_shell(instance.pk)
+
+
+@receiver(post_save, sender=Piece)
+def invalidate_edited_piece_search(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        invalidate_search()
+
+
+@receiver(post_delete, sender=Piece)
+def invalidate_deleted_piece_search(sender, instance, **kwargs):
+    invalidate_search()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_shell(sender, instance, **kwargs):
+    invalidate_shell(instance.target_id)
+
+
+def update_autocomplete(changes):
+    if autocomplete_index().apply(changes) and not Job.objects.filter(name=rebuild_autocomplete.job_name, status=Job.QUEUED).exists():
+        enqueue(rebuild_autocomplete)
+
+
+def index_user(user_id, pieces):
+    changes = list(user_entries(User.objects.filter(pk=user_id, is_active=True)))
+    if not changes:
+        changes = [(USER, user_id, None, 0)]
+        changes += [(PIECE, pk, None, 0) for pk in Piece.objects.filter(user_id=user_id).values_list("pk", flat=True)]
+    elif pieces:
+        changes += piece_entries(Piece.objects.filter(user_id=user_id))
+    update_autocomplete(changes)
+
+
+@receiver(post_save, sender=Piece)
+def index_piece_title(sender, instance, created, raw=False, **kwargs):
+    if getattr(instance, "_title_changed", False) and not raw:
+        transaction.on_commit(lambda: update_autocomplete([(PIECE, instance.pk, instance.title, 0 if created else instance.liked_count)]))
+
+
+@receiver(post_delete, sender=Piece)
+def unindex_piece(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: update_autocomplete([(PIECE, pk, None, 0)]))
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_indexed_username(sender, instance, update_fields=None, **kwargs):
+    instance._username_changed = instance._activation_changed = False
+    if instance.pk is None or update_fields is not None and not {"username", "is_active"} & set(update_fields):
+        return
+    username, is_active = User.objects.filter(pk=instance.pk).values_list("username", "is_active").first() or (None, None)
+    instance._username_changed = username != instance.username
+    instance._activation_changed = is_active != instance.is_active
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def index_username(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance._username_changed or instance._activation_changed:
+        pieces = instance._activation_changed
+        transaction.on_commit(lambda: index_user(instance.pk, pieces))
+    if instance._username_changed or instance._activation_changed:
+        invalidate_users()
+        piece_ids = set(Piece.objects.filter(user=instance).values_list("pk", flat=True))
+        piece_ids.update(Comment.objects.filter(user=instance).values_list("target_id", flat=True))
+        invalidate_shell(*piece_ids)
+    if instance._activation_changed:
+        invalidate_search()
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def unindex_user(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: update_autocomplete([(USER, pk, None, 0)]))
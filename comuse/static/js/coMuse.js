@@ -0,0 +1,132 @@
+const csrfToken = () => document.querySelector('meta[name="csrf-token"]').content
+
+const renderLike = (LikeBtn, isLiked) => {
+    LikeBtn.innerHTML = isLiked ? '<i class="bi bi-heart-fill"></i>' : '<i class="bi bi-heart"></i>'
+    LikeBtn.dataset.isLiked = isLiked ? 'true' : 'false'
+    const likeText = document.querySelector("#liketxt_" + LikeBtn.dataset.pk)
+    likeText.innerHTML = isLiked ? 'いいね解除' : 'いいね！';
+}
+
+const renderBookmark = (BookmarkBtn, isBookmarked) => {
+    BookmarkBtn.innerHTML = isBookmarked ? '<i class="bi bi-bookmark-fill"></i>' : '<i class="bi bi-bookmark"></i>'
+    BookmarkBtn.dataset.isBookmarked = isBookmarked ? 'true' : 'false'
+    const bmText = document.querySelector("#bmtxt_" + BookmarkBtn.dataset.pk)
+    bmText.innerHTML = isBookmarked ? 'ブックマーク解除' : 'ブックマーク';
+}
+
+for (const LikeBtn of document.getElementsByClassName('likebtn')) {
+
+    LikeBtn.addEventListener('click',
+        async () => {
+            const isLiked = LikeBtn.dataset.isLiked === 'true'
+            const response = await fetch(
+                `/comuse/${LikeBtn.dataset.pk}/${isLiked ? 'unlike' : 'like'}/`,
+                { method: 'POST', headers: { 'X-CSRFToken': csrfToken() } },
+            )
+            const data = await response.json()
+            renderLike(LikeBtn, !isLiked)
+            const LikeDisplay = document.querySelector("#count_" + LikeBtn.dataset.pk)
+            LikeDisplay.innerHTML = String(data.liked_count)
+        }
+    )
+}
+
+for (const BookmarkBtn of document.getElementsByClassName('bmbtn')) {
+
+    BookmarkBtn.addEventListener('click',
+        async () => {
+            const isBookmarked = BookmarkBtn.dataset.isBookmarked === 'true'
+            await fetch(
+                `/comuse/${BookmarkBtn.dataset.pk}/${isBookmarked ? 'deletebookmark' : 'bookmark'}/`,
+                { method: 'POST', headers: { 'X-CSRFToken': csrfToken() } },
+            )
+            renderBookmark(BookmarkBtn, !isBookmarked)
+        }
+    )
+}
+
+const commentButton = document.getElementById("comment_button");
+const commentFormContainer = document.getElementById("comment_form_container");
+
+if (commentButton && commentFormContainer) {
+    commentButton.addEventListener("click", function () {
+        if (commentFormContainer.style.display === "none" || commentFormContainer.style.display === "") {
+            commentFormContainer.style.display = "block";
+            commentButton.textContent = "非表示";
+        } else {
+            commentFormContainer.style.display = "none";
+            commentButton.textContent = "投稿";
+        }
+    });
+}
+
+const hydrateViewerState = (state) => {
+    document.querySelector('meta[name="csrf-token"]').content = state.viewer.csrf_token
+    for (const form of document.querySelectorAll('form[method="post" i]')) {
+        const input = document.createElement('input')
+        input.type = 'hidden'
+        input.name = 'csrfmiddlewaretoken'
+        input.value = state.viewer.csrf_token
+        form.append(input)
+    }
+    for (const link of document.querySelectorAll('[data-viewer-link]')) {
+        link.href = state.viewer.links[link.dataset.viewerLink]
+    }
+    const unread = document.querySelector('[data-viewer-unread]')
+    if (unread && state.viewer.unread_notification_count) {
+        unread.textContent = `(${state.viewer.unread_notification_count})`
+    }
+    for (const owned of document.querySelectorAll('[data-owner]')) {
+        owned.hidden = Number(owned.dataset.owner) !== state.viewer.id
+    }
+    for (const LikeBtn of document.getElementsByClassName('likebtn')) {
+        const piece = state.pieces[LikeBtn.dataset.pk]
+        renderLike(LikeBtn, piece.is_liked)
+        document.querySelector("#count_" + LikeBtn.dataset.pk).innerHTML = String(piece.liked_count)
+    }
+    for (const BookmarkBtn of document.getElementsByClassName('bmbtn')) {
+        renderBookmark(BookmarkBtn, state.pieces[BookmarkBtn.dataset.pk].is_bookmarked)
+    }
+}
+
+const viewerState = document.getElementById('viewer-state')
+
+if (viewerState) {
+    hydrateViewerState(JSON.parse(viewerState.textContent))
+}
+
+const searchInput = document.querySelector('.searchbar input[name="q"]')
+const suggestions = document.querySelector('.searchbar .suggestions')
+
+if (searchInput && suggestions) {
+    let pending = null
+    searchInput.addEventListener('input', () => {
+        clearTimeout(pending)
+        pending = setTimeout(async () => {
+            const query = searchInput.value.trim()
+            if (!query) {
+                suggestions.hidden = true
+                return
+            }
+            const response = await fetch(`${searchInput.dataset.autocompleteUrl}?q=${encodeURIComponent(query)}`)
+            if (!response.ok || searchInput.value.trim() !== query) {
+                return
+            }
+            const data = await response.json()
+            suggestions.replaceChildren(...data.results.map((result) => {
+                const item = document.createElement('li')
+                const link = document.createElement('a')
+                link.href = result.url
+                link.textContent = result.kind === 'user' ? '@' + result.label : result.label
+                item.append(link)
+                return item
+            }))
+            suggestions.hidden = !data.results.length
+        }, 100)
+    })
+    document.addEventListener('click', (event) => {
+        if (!event.target.closest('.searchbar')) {
+            suggestions.hidden = true
+        }
+    })
+}
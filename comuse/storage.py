@@ -0,0 +1,271 @@
+import errno
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+from django.views.static import serve
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+OBJECT_PREFIX = "objects"
+CHUNK_SIZE = 64 * 1024
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".woff")
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{12}\.[^/]+$")
+
+
+def object_name(digest, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    return posixpath.join(OBJECT_PREFIX, digest[:2], digest[2:4], digest + ext)
+
+
+class LocalObjectBackend:
+    def __init__(self, location=None, base_url=None, staging_location=None):
+        self._location = location
+        self._base_url = base_url
+        self._staging_location = staging_location
+
+    @property
+    def location(self):
+        return os.path.abspath(self._location or settings.MEDIA_ROOT)
+
+    @property
+    def base_url(self):
+        return self._base_url or settings.MEDIA_URL
+
+    def path(self, name):
+        return os.path.join(self.location, *name.split("/"))
+
+    def staging_dir(self):
+        staging = os.path.abspath(self._staging_location or settings.UPLOAD_STAGING_ROOT)
+        os.makedirs(staging, exist_ok=True)
+        return staging
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def open(self, name, mode="rb"):
+        return File(open(self.path(name), mode))
+
+    def put(self, source_path, name, content_type=None):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            self.copy_into_place(source_path, path)
+
+    def copy_into_place(self, source_path, path):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as tmp, open(source_path, "rb") as source:
+                shutil.copyfileobj(source, tmp, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        os.remove(source_path)
+
+    def delete(self, name):
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def size(self, name):
+        return os.path.getsize(self.path(name))
+
+    def url(self, name):
+        return self.base_url + name
+
+
+class S3ObjectBackend:
+    def __init__(self, bucket, endpoint_url=None, base_url=None, **client_options):
+        import boto3
+
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, **client_options)
+        self.base_url = base_url or "%s/%s/" % ((endpoint_url or "").rstrip("/"), bucket)
+
+    def staging_dir(self):
+        return tempfile.gettempdir()
+
+    def exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+        except self.client.exceptions.ClientError:
+            return False
+        return True
+
+    def open(self, name, mode="rb"):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)["Body"]
+        return File(body, name=name)
+
+    def put(self, source_path, name, content_type=None):
+        extra = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+        if content_type:
+            extra["ContentType"] = content_type
+        try:
+            self.client.upload_file(source_path, self.bucket, name, ExtraArgs=extra)
+        finally:
+            os.remove(source_path)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket, Key=name)["ContentLength"]
+
+    def url(self, name):
+        return self.base_url + name
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    def __init__(self, backend="comuse.storage.LocalObjectBackend", backend_options=None, **kwargs):
+        self.backend_path = backend
+        self.backend_options = dict(backend_options or {}, **kwargs)
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = import_string(self.backend_path)(**self.backend_options)
+        return self._backend
+
+    def _open(self, name, mode="rb"):
+        return self.backend.open(name, mode)
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.backend.staging_dir())
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            return self._commit(tmp_path, object_name(digest.hexdigest(), name), getattr(content, "content_type", None))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, tmp_path, name, content_type=None):
+        if self.backend.exists(name):
+            os.remove(tmp_path)
+        else:
+            self.backend.put(tmp_path, name, content_type)
+        return name
+
+    def staging_path(self, key):
+        return os.path.join(self.backend.staging_dir(), key)
+
+    def discard_staged(self, key):
+        try:
+            os.remove(self.staging_path(key))
+        except FileNotFoundError:
+            pass
+
+    def staged_keys(self):
+        return os.listdir(self.backend.staging_dir())
+
+    def save_staged(self, path, filename, content_type=None):
+        digest = hashlib.sha256()
+        with open(path, "rb") as staged:
+            for chunk in iter(lambda: staged.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self._commit(path, object_name(digest.hexdigest(), filename), content_type)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def is_referenced(self, name):
+        Piece = apps.get_model("comuse", "Piece")
+        return Piece.objects.filter(uploadedFile=name).exists()
+
+    def delete(self, name):
+        if name and not self.is_referenced(name):
+            self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def path(self, name):
+        if not hasattr(self.backend, "path"):
+            return super().path(name)
+        return self.backend.path(name)
+
+
+def serve_immutable(request, path, document_root=None, show_indexes=False):
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if path.startswith(OBJECT_PREFIX + "/"):
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if not dry_run:
+            for hashed_name in sorted(hashed_names):
+                if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                    self.compress(hashed_name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, "rb") as f:
+            data = f.read()
+        encoded = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoded.append((".br", brotli.compress(data)))
+        for suffix, compressed in encoded:
+            if len(compressed) < len(data):
+                with open(path + suffix, "wb") as f:
+                    f.write(compressed)
+
+
+def serve_compressed(request, path, document_root=None):
+    accepted = request.headers.get("Accept-Encoding", "")
+    for suffix, encoding in ((".br", "br"), (".gz", "gzip")):
+        full_path = os.path.join(document_root, path + suffix)
+        if encoding in accepted and os.path.isfile(full_path):
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            response = serve(request, path + suffix, document_root=document_root)
+            if response.status_code == 200:
+                response["Content-Type"] = content_type
+                response["Content-Encoding"] = encoding
+            break
+    else:
+        response = serve(request, path, document_root=document_root)
+    response["Vary"] = "Accept-Encoding"
+    if HASHED_NAME_RE.search(path):
+        response["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,66 @@
+import datetime
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from jobs.queue import enqueue, task
+from .audio import ANALYSIS_FIELDS, analyze, np
+from .autocomplete import autocomplete_index
+from .models import Piece, Upload
+from .vectors import vector_store
+
+
+@task(priority=-5)
+def delete_file(name):
+    default_storage.delete(name)
+
+
+def is_upload_key(key):
+    try:
+        uuid.UUID(key)
+    except ValueError:
+        return False
+    return True
+
+
+@task(priority=-5)
+def expire_uploads():
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.UPLOAD_EXPIRE_AFTER)
+    expired = [str(pk) for pk in Upload.objects.filter(created_at__lt=cutoff).values_list("pk", flat=True)]
+    for key in expired:
+        default_storage.discard_staged(key)
+    Upload.objects.filter(pk__in=expired).delete()
+    keys = [key for key in default_storage.staged_keys() if is_upload_key(key)]
+    live = {str(pk) for pk in Upload.objects.filter(pk__in=keys).values_list("pk", flat=True)}
+    for key in set(keys) - live:
+        default_storage.discard_staged(key)
+    if Upload.objects.exists():
+        enqueue(expire_uploads, delay=settings.UPLOAD_EXPIRE_AFTER)
+    return len(expired)
+
+
+def known_analysis(name):
+    known = Piece.objects.filter(uploadedFile=name, analyzed_at__isnull=False).values("pk", *ANALYSIS_FIELDS).first()
+    if known is not None:
+        known["embedding"] = vector_store().get(known.pop("pk"))
+    return known
+
+
+@task(priority=-1, max_attempts=2, timeout=600)
+def analyze_piece(piece_id):
+    name = Piece.objects.filter(pk=piece_id).values_list("uploadedFile", flat=True).first()
+    if not name or np is None:
+        return
+    result = known_analysis(name) or analyze(name)
+    embedding = result.pop("embedding")
+    if not Piece.objects.filter(pk=piece_id, uploadedFile=name).update(analyzed_at=timezone.now(), **result):
+        return
+    if embedding is not None:
+        vector_store().add(piece_id, embedding)
+
+
+@task(priority=-3, max_attempts=2, timeout=1800)
+def rebuild_autocomplete():
+    autocomplete_index().rebuild()
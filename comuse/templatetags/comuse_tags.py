@@ -0,0 +1,126 @@
+import re
+from urllib.parse import quote
+
+from django import template
+from django.urls import get_resolver, get_script_prefix, reverse
+from django.urls.converters import IntConverter, SlugConverter, StringConverter
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+from django.utils.http import RFC3986_SUBDELIMS
+
+from comuse.hashtags import MENTION_PATTERN, TAG_PATTERN, tag_name
+
+register = template.Library()
+
+URL_SENTINEL = "9876543210"
+URL_SAFE_CHARS = RFC3986_SUBDELIMS + "~:@"
+FAST_CONVERTERS = (IntConverter, SlugConverter, StringConverter)
+_url_templates = {}
+
+
+def route_params(viewname):
+    resolver = get_resolver()
+    *namespaces, name = viewname.split(":")
+    converters = {}
+    for namespace in namespaces:
+        _, resolver = resolver.namespace_dict[namespace]
+        converters.update(resolver.pattern.converters)
+    (bits, _, _, route_converters), = resolver.reverse_dict.getlist(name)
+    (_, params), = bits
+    converters.update(route_converters)
+    return [(param, converters.get(param)) for param in params]
+
+
+def url_template(viewname, nargs, names):
+    try:
+        params = route_params(viewname)
+    except (KeyError, ValueError):
+        return None
+    if (nargs and (names or nargs != len(params))) or (not nargs and sorted(names) != sorted(p for p, _ in params)):
+        return None
+    if not all(isinstance(converter, FAST_CONVERTERS) for _, converter in params):
+        return None
+    url = reverse(viewname, kwargs={param: URL_SENTINEL + str(i) for i, (param, _) in enumerate(params)}).replace("%", "%%")
+    for i, (param, _) in enumerate(params):
+        url = url.replace(URL_SENTINEL + str(i), "%%(%s)s" % param, 1)
+    return url, params
+
+
+def fast_reverse(viewname, *args, **kwargs):
+    key = (viewname, len(args), tuple(sorted(kwargs)), get_script_prefix())
+    if key not in _url_templates:
+        _url_templates[key] = url_template(viewname, len(args), tuple(kwargs))
+    template = _url_templates[key]
+    if template is None:
+        return reverse(viewname, args=args or None, kwargs=kwargs or None)
+    url, params = template
+    values = args or [kwargs[param] for param, _ in params]
+    parts = {}
+    for (param, converter), value in zip(params, values):
+        value = str(value)
+        if not re.fullmatch(converter.regex, value):
+            return reverse(viewname, args=args or None, kwargs=kwargs or None)
+        parts[param] = quote(value, safe=URL_SAFE_CHARS)
+    return url % parts
+
+
+@register.simple_tag
+def fast_url(viewname, *args, **kwargs):
+    return fast_reverse(viewname, *args, **kwargs)
+
+
+def link_tag(match):
+    name = tag_name(match.group(1))
+    if name is None:
+        return match.group(0)
+    return format_html('<a href="{}">{}</a>', fast_reverse("comuse:tag", name=name), match.group(0))
+
+
+def link_mention(match):
+    username = match.group(1).rstrip(".")
+    link = format_html('<a href="{}">{}</a>', fast_reverse("registration:user_profile", username=username), match.group(0)[:len(username) + 1])
+    return link + match.group(0)[len(username) + 1:]
+
+
+@register.filter(needs_autoescape=True)
+def linkify(text, autoescape=True):
+    text = conditional_escape(text) if autoescape else text
+    return mark_safe(MENTION_PATTERN.sub(link_mention, TAG_PATTERN.sub(link_tag, text)))
+
+
+@register.simple_tag(takes_context=True)
+def like_button(context, piece):
+    if piece.id in context.get("user_like_list", ()):
+        button = format_html(
+            '<button id="piece-{}" class="likebtn" data-url="{}" data-pk={} data-is-liked="true">'
+            '<i class="bi bi-heart-fill"></i></button><span id="liketxt_{}">いいね解除</span>',
+            piece.id, fast_reverse("comuse:unlike", piece.id), piece.pk, piece.id,
+        )
+    else:
+        button = format_html(
+            '<button id="piece-{}" class="likebtn" data-url="{}" data-pk={} data-is-liked="false">'
+            '<i class="bi bi-heart"></i></button><span id="liketxt_{}">いいね！</span>',
+            piece.id, fast_reverse("comuse:like", piece.id), piece.pk, piece.id,
+        )
+    return format_html(
+        '<div class="minibuttons" style="width: 12%;">{}</div>'
+        '<span style="min-width: 12%; margin: 1%;">いいね数:<span id="count_{}">{}</span></span>',
+        button, piece.id, piece.liked_count,
+    )
+
+
+@register.simple_tag(takes_context=True)
+def bookmark_button(context, piece):
+    if piece.id in context.get("user_bookmark_list", ()):
+        button = format_html(
+            '<button id="piece-{}" class="bmbtn" data-url="{}" data-pk={} data-is-bookmarked="true">'
+            '<i class="bi bi-bookmark-fill"></i></button><span id="bmtxt_{}">ブックマーク解除</span>',
+            piece.id, fast_reverse("comuse:deleteBookmark", piece.id), piece.pk, piece.id,
+        )
+    else:
+        button = format_html(
+            '<button id="piece-{}" class="bmbtn" data-url="{}" data-pk={} data-is-bookmarked="false">'
+            '<i class="bi bi-bookmark"></i></button><span id="bmtxt_{}">ブックマーク</span>',
+            piece.id, fast_reverse("comuse:bookmark", piece.id), piece.pk, piece.id,
+        )
+    return format_html('<div class="minibuttons" style="width: 20%;">{}</div>', button)
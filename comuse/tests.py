@@ -1,15 +1,59 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
-from django.urls import reverse
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template import Context, Template, engines
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+import base64
+import datetime
+import errno
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+import uuid
+import wave
+from unittest import mock, skipUnless
 
-from .models import Like, Piece, Bookmark, Comment
+from .audio import decode, np
+from .autocomplete import PIECE, PrefixIndex, autocomplete_index
+from .models import Like, Piece, Bookmark, Comment, Mention, PieceTag, Upload
+from .hashtags import extract_mentions, extract_tags, tag_cloud
+from registration.models import Friendship, ProfileSummary
+from registration.purge import purge_user
+from jobs.models import Job
+from jobs.queue import run_pending
+from .templatetags.comuse_tags import bookmark_button, fast_reverse, like_button
+from .partitions import month_start
+from .views import HomeView, MentionListView, PieceDetailView, SearchView, TagPiecesView
+from .ratelimit import RateLimiter, TokenBucket, parse_rate
+from .vectors import VectorStore, vector_store
+from .viewer import viewer_state
+from .tasks import expire_uploads, rebuild_autocomplete
+from .storage import ContentAddressedStorage, IMMUTABLE_CACHE_CONTROL, serve_compressed, serve_immutable
+from myapp.edge import EdgeCache
+from myapp.testing import IsolatedStorageMixin
+from myapp.startup import lazy_import, lazy_modules, warm
 
 User = get_user_model()
 
 
-class TestHomeView(TestCase):
+class TestHomeView(IsolatedStorageMixin, TestCase):
     def setUp(self):
+        super().setUp()
         self.url = reverse("comuse:home")
         self.user = User.objects.create_user(username="testuser", password="testpassword")
         self.client.force_login(self.user)
@@ -23,6 +67,40 @@ class TestHomeView(TestCase):
         pieces = response.context["piece_list"]
         self.assertQuerysetEqual(pieces, Piece.objects.all())
 
+    def test_not_modified_until_feed_changes(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        Like.objects.create(user=self.user, target=Piece.objects.get())
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_likes_outside_the_page_keep_etag(self):
+        old = Piece.objects.create(user=self.user, title="old", caption="old")
+        Piece.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(days=1))
+        with mock.patch.object(HomeView, "page_size", 1):
+            self.client.get(self.url)
+            etag = self.client.get(self.url)["ETag"]
+            Like.objects.create(user=self.user, target=old)
+            response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_author_rename_changes_etag(self):
+        author = User.objects.create_user(username="author", password="password")
+        Piece.objects.create(user=author, title="song", caption="post")
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            author.username = "renamed"
+            author.save()
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "renamed")
+
 
 class TestPieceCreateView(TestCase):
     def setUp(self):
@@ -91,8 +169,11 @@ class TestPieceCreateView(TestCase):
         self.assertIn("この値は 1000 文字以下でなければなりません( 1001 文字になっています)。", form.errors["caption"])
 
 
-class TestPieceDetailView(TestCase):
+class TestPieceDetailView(IsolatedStorageMixin, TestCase):
     def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
         self.user = User.objects.create_user(username="testuser", password="testpassword")
         self.client.force_login(self.user)
         self.tweet = Piece.objects.create(user=self.user, title="test", caption="This is a test.")
@@ -103,6 +184,82 @@ class TestPieceDetailView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "comuse/detail.html")
 
+    def test_not_modified_until_comment_added(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(user=self.user, target=self.tweet, content="test")
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_commenter_deactivation_changes_etag(self):
+        commenter = User.objects.create_user(username="commenter", password="password")
+        Comment.objects.create(user=commenter, target=self.tweet, content="hello")
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            commenter.is_active = False
+            commenter.save()
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "commenter")
+
+    def test_viewer_state_in_context(self):
+        other = User.objects.create_user(username="other", password="password")
+        Like.objects.create(user=self.user, target=self.tweet)
+        Like.objects.create(user=other, target=self.tweet)
+        Bookmark.objects.create(user=other, target=self.tweet)
+        context = self.client.get(self.url).context
+        self.assertEqual(
+            (context["is_liked"], context["liked_count"], context["is_bookmarked"], context["bookmarked_count"]),
+            (True, 2, False, 1),
+        )
+
+    def test_shell_reused_until_comment_changes(self):
+        self.tweet.commentAllowance = True
+        self.tweet.save()
+        self.client.get(self.url)
+        with mock.patch("comuse.shells.render_to_string") as render:
+            self.client.get(self.url)
+            self.client.post(reverse("comuse:like", kwargs={"pk": self.tweet.pk}))
+            self.client.get(self.url)
+        render.assert_not_called()
+
+        Comment.objects.create(user=self.user, target=self.tweet, content="new comment")
+        response = self.client.get(self.url)
+        self.assertContains(response, "new comment")
+
+    def test_delete_links_only_for_own_comments(self):
+        self.tweet.commentAllowance = True
+        self.tweet.save()
+        other = User.objects.create_user(username="other", password="password")
+        mine = Comment.objects.create(user=self.user, target=self.tweet, content="mine")
+        theirs = Comment.objects.create(user=other, target=self.tweet, content="theirs")
+        response = self.client.get(self.url)
+        self.assertContains(response, reverse("comuse:deleteComment", args=[self.tweet.pk, mine.pk]))
+        self.assertNotContains(response, reverse("comuse:deleteComment", args=[self.tweet.pk, theirs.pk]))
+        self.assertNotContains(response, "comment-actions")
+
+        self.client.force_login(other)
+        response = self.client.get(self.url)
+        self.assertNotContains(response, reverse("comuse:deleteComment", args=[self.tweet.pk, mine.pk]))
+        self.assertContains(response, reverse("comuse:deleteComment", args=[self.tweet.pk, theirs.pk]))
+
+    def test_commenter_rename_refreshes_shell(self):
+        self.tweet.commentAllowance = True
+        self.tweet.save()
+        commenter = User.objects.create_user(username="commenter", password="password")
+        Comment.objects.create(user=commenter, target=self.tweet, content="hello")
+        self.client.get(self.url)
+        commenter.username = "renamed"
+        commenter.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "renamed")
+        self.assertNotContains(response, "commenter")
+
 
 class TestPieceDeleteView(TestCase):
     def setUp(self):
@@ -130,6 +287,39 @@ class TestPieceDeleteView(TestCase):
         self.assertEqual(Piece.objects.count(), 2)
 
 
+class TestPieceFileCleanup(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.piece = Piece.objects.create(user=self.user, title="test", caption="post")
+        self.piece.uploadedFile.save("song.mp3", ContentFile(b"sound"))
+
+    def test_delete_removes_file_in_background(self):
+        name = self.piece.uploadedFile.name
+        self.client.post(reverse("comuse:delete", kwargs={"pk": self.piece.pk}))
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(Job.objects.filter(name="comuse.tasks.delete_file", args=[name]).exists())
+
+        run_pending()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_shared_file_is_kept(self):
+        name = self.piece.uploadedFile.name
+        Piece.objects.create(user=self.user, title="copy", caption="post", uploadedFile=name)
+        self.piece.delete()
+        run_pending()
+        self.assertTrue(default_storage.exists(name))
+
+    def test_replaced_file_is_removed(self):
+        name = self.piece.uploadedFile.name
+        self.piece.uploadedFile.save("other.mp3", ContentFile(b"other sound"))
+        run_pending()
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(self.piece.uploadedFile.name))
+
+
 class TestLikeView(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="testuser", password="testpassword")
@@ -281,6 +471,7 @@ class TestDeleteCommentView(TestCase):
 
 class TestSearchView(TestCase):
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(username="testuser", password="testpassword")
         self.client.force_login(self.user)
         self.piece = Piece.objects.create(user=self.user, title="test", caption="post")
@@ -296,3 +487,1082 @@ class TestSearchView(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "comuse/result.html")
         self.assertEqual(cont_list, query_list)
+
+    def test_range_filters(self):
+        fast = Piece.objects.create(user=self.user, title="fast", caption="post")
+        long = Piece.objects.create(user=self.user, title="long", caption="post")
+        Piece.objects.filter(pk=self.piece.pk).update(duration=150, bpm=100, musical_key="Am")
+        Piece.objects.filter(pk=fast.pk).update(duration=180, bpm=125, musical_key="C")
+        Piece.objects.filter(pk=long.pk).update(duration=300, bpm=128, musical_key="C")
+
+        response = self.client.get(self.url, {"min_minutes": 2, "max_minutes": 4, "min_bpm": 120, "max_bpm": 130})
+        self.assertEqual(list(response.context["piece_list"]), [fast])
+        response = self.client.get(self.url, {"q": "st", "key": "Am"})
+        self.assertEqual(list(response.context["piece_list"]), [self.piece])
+        response = self.client.get(self.url, {"min_bpm": "fast"})
+        self.assertEqual(len(response.context["piece_list"]), 3)
+
+    def search_queries(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        return response, [query for query in queries if '"search_text" LIKE' in query["sql"]]
+
+    def test_normalized_queries_share_cached_ids(self):
+        piece = Piece.objects.create(user=self.user, title="ＢＬＵＥ ﾑｰﾝ", caption="post")
+        response, searches = self.search_queries({"q": "blue ムーン"})
+        self.assertEqual(list(response.context["piece_list"]), [piece])
+        self.assertEqual(len(searches), 1)
+        response, searches = self.search_queries({"q": " Ｂｌｕｅ  ﾑｰﾝ"})
+        self.assertEqual(list(response.context["piece_list"]), [piece])
+        self.assertEqual(searches, [])
+
+    def test_title_matches_rank_first_and_deletes_invalidate(self):
+        caption = Piece.objects.create(user=self.user, title="other", caption="a test caption")
+        self.assertEqual(list(self.client.get(self.url, {"q": "test"}).context["piece_list"]), [self.piece, caption])
+        newer = Piece.objects.create(user=self.user, title="Test 2", caption="post")
+        self.assertEqual(list(self.client.get(self.url, {"q": "test"}).context["piece_list"]), [newer, self.piece, caption])
+        newer.delete()
+        self.assertEqual(list(self.client.get(self.url, {"q": "test"}).context["piece_list"]), [self.piece, caption])
+
+    def test_new_pieces_merge_into_cached_results(self):
+        caption = Piece.objects.create(user=self.user, title="other", caption="a test caption")
+        self.client.get(self.url, {"q": "test"})
+        self.client.get(self.url)
+        new_caption = Piece.objects.create(user=self.user, title="another", caption="test again")
+        new_title = Piece.objects.create(user=self.user, title="test 2", caption="post")
+        Piece.objects.create(user=self.user, title="unrelated", caption="post")
+
+        response, searches = self.search_queries({"q": "test"})
+        self.assertEqual(list(response.context["piece_list"]), [new_title, self.piece, new_caption, caption])
+        self.assertEqual(len(searches), 1)
+        self.assertIn('"id" >', searches[0]["sql"])
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["piece_list"][:3], list(Piece.objects.order_by("-pk")[:3]))
+
+    def test_full_width_titles_rank_as_title_matches(self):
+        caption = Piece.objects.create(user=self.user, title="other", caption="blue note")
+        title = Piece.objects.create(user=self.user, title="ＢＬＵＥ", caption="post")
+        Piece.objects.filter(pk=title.pk).update(created_at=caption.created_at - datetime.timedelta(days=1))
+        self.assertEqual(list(self.client.get(self.url, {"q": "blue"}).context["piece_list"]), [title, caption])
+
+    def test_deactivated_authors_drop_out_of_cached_results(self):
+        other = User.objects.create_user(username="other", password="password")
+        hidden = Piece.objects.create(user=other, title="test hidden", caption="post")
+        self.assertEqual(list(self.client.get(self.url, {"q": "test"}).context["piece_list"]), [hidden, self.piece])
+        User.objects.filter(pk=other.pk).update(is_active=False)
+        self.assertEqual(list(self.client.get(self.url, {"q": "test"}).context["piece_list"]), [self.piece])
+
+    def test_pages_slice_cached_ids(self):
+        pieces = [Piece.objects.create(user=self.user, title="test%d" % i, caption="post") for i in range(4)]
+        with mock.patch.object(SearchView, "paginate_by", 2):
+            response, searches = self.search_queries({"q": "test"})
+            self.assertEqual(list(response.context["piece_list"]), pieces[:1:-1])
+            self.assertContains(response, "?q=test&page=2")
+            response, searches = self.search_queries({"q": "test", "page": 3})
+        self.assertEqual(list(response.context["piece_list"]), [self.piece])
+        self.assertEqual(searches, [])
+
+
+class TestAutocomplete(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Job.objects.all().delete()
+        self.user = User.objects.create_user(username="bluebird", password="testpassword")
+        self.fan = User.objects.create_user(username="fan", password="testpassword")
+        self.moon = Piece.objects.create(user=self.user, title="Blue Moon", caption="post")
+        self.blues = Piece.objects.create(user=self.user, title="Blues", caption="post")
+        Like.objects.create(user=self.fan, target=self.moon)
+        Like.objects.create(user=self.user, target=self.moon)
+        Friendship.objects.create(follower=self.fan, following=self.user)
+        autocomplete_index().rebuild()
+        self.url = reverse("comuse:autocomplete")
+
+    def labels(self, query):
+        return [result["label"] for result in autocomplete_index().search(query)]
+
+    def test_ranked_by_popularity(self):
+        self.assertEqual(self.labels("BLU"), ["Blue Moon", "bluebird", "Blues"])
+        self.assertEqual(self.labels("moo"), ["Blue Moon"])
+        self.assertEqual(self.labels("ｂｌｕｅ ｍ"), ["Blue Moon"])
+        self.assertEqual(self.labels(" "), [])
+
+    def test_view(self):
+        response = self.client.get(self.url, {"q": "blue"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [
+            {"kind": "piece", "id": self.moon.pk, "label": "Blue Moon", "url": reverse("comuse:detail", kwargs={"pk": self.moon.pk})},
+            {"kind": "user", "id": self.user.pk, "label": "bluebird", "url": reverse("registration:user_profile", kwargs={"username": "bluebird"})},
+            {"kind": "piece", "id": self.blues.pk, "label": "Blues", "url": reverse("comuse:detail", kwargs={"pk": self.blues.pk})},
+        ])
+
+    def test_incremental_updates(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            piece = Piece.objects.create(user=self.fan, title="Bluegrass", caption="post")
+        self.assertIn("Bluegrass", self.labels("blue"))
+        with self.captureOnCommitCallbacks(execute=True):
+            piece.delete()
+        self.assertNotIn("Bluegrass", self.labels("blue"))
+
+        User.objects.filter(pk=self.user.pk).update(username_updated_at=datetime.date.today() - datetime.timedelta(days=61))
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("registration:editun", kwargs={"username": "bluebird"}), {"username": "redbird"})
+        self.assertEqual(self.labels("blue"), ["Blue Moon", "Blues"])
+        self.assertEqual(self.labels("red"), ["redbird"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=["is_active"])
+        self.assertEqual(self.labels("b"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save(update_fields=["is_active"])
+        self.assertEqual(self.labels("b"), ["Blue Moon", "Blues"])
+
+    def test_visible_to_other_processes(self):
+        reader = PrefixIndex(settings.AUTOCOMPLETE_PATH)
+        self.assertEqual(reader.search("blues"), [{"kind": "piece", "id": self.blues.pk, "label": "Blues"}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blues.delete()
+        self.assertEqual(reader.search("blues"), [])
+
+    @override_settings(AUTOCOMPLETE_JOURNAL_LIMIT=2)
+    def test_journal_is_compacted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Piece.objects.create(user=self.fan, title="Bluegrass", caption="post")
+            Piece.objects.create(user=self.fan, title="Blue Train", caption="post")
+        self.assertEqual(Job.objects.filter(name=rebuild_autocomplete.job_name).count(), 1)
+        run_pending()
+        self.assertEqual(os.path.getsize(autocomplete_index().file("journal")), 0)
+        self.assertEqual(self.labels("blue"), ["Blue Moon", "bluebird", "Blue Train", "Bluegrass", "Blues"])
+
+    def test_precomputed_prefixes_match_full_scan(self):
+        entries = [(PIECE, pk, "song %03d" % pk, pk * 7 % 50) for pk in range(1, 300)]
+        index = PrefixIndex(os.path.join(os.path.dirname(settings.AUTOCOMPLETE_PATH), "heavy"))
+        with override_settings(AUTOCOMPLETE_HEAVY_PREFIX=8, AUTOCOMPLETE_TOP=16):
+            index.rebuild(entries)
+        index.load()
+        self.assertTrue(len(index.snapshot.prefixes))
+        for query in ("s", "song", "song 1", "song 12", "song 123", "song 9"):
+            expected = sorted((entry for entry in entries if entry[2].startswith(query)), key=lambda entry: (-entry[3], entry[2]))[:8]
+            self.assertEqual([result["id"] for result in index.search(query)], [entry[1] for entry in expected])
+
+
+class TestHashtags(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.fan = User.objects.create_user(username="Fan", password="testpassword")
+        self.client.force_login(self.user)
+
+    def test_extraction(self):
+        self.assertEqual(extract_tags("新曲 #ボカロ #Rock ＃ｒｏｃｋ #123 C#m a#b #夏_2024"), ["ボカロ", "rock", "夏_2024"])
+        self.assertEqual(extract_mentions("@Fan. thanks mail a@b.com ＠ｂｏｂ"), ["Fan.", "bob"])
+
+    def test_captions_and_comments_are_indexed(self):
+        piece = Piece.objects.create(user=self.user, title="song", caption="#夏 #Rock @Fan. @testuser @nobody")
+        self.assertEqual(set(piece.piece_tags.values_list("tag__name", flat=True)), {"夏", "rock"})
+        self.assertEqual(list(Mention.objects.values_list("user", "piece", "comment")), [(self.fan.pk, piece.pk, None)])
+
+        piece.caption = "#夏"
+        piece.save()
+        self.assertEqual(list(piece.piece_tags.values_list("tag__name", flat=True)), ["夏"])
+        self.assertFalse(Mention.objects.exists())
+
+        comment = Comment.objects.create(user=self.user, target=piece, content="＠Fan どうですか")
+        self.assertEqual(list(Mention.objects.values_list("user", "piece", "comment")), [(self.fan.pk, piece.pk, comment.pk)])
+
+    def test_tag_feed_pages_by_keyset(self):
+        pieces = [Piece.objects.create(user=self.user, title="song%d" % i, caption="#Rock %d" % i) for i in range(3)]
+        Piece.objects.create(user=self.user, title="other", caption="#jazz")
+        url = reverse("comuse:tag", kwargs={"name": "ＲＯＣＫ"})
+        with mock.patch.object(TagPiecesView, "page_size", 2):
+            response = self.client.get(url)
+            self.assertEqual(response.context["piece_list"], pieces[:0:-1])
+            self.assertEqual(response.context["heading"], "#rock (3件)")
+            response = self.client.get(url, {"before": response.context["next_cursor"]})
+        self.assertEqual(response.context["piece_list"], pieces[:1])
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertEqual(self.client.get(reverse("comuse:tag", kwargs={"name": "none"})).status_code, 404)
+
+    def test_mention_feed(self):
+        piece = Piece.objects.create(user=self.user, title="song", caption="@Fan")
+        Comment.objects.create(user=self.user, target=piece, content="@Fan again")
+        self.client.force_login(self.fan)
+        response = self.client.get(reverse("comuse:mentions"))
+        self.assertEqual(response.context["piece_list"], [piece])
+
+    def test_mention_feed_pages_over_comment_mentions(self):
+        pieces = [Piece.objects.create(user=self.user, title="song%d" % i, caption="post") for i in range(4)]
+        Piece.objects.filter(pk__in=[piece.pk for piece in pieces]).update(created_at=timezone.now() - datetime.timedelta(days=30))
+        for i in range(40):
+            Comment.objects.create(user=self.user, target=pieces[i % 4], content="@Fan %d" % i)
+        self.client.force_login(self.fan)
+        url = reverse("comuse:mentions")
+        seen, cursor = [], None
+        with mock.patch.object(MentionListView, "page_size", 6):
+            while True:
+                response = self.client.get(url, {"before": cursor} if cursor else {})
+                seen.append(response.context["piece_list"])
+                cursor = response.context["next_cursor"]
+                if cursor is None:
+                    break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen[0], pieces[::-1])
+        self.assertTrue(all(len(page) == len(set(page)) for page in seen))
+
+    def test_tag_cloud_is_cached(self):
+        for caption in ("#rock", "#rock #jazz", "#pop #rock"):
+            Piece.objects.create(user=self.user, title="song", caption=caption)
+        self.assertEqual(tag_cloud(), [("rock", 3), ("jazz", 1), ("pop", 1)])
+        with self.assertNumQueries(0):
+            tag_cloud()
+        response = self.client.get(reverse("comuse:tags"))
+        self.assertContains(response, "font-size: 2.00em")
+
+    def test_linkify(self):
+        html = Template("{% load comuse_tags %}{{ text|linkify }}").render(Context({"text": "<b>#夏</b> @Fan. &#39;"}))
+        self.assertEqual(html, '&lt;b&gt;<a href="%s">#夏</a>&lt;/b&gt; <a href="/registration/Fan/">@Fan</a>. &amp;#39;' % reverse("comuse:tag", kwargs={"name": "夏"}))
+
+    def test_backfill_command_and_purge(self):
+        piece = Piece.objects.bulk_create([Piece(user=self.fan, title="song", caption="#Rock @testuser")])[0]
+        Comment.objects.bulk_create([Comment(user=self.user, target=piece, content="@Fan")])
+        output = io.StringIO()
+        call_command("extracttags", batch_size=1, stdout=output)
+        self.assertIn("Indexed 1 pieces.", output.getvalue())
+        self.assertEqual(list(PieceTag.objects.values_list("tag__name", flat=True)), ["rock"])
+        self.assertEqual(Mention.objects.count(), 2)
+
+        purge_user(self.fan.pk)
+        self.assertFalse(PieceTag.objects.exists())
+        self.assertFalse(Mention.objects.exists())
+
+
+def wav_bytes(samples, rate):
+    output = io.BytesIO()
+    with wave.open(output, "wb") as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(rate)
+        audio.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return output.getvalue()
+
+
+@skipUnless(np, "NumPy is not installed")
+@override_settings(AUDIO_CHUNK_SECONDS=1)
+class TestAudioAnalysis(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Job.objects.all().delete()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        rate = 22050
+        t = np.arange(rate * 8) / rate
+        clicks = np.zeros_like(t)
+        for start in range(0, len(t), rate // 2):
+            clicks[start:start + 200] = np.hanning(200)[:len(clicks[start:start + 200])]
+        chord = sum(np.sin(2 * np.pi * freq * t) for freq in (220.0, 277.18, 329.63)) / 6
+        self.tone = wav_bytes(np.sin(2 * np.pi * 997 * t[:rate * 2]), rate)
+        self.song = wav_bytes(chord + clicks / 2, rate)
+
+    def test_analyzed_once_after_upload(self):
+        piece = Piece.objects.create(user=self.user, title="tone", caption="post")
+        piece.uploadedFile.save("tone.mp3", ContentFile(self.tone))
+        self.assertTrue(Job.objects.filter(name="comuse.tasks.analyze_piece", args=[piece.pk]).exists())
+        run_pending()
+
+        piece.refresh_from_db()
+        self.assertIsNotNone(piece.analyzed_at)
+        self.assertAlmostEqual(piece.duration, 2.0)
+        self.assertAlmostEqual(piece.loudness, -3.01, delta=0.2)
+
+        copy = Piece.objects.create(user=self.user, title="copy", caption="post", uploadedFile=piece.uploadedFile.name)
+        with mock.patch("comuse.tasks.analyze") as analyze:
+            run_pending()
+        analyze.assert_not_called()
+        copy.refresh_from_db()
+        self.assertEqual(copy.duration, piece.duration)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("comuse:similar", kwargs={"pk": piece.pk}))
+        self.assertEqual(list(response.context["piece_list"]), [copy])
+        copy_pk = copy.pk
+        with self.captureOnCommitCallbacks() as callbacks:
+            copy.delete()
+        self.assertIsNotNone(vector_store().get(copy_pk))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(vector_store().get(copy_pk))
+
+    def test_command_estimates_tempo_and_key(self):
+        piece = Piece.objects.create(user=self.user, title="song", caption="post")
+        piece.uploadedFile.save("song.mp3", ContentFile(self.song))
+        Job.objects.all().delete()
+        out = io.StringIO()
+        call_command("analyzeaudio", "--processes", "1", stdout=out)
+        self.assertIn("Analyzed 1 pieces, 0 files failed.", out.getvalue())
+
+        piece.refresh_from_db()
+        self.assertAlmostEqual(piece.duration, 8.0)
+        self.assertAlmostEqual(piece.bpm, 120, delta=2)
+        self.assertEqual(piece.musical_key, "A")
+        self.assertTrue(Piece.objects.filter(bpm__range=(118, 122), duration__lte=60).exists())
+
+    def test_unsupported_wave_width_is_decoded_by_ffmpeg(self):
+        output = io.BytesIO()
+        with wave.open(output, "wb") as audio:
+            audio.setnchannels(1)
+            audio.setsampwidth(3)
+            audio.setframerate(22050)
+            audio.writeframes(b"\0" * 3 * 22050)
+        name = default_storage.save("files/deep.wav", ContentFile(output.getvalue()))
+        with mock.patch("comuse.audio.read_ffmpeg", return_value=iter([(22050, np.zeros(22050, dtype=np.float32))])) as read_ffmpeg:
+            chunks = list(decode(name))
+        read_ffmpeg.assert_called_once()
+        self.assertEqual(len(chunks), 1)
+
+
+@skipUnless(np, "NumPy is not installed")
+class TestVectorStore(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = VectorStore(os.path.join(self.tmp_dir, "vectors"), dim=8)
+        random = np.random.default_rng(0)
+        self.vectors = random.normal(size=(300, 8)).astype(np.float32)
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True)
+
+    def test_incremental_inserts_grow_the_matrix(self):
+        with mock.patch("comuse.vectors.INITIAL_CAPACITY", 16):
+            for pk, vector in enumerate(self.vectors[:40], start=1):
+                self.store.add(pk, vector)
+        self.assertEqual(len(self.store.live_rows()), 40)
+        self.assertEqual(self.store.search(self.vectors[7], k=1)[0][0], 8)
+        self.assertEqual([pk for pk, _ in self.store.search(self.vectors[7], k=2, exclude=[8])][:1], [pk for pk, _ in self.store.brute_force(self.vectors[7], k=2, exclude=[8])][:1])
+
+        self.store.remove(8)
+        self.assertIsNone(self.store.get(8))
+        self.assertNotIn(8, [pk for pk, _ in self.store.search(self.vectors[7], k=5)])
+
+    def test_ivf_matches_brute_force_with_all_probes(self):
+        for pk, vector in enumerate(self.vectors, start=1):
+            self.store.add(pk, vector)
+        self.assertEqual(self.store.train(clusters=10), 10)
+        self.store.add(1000, self.vectors[0])
+
+        query = self.vectors[42]
+        exact = self.store.brute_force(query, k=10)
+        self.assertEqual(self.store.search(query, k=10, probes=10), exact)
+        self.assertEqual(self.store.search(query, k=1, probes=1)[0][0], 43)
+        self.assertIn(1000, [pk for pk, _ in self.store.search(self.vectors[0], k=2, probes=1)])
+
+    def test_other_process_writes_are_visible(self):
+        self.store.add(1, self.vectors[0])
+        other = VectorStore(self.store.path, dim=8)
+        other.add(2, self.vectors[1])
+        self.assertEqual(self.store.search(self.vectors[1], k=1)[0][0], 2)
+
+    def test_other_process_changes_are_replayed_without_rebuild(self):
+        for pk, vector in enumerate(self.vectors[:50], start=1):
+            self.store.add(pk, vector)
+        self.store.train(clusters=4)
+        other = VectorStore(self.store.path, dim=8)
+        for store in (self.store, other):
+            store.search(self.vectors[0])
+        with mock.patch.object(VectorStore, "build_lists") as build_lists:
+            self.store.add(100, self.vectors[60])
+            self.store.add(2, self.vectors[61])
+            self.store.remove(1)
+            self.assertEqual(other.search(self.vectors[60], k=1)[0][0], 100)
+            self.assertEqual(other.search(self.vectors[61], k=1)[0][0], 2)
+            self.assertNotIn(1, [pk for pk, _ in other.search(self.vectors[0], k=5, probes=4)])
+            self.assertIsNone(other.get(1))
+        build_lists.assert_not_called()
+
+
+class TestViewerStateView(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user1 = User.objects.create_user(username="testuser", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword2")
+        self.client.force_login(self.user1)
+        self.piece1 = Piece.objects.create(user=self.user2, title="test1", caption="post1")
+        self.piece2 = Piece.objects.create(user=self.user2, title="test2", caption="post2")
+        Like.objects.create(user=self.user1, target=self.piece1)
+        Like.objects.create(user=self.user2, target=self.piece1)
+        Bookmark.objects.create(user=self.user1, target=self.piece2)
+        Friendship.objects.create(follower=self.user1, following=self.user2)
+        self.url = reverse("comuse:viewer_state")
+
+    def test_success_get(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {"pieces": "%d,%d" % (self.piece1.pk, self.piece2.pk), "users": "testuser2,nobody"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["pieces"][str(self.piece1.pk)], {"is_liked": True, "liked_count": 2, "is_bookmarked": False, "bookmarked_count": 0})
+        self.assertEqual(data["pieces"][str(self.piece2.pk)], {"is_liked": False, "liked_count": 0, "is_bookmarked": True, "bookmarked_count": 1})
+        self.assertEqual(data["following"], {"testuser2": True, "nobody": False})
+        self.assertEqual(data["viewer"]["id"], self.user1.pk)
+        self.assertEqual(data["viewer"]["links"]["profile"], reverse("registration:user_profile", kwargs={"username": "testuser"}))
+        self.assertTrue(data["viewer"]["csrf_token"])
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_failure_get_anonymous(self):
+        self.client.logout()
+        response = self.client.get(self.url, {"pieces": str(self.piece1.pk)})
+        self.assertEqual(response.status_code, 302)
+
+
+class TestEdgeShell(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        self.alice = User.objects.create_user(username="alice", password="testpassword")
+        self.bob = User.objects.create_user(username="bob", password="testpassword")
+        self.piece = Piece.objects.create(user=self.author, title="test", caption="post", commentAllowance=True)
+        Comment.objects.create(user=self.alice, target=self.piece, content="hello")
+        Like.objects.create(user=self.bob, target=self.piece)
+        self.edge = EdgeCache(WSGIHandler())
+        self.url = reverse("comuse:detail", kwargs={"pk": self.piece.pk})
+
+    def session_cookie(self, user):
+        client = Client()
+        client.force_login(user)
+        return "%s=%s" % (settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+    def request(self, cookie):
+        environ = RequestFactory().get(self.url).environ
+        environ["HTTP_COOKIE"] = cookie
+        response = {}
+        body = b"".join(self.edge(environ, lambda status, headers, exc_info=None: response.update(status=status, headers=dict(headers))))
+        return response["status"], response["headers"], body
+
+    def viewer_state(self, body):
+        return json.loads(re.search(rb'<script type="application/json" id="viewer-state">(.*?)</script>', body).group(1))
+
+    def test_shell_is_shared_and_holes_are_per_viewer(self):
+        _, headers, first = self.request(self.session_cookie(self.alice))
+        self.assertEqual(headers["X-Cache"], "MISS")
+        _, headers, second = self.request(self.session_cookie(self.bob))
+        self.assertEqual(headers["X-Cache"], "HIT")
+        self.assertNotIn("Surrogate-Control", headers)
+        self.assertIn("private", headers["Cache-Control"])
+
+        self.assertEqual(self.viewer_state(first)["viewer"]["id"], self.alice.pk)
+        state = self.viewer_state(second)
+        self.assertEqual(state["viewer"]["id"], self.bob.pk)
+        self.assertEqual(state["pieces"][str(self.piece.pk)]["is_liked"], True)
+        self.assertNotIn(reverse("registration:timeline", kwargs={"username": "alice"}).encode(), second)
+        self.assertNotIn(b"csrfmiddlewaretoken", second)
+        self.assertIn(('<span data-owner="%d" hidden>' % self.alice.pk).encode(), second)
+
+    def test_invalid_session_gets_login_redirect(self):
+        self.request(self.session_cookie(self.alice))
+        status, headers, _ = self.request("%s=invalid" % settings.SESSION_COOKIE_NAME)
+        self.assertTrue(status.startswith("302"))
+        self.assertTrue(headers["Location"].startswith(reverse("registration:login")))
+
+    def test_writers_bypass_shells(self):
+        cookie = self.session_cookie(self.alice)
+        self.request(cookie)
+        client = Client()
+        client.force_login(self.alice)
+        response = client.post(reverse("comuse:comment", kwargs={"pk": self.piece.pk}), {"content": "second comment"})
+        self.assertIn(settings.EDGE_BYPASS_COOKIE, response.cookies)
+
+        _, headers, body = self.request(cookie)
+        self.assertEqual(headers["X-Cache"], "HIT")
+        self.assertNotIn(b"second comment", body)
+        _, headers, body = self.request("%s; %s=1" % (cookie, settings.EDGE_BYPASS_COOKIE))
+        self.assertNotIn("X-Cache", headers)
+        self.assertIn(b"second comment", body)
+
+
+class TestContentAddressedStorage(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+
+    def test_same_content_shares_object(self):
+        name1 = self.storage.save("files/a.mp3", ContentFile(b"sound"))
+        name2 = self.storage.save("files/b.MP3", ContentFile(b"sound"))
+        self.assertEqual(name1, name2)
+        self.assertRegex(name1, r"^objects/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.mp3$")
+        self.assertTrue(self.storage.exists(name1))
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_ROOT), [])
+
+    def test_different_content_gets_different_object(self):
+        name1 = self.storage.save("files/a.mp3", ContentFile(b"sound1"))
+        name2 = self.storage.save("files/a.mp3", ContentFile(b"sound2"))
+        self.assertNotEqual(name1, name2)
+
+    def test_put_copies_across_filesystems(self):
+        real_replace = os.replace
+
+        def replace(src, dst):
+            if src.startswith(settings.UPLOAD_STAGING_ROOT):
+                raise OSError(errno.EXDEV, "Invalid cross-device link")
+            return real_replace(src, dst)
+
+        with mock.patch("comuse.storage.os.replace", side_effect=replace):
+            name = self.storage.save("files/a.mp3", ContentFile(b"sound"))
+        with self.storage.open(name) as stored:
+            self.assertEqual(stored.read(), b"sound")
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path(name))), [os.path.basename(name)])
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_ROOT), [])
+
+    def test_failed_save_removes_staged_file(self):
+        with mock.patch.object(self.storage.backend, "put", side_effect=OSError(errno.ENOSPC, "No space left on device")):
+            with self.assertRaises(OSError):
+                self.storage.save("files/a.mp3", ContentFile(b"sound"))
+        self.assertEqual(os.listdir(settings.UPLOAD_STAGING_ROOT), [])
+
+    def test_delete_keeps_referenced_object(self):
+        name = self.storage.save("files/a.mp3", ContentFile(b"sound"))
+        Piece.objects.create(user=self.user, title="test", caption="test", uploadedFile=name)
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        Piece.objects.all().delete()
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_upload_served_with_immutable_cache_header(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile("my song.mp3", b"sound", content_type="audio/mpeg")
+        self.client.post(reverse("comuse:create"), {"title": "test", "caption": "test", "uploadedFile": upload})
+        piece = Piece.objects.get()
+        self.assertTrue(piece.uploadedFile.name.startswith("objects/"))
+        self.assertNotIn("my song", piece.uploadedFile.name)
+
+        request = RequestFactory().get(piece.uploadedFile.url)
+        response = serve_immutable(request, piece.uploadedFile.name, document_root=settings.MEDIA_ROOT)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+
+
+class TestChunkedUploadViews(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.data = b"0123456789" * 10
+
+    def create_upload(self, filename="song.mp3", length=None):
+        return self.client.post(
+            reverse("comuse:upload_create"),
+            headers={"Upload-Length": str(length or len(self.data)), "Upload-Filename": filename},
+        )
+
+    def patch(self, location, chunk, offset, checksum=None):
+        headers = {"Upload-Offset": str(offset)}
+        if checksum is None:
+            checksum = base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+        if checksum:
+            headers["Upload-Checksum"] = "sha256 " + checksum
+        return self.client.generic("PATCH", location, chunk, content_type="application/offset+octet-stream", headers=headers)
+
+    def test_success_upload_in_chunks(self):
+        location = self.create_upload()["Location"]
+        response = self.patch(location, self.data[:40], 0)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], "40")
+
+        response = self.client.head(location)
+        self.assertEqual(response["Upload-Offset"], "40")
+
+        response = self.patch(location, self.data[40:], 40)
+        self.assertEqual(response["Upload-Offset"], "100")
+
+        response = self.client.post(location + "finish/", {"title": "test", "caption": "test"})
+        self.assertEqual(response.status_code, 201)
+        piece = Piece.objects.get()
+        self.assertEqual(piece.user, self.user)
+        self.assertEqual(piece.uploadedFile.read(), self.data)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_failure_create_with_invalid_extension(self):
+        response = self.create_upload(filename="song.wav")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_failure_create_with_too_large_file(self):
+        response = self.create_upload(length=settings.CHUNKED_UPLOAD_MAX_LENGTH + 1)
+        self.assertEqual(response.status_code, 413)
+
+    def test_failure_patch_with_wrong_offset(self):
+        location = self.create_upload()["Location"]
+        response = self.patch(location, self.data[10:20], 10)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "0")
+
+    def test_failure_patch_with_checksum_mismatch(self):
+        location = self.create_upload()["Location"]
+        self.patch(location, self.data[:10], 0)
+        response = self.patch(location, self.data[10:20], 10, checksum=base64.b64encode(b"x" * 32).decode())
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(Upload.objects.get().offset, 10)
+
+        response = self.patch(location, self.data[10:], 10)
+        self.assertEqual(response["Upload-Offset"], "100")
+
+    def test_failure_patch_with_malformed_checksum(self):
+        location = self.create_upload()["Location"]
+        response = self.patch(location, self.data[:10], 0, checksum="not base64!")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Upload.objects.get().offset, 0)
+
+    def test_staging_is_outside_media_root(self):
+        self.create_upload()
+        upload = Upload.objects.get()
+        path = default_storage.staging_path(str(upload.pk))
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(path.startswith(settings.MEDIA_ROOT))
+
+    def test_abandoned_uploads_expire(self):
+        Job.objects.all().delete()
+        self.create_upload()
+        self.create_upload()
+        old, fresh = Upload.objects.order_by("created_at")
+        Upload.objects.filter(pk=old.pk).update(created_at=timezone.now() - datetime.timedelta(seconds=settings.UPLOAD_EXPIRE_AFTER + 1))
+        orphan = default_storage.staging_path("00000000-0000-0000-0000-000000000000")
+        open(orphan, "wb").close()
+        job = Job.objects.get(name=expire_uploads.job_name)
+        self.assertGreater(job.run_at, timezone.now())
+
+        job.delete()
+        self.assertEqual(expire_uploads(), 1)
+        self.assertEqual(list(Upload.objects.all()), [fresh])
+        self.assertTrue(Job.objects.filter(name=expire_uploads.job_name, status=Job.QUEUED).exists())
+        self.assertFalse(os.path.exists(default_storage.staging_path(str(old.pk))))
+        self.assertTrue(os.path.exists(default_storage.staging_path(str(fresh.pk))))
+        self.assertFalse(os.path.exists(orphan))
+
+    def test_failure_finish_with_incomplete_upload(self):
+        location = self.create_upload()["Location"]
+        self.patch(location, self.data[:10], 0)
+        response = self.client.post(location + "finish/", {"title": "test", "caption": "test"})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Piece.objects.exists())
+
+    def test_failure_patch_with_other_user(self):
+        location = self.create_upload()["Location"]
+        other = User.objects.create_user(username="testuser2", password="testpassword2")
+        self.client.force_login(other)
+        response = self.patch(location, self.data[:10], 0)
+        self.assertEqual(response.status_code, 404)
+
+
+class TestImportDumpCommand(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        os.makedirs(os.path.join(self.tmp_dir, "src"))
+        with open(os.path.join(self.tmp_dir, "src", "song.mp3"), "wb") as f:
+            f.write(b"sound")
+        rows = [
+            {"model": "user", "username": "creator", "email": "creator@test.com"},
+            {"model": "user", "username": "fan"},
+            {"model": "piece", "id": 7, "user": "creator", "title": "test", "caption": "post",
+             "uploadedFile": "song.mp3", "commentAllowance": True, "created_at": "2020-01-02T03:04:05+00:00"},
+            {"model": "like", "target_id": 7, "user": "fan"},
+            {"model": "bookmark", "target_id": 7, "user": "fan"},
+            {"model": "friendship", "following__username": "creator", "follower__username": "fan"},
+        ]
+        self.dump = os.path.join(self.tmp_dir, "dump.ndjson")
+        with open(self.dump, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+
+    def import_dump(self, *args):
+        out = io.StringIO()
+        call_command("importdump", self.dump, "--media-dir", os.path.join(self.tmp_dir, "src"), "--batch-size", "2", *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_success_import(self):
+        output = self.import_dump()
+        self.assertIn("rows/s", output)
+
+        piece = Piece.objects.get()
+        self.assertEqual(piece.user.username, "creator")
+        self.assertEqual(piece.created_at.year, 2020)
+        self.assertTrue(piece.commentAllowance)
+        self.assertEqual(piece.uploadedFile.read(), b"sound")
+        self.assertTrue(Like.objects.filter(target=piece, user__username="fan").exists())
+        self.assertTrue(Bookmark.objects.filter(target=piece, user__username="fan").exists())
+        self.assertTrue(Friendship.objects.filter(following__username="creator", follower__username="fan").exists())
+        self.assertFalse(os.path.exists(self.dump + ".checkpoint"))
+
+    def test_success_import_twice_without_duplicates(self):
+        self.import_dump()
+        self.import_dump()
+        self.assertEqual(Piece.objects.count(), 1)
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(Friendship.objects.count(), 1)
+
+    def test_success_resume_from_checkpoint(self):
+        with open(self.dump + ".checkpoint", "w") as f:
+            json.dump({"line": 3}, f)
+        User.objects.create_user(username="creator", password="testpassword")
+        output = self.import_dump()
+        self.assertIn("Resuming after line 3.", output)
+        self.assertFalse(Piece.objects.exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertTrue(Friendship.objects.exists())
+
+    def test_resume_rebuilds_summaries_of_earlier_batches(self):
+        rows = [
+            {"model": "user", "username": "creator"},
+            {"model": "user", "username": "fan"},
+            {"model": "piece", "id": 7, "user": "creator", "title": "test"},
+            {"model": "like", "target_id": 7, "user": "fan"},
+            {"model": "bookmark", "target_id": 7, "user": "fan"},
+        ]
+        with open(self.dump, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        with mock.patch("comuse.management.commands.importdump.Command.import_bookmark", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.import_dump()
+        self.assertFalse(ProfileSummary.objects.exists())
+
+        self.assertIn("Resuming after line 4.", self.import_dump())
+        summary = ProfileSummary.objects.get(user__username="creator")
+        self.assertEqual((summary.piece_count, summary.likes_received), (1, 1))
+        self.assertFalse(os.path.exists(self.dump + ".checkpoint.users"))
+
+    def test_rows_with_unknown_targets_are_reported(self):
+        with open(self.dump, "a") as f:
+            f.write(json.dumps({"model": "like", "target_id": 99, "user": "fan"}) + "\n")
+        err = io.StringIO()
+        call_command("importdump", self.dump, stdout=io.StringIO(), stderr=err)
+        self.assertIn("Skipped 1 rows", err.getvalue())
+
+    def test_success_import_csv(self):
+        csv_dump = os.path.join(self.tmp_dir, "pieces.csv")
+        with open(csv_dump, "w") as f:
+            f.write("id,title,caption,commentAllowance\n1,test,post,False\n")
+        call_command("importdump", csv_dump, "--model", "piece", "--user", "creator", stdout=io.StringIO())
+        piece = Piece.objects.get()
+        self.assertEqual(piece.import_key, "import:1")
+        self.assertFalse(piece.commentAllowance)
+
+
+@override_settings(STORAGES=dict(settings.STORAGES, staticfiles={"BACKEND": "comuse.storage.CompressedManifestStaticFilesStorage"}))
+class TestStaticPipeline(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def test_bundles_are_fingerprinted_and_compressed(self):
+        name = staticfiles_storage.stored_name("js/coMuse.js")
+        self.assertRegex(name, r"^js/coMuse\.[0-9a-f]{12}\.js$")
+        with open(staticfiles_storage.path(name), "rb") as f:
+            original = f.read()
+        with open(staticfiles_storage.path(name) + ".gz", "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), original)
+
+        css = staticfiles_storage.stored_name("vendor/bootstrap-icons/bootstrap-icons.min.css")
+        with open(staticfiles_storage.path(css), encoding="utf-8") as f:
+            self.assertRegex(f.read(), r"fonts/bootstrap-icons\.[0-9a-f]{12}\.woff2")
+
+    def test_serve_precompressed_with_immutable_cache_header(self):
+        name = staticfiles_storage.stored_name("js/coMuse.js")
+        request = RequestFactory().get("/static/" + name, headers={"Accept-Encoding": "gzip, deflate"})
+        response = serve_compressed(request, name, document_root=settings.STATIC_ROOT)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+        self.assertIn("javascript", response["Content-Type"])
+
+    def test_serve_unhashed_name_without_immutable_cache_header(self):
+        request = RequestFactory().get("/static/js/coMuse.js")
+        response = serve_compressed(request, "js/coMuse.js", document_root=settings.STATIC_ROOT)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertFalse(response.has_header("Cache-Control"))
+
+
+class TestComuseTags(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="test.user@1", password="testpassword")
+        self.piece = Piece.objects.create(user=self.user, title="test", caption="post")
+        Like.objects.create(user=self.user, target=self.piece)
+
+    def test_fast_reverse_matches_reverse(self):
+        self.assertEqual(fast_reverse("comuse:detail", self.piece.pk), reverse("comuse:detail", args=[self.piece.pk]))
+        self.assertEqual(fast_reverse("comuse:detail", 12), reverse("comuse:detail", args=[12]))
+        self.assertEqual(
+            fast_reverse("registration:user_profile", username=self.user),
+            reverse("registration:user_profile", kwargs={"username": self.user.username}),
+        )
+
+    def test_fast_reverse_falls_back_to_reverse(self):
+        upload_pk = uuid.uuid4()
+        self.assertEqual(
+            fast_reverse("comuse:upload_chunk", upload_pk=upload_pk),
+            reverse("comuse:upload_chunk", kwargs={"upload_pk": upload_pk}),
+        )
+        with self.assertRaises(NoReverseMatch):
+            fast_reverse("comuse:detail", "abc")
+        self.assertEqual(fast_reverse("registration:user_profile", username="a%b"), "/registration/a%25b/")
+
+    def test_buttons_reflect_viewer_state(self):
+        context = {"user_like_list": {self.piece.pk}, "user_bookmark_list": set()}
+        like, bookmark = like_button(context, self.piece), bookmark_button(context, self.piece)
+        self.assertIn('data-url="%s"' % reverse("comuse:unlike", args=[self.piece.pk]), like)
+        self.assertIn('data-is-liked="true"', like)
+        self.assertIn('<span id="count_%d">1</span>' % self.piece.pk, like)
+        self.assertIn('data-url="%s"' % reverse("comuse:bookmark", args=[self.piece.pk]), bookmark)
+        self.assertIn('data-is-bookmarked="false"', bookmark)
+
+
+@override_settings(RATELIMITS={"like": "2/m", "comment": "1/m"})
+class TestRateLimit(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.piece = Piece.objects.create(user=self.user, title="test", caption="post", commentAllowance=True)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("30/m"), (30, 60))
+        self.assertEqual(parse_rate("100/5s"), (100, 5))
+
+    def test_toggle_is_throttled_before_db_access(self):
+        like_url = reverse("comuse:like", kwargs={"pk": self.piece.pk})
+        unlike_url = reverse("comuse:unlike", kwargs={"pk": self.piece.pk})
+        self.assertEqual(self.client.post(like_url).status_code, 200)
+        self.assertEqual(self.client.post(unlike_url).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.post(like_url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        self.assertIn("error", response.json())
+        self.assertFalse(Like.objects.exists())
+
+    def test_comment_is_throttled(self):
+        url = reverse("comuse:comment", kwargs={"pk": self.piece.pk})
+        self.client.post(url, {"content": "first"})
+        response = self.client.post(url, {"content": "second"})
+        self.assertEqual(response.status_code, 429)
+        self.assertTemplateUsed(response, "429.html")
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_limits_are_per_user(self):
+        url = reverse("comuse:like", kwargs={"pk": self.piece.pk})
+        self.client.post(url)
+        self.client.post(url)
+        self.client.force_login(User.objects.create_user(username="other", password="testpassword"))
+        self.assertEqual(self.client.post(url).status_code, 200)
+
+    def test_falls_back_to_memory_when_cache_fails(self):
+        limiter = RateLimiter(alias="missing")
+        self.assertEqual(limiter.hit("like", "user:1", "1/m"), (True, 0))
+
+    def test_database_cache_is_never_used(self):
+        database_cache = {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "ratelimit_cache"}
+        with self.settings(CACHES={**settings.CACHES, "ratelimit": database_cache}):
+            limiter = RateLimiter(alias="ratelimit")
+            with self.assertNumQueries(0):
+                self.assertEqual(limiter.hit("like", "user:1", "1/m"), (True, 0))
+                self.assertFalse(limiter.hit("like", "user:1", "1/m")[0])
+        allowed, retry_after = limiter.hit("like", "user:1", "1/m")
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+
+    def test_token_bucket_refills(self):
+        bucket = TokenBucket()
+        self.assertTrue(bucket.hit("key", 1, 0.01)[0])
+        self.assertFalse(bucket.hit("key", 1, 0.01)[0])
+        time.sleep(0.02)
+        self.assertTrue(bucket.hit("key", 1, 0.01)[0])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class TestReplicaRouting(IsolatedStorageMixin, TransactionTestCase):
+    databases = {"default", "replica", "shard1"}
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.piece = Piece.objects.create(user=self.user, title="old", caption="post")
+        call_command("syncreplica", "replica", stdout=io.StringIO())
+        self.client.force_login(self.user)
+
+    def test_feed_reads_from_replica(self):
+        fresh = Piece.objects.create(user=self.user, title="fresh", caption="post")
+        response = self.client.get(reverse("comuse:home"))
+        self.assertEqual(list(response.context["piece_list"]), [self.piece])
+
+        call_command("syncreplica", "replica", stdout=io.StringIO())
+        response = self.client.get(reverse("comuse:home"))
+        self.assertEqual(list(response.context["piece_list"]), [fresh, self.piece])
+
+    def test_own_write_pins_to_primary(self):
+        self.client.post(reverse("comuse:comment", kwargs={"pk": self.piece.pk}), {"content": "comment"})
+        response = self.client.get(reverse("comuse:detail", kwargs={"pk": self.piece.pk}))
+        self.assertEqual(response.status_code, 200)
+        fresh = Piece.objects.create(user=self.user, title="fresh", caption="post")
+        response = self.client.get(reverse("comuse:home"))
+        self.assertIn(fresh, response.context["piece_list"])
+
+    def test_writes_and_plain_reads_use_primary(self):
+        with self.assertNumQueries(0, using="replica"):
+            Piece.objects.create(user=self.user, title="fresh", caption="post")
+            self.assertEqual(Piece.objects.count(), 2)
+
+    def test_sync_never_touches_shards(self):
+        Like.objects.using("shard1").create(target=self.piece, user=self.user)
+        call_command("syncreplica", stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command("syncreplica", "shard1", stdout=io.StringIO())
+        self.assertEqual(Like.objects.using("shard1").count(), 1)
+
+
+@override_settings(ENGAGEMENT_SHARDS=["default", "shard1"])
+class TestEngagementSharding(TestCase):
+    databases = {"default", "shard1"}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        self.client.force_login(self.user)
+        self.pieces = [Piece.objects.create(user=self.other, title="test%d" % i, caption="post") for i in range(4)]
+        self.even = [piece for piece in self.pieces if piece.pk % 2 == 0]
+        self.odd = [piece for piece in self.pieces if piece.pk % 2 == 1]
+
+    def like_all(self):
+        for piece in self.pieces:
+            self.client.post(reverse("comuse:like", kwargs={"pk": piece.pk}))
+            self.client.post(reverse("comuse:bookmark", kwargs={"pk": piece.pk}))
+
+    def test_rows_are_placed_by_piece(self):
+        self.like_all()
+        self.assertCountEqual(Like.objects.using("default").values_list("target_id", flat=True), [p.pk for p in self.even])
+        self.assertCountEqual(Like.objects.using("shard1").values_list("target_id", flat=True), [p.pk for p in self.odd])
+        self.assertCountEqual(Bookmark.objects.using("shard1").values_list("target_id", flat=True), [p.pk for p in self.odd])
+
+    def test_toggle_on_shard(self):
+        piece = self.odd[0]
+        response = self.client.post(reverse("comuse:like", kwargs={"pk": piece.pk}))
+        self.assertEqual(response.json(), {"liked_count": 1})
+        response = self.client.post(reverse("comuse:like", kwargs={"pk": piece.pk}))
+        self.assertEqual(Like.objects.using("shard1").count(), 1)
+        response = self.client.post(reverse("comuse:unlike", kwargs={"pk": piece.pk}))
+        self.assertEqual(response.json(), {"liked_count": 0})
+
+    def test_scatter_gather_reads(self):
+        self.like_all()
+        response = self.client.get(reverse("comuse:home"))
+        self.assertEqual(response.context["user_like_list"], {p.pk for p in self.pieces})
+        self.assertEqual([p.liked_count for p in response.context["piece_list"]], [1, 1, 1, 1])
+
+        response = self.client.get(reverse("registration:bookmarkList", kwargs={"username": self.user.username}))
+        self.assertCountEqual(response.context["bookmarked_piece_list"], self.pieces)
+
+        state = viewer_state(self.user, [p.pk for p in self.pieces])
+        self.assertTrue(all(piece["is_liked"] and piece["is_bookmarked"] for piece in state.values()))
+
+    def test_deletes_reach_every_shard(self):
+        self.like_all()
+        self.odd[0].delete()
+        self.assertFalse(Like.objects.using("shard1").filter(target_id=self.odd[0].pk).exists())
+
+        self.user.delete()
+        self.assertFalse(Like.objects.using("default").exists())
+        self.assertFalse(Like.objects.using("shard1").exists())
+        self.assertFalse(Bookmark.objects.using("shard1").exists())
+
+
+@override_settings(HOT_PARTITION_MONTHS=3)
+class TestArchivePartitions(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        now = timezone.now()
+        self.pieces = []
+        for months in range(6):
+            piece = Piece.objects.create(user=self.user, title="test%d" % months, caption="post", commentAllowance=True)
+            Piece.objects.filter(pk=piece.pk).update(created_at=month_start(now, months))
+            self.pieces.append(piece)
+
+    def roll(self):
+        out = io.StringIO()
+        call_command("rollpartitions", stdout=out)
+        return out.getvalue()
+
+    def test_month_start(self):
+        moment = timezone.make_aware(datetime.datetime(2024, 2, 15, 12, 30))
+        self.assertEqual(month_start(moment), timezone.make_aware(datetime.datetime(2024, 2, 1)))
+        self.assertEqual(month_start(moment, 3), timezone.make_aware(datetime.datetime(2023, 11, 1)))
+
+    def test_roll_forward_archives_old_months(self):
+        self.assertIn("Archived 2 piece rows", self.roll())
+        self.assertEqual(set(Piece.objects.archive()), set(self.pieces[4:]))
+        self.assertIn("Archived 0 piece rows", self.roll())
+
+    def test_feed_pages_through_hot_then_archive(self):
+        self.roll()
+        url = reverse("comuse:home")
+        with mock.patch.object(HomeView, "page_size", 4):
+            response = self.client.get(url)
+            self.assertEqual(list(response.context["piece_list"]), self.pieces[:4])
+            response = self.client.get(url, {"before": response.context["next_cursor"]})
+            self.assertEqual(list(response.context["piece_list"]), self.pieces[4:])
+            self.assertIsNone(response.context["next_cursor"])
+
+    def test_hot_page_needs_no_archive_query(self):
+        self.roll()
+        with self.assertNumQueries(1):
+            self.assertEqual(Piece.objects.keyset_page(3), self.pieces[:3])
+
+    def test_each_partition_has_its_own_index(self):
+        self.assertIn("piece_hot_created_idx", Piece.objects.hot().order_by("-created_at", "-pk").explain())
+        self.assertIn("piece_archive_created_idx", Piece.objects.archive().order_by("-created_at", "-pk").explain())
+
+    def test_comment_pages(self):
+        piece = self.pieces[0]
+        comments = [Comment.objects.create(user=self.user, target=piece, content="c%d" % i) for i in range(3)]
+        url = reverse("comuse:detail", kwargs={"pk": piece.pk})
+        with mock.patch.object(PieceDetailView, "comment_page_size", 2):
+            response = self.client.get(url)
+            self.assertEqual(response.context["comment_list"], comments[:0:-1])
+            response = self.client.get(url, {"comments_before": response.context["next_comment_cursor"]})
+            self.assertEqual(response.context["comment_list"], comments[:1])
+
+
+class TestStartup(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.tmp_dir, "lazy_probe.py"), "w") as f:
+            f.write("import sys\nsys.lazy_probe_loaded = True\nVALUE = 42\n")
+        sys.path.insert(0, self.tmp_dir)
+        self.addCleanup(sys.path.remove, self.tmp_dir)
+        self.addCleanup(sys.modules.pop, "lazy_probe", None)
+        self.addCleanup(vars(sys).pop, "lazy_probe_loaded", None)
+
+    def test_lazy_import_defers_module_body(self):
+        self.assertIsNone(lazy_import("no_such_module"))
+        module = lazy_import("lazy_probe")
+        self.addCleanup(lazy_modules.remove, module)
+        self.assertFalse(hasattr(sys, "lazy_probe_loaded"))
+        self.assertEqual(module.VALUE, 42)
+        self.assertTrue(sys.lazy_probe_loaded)
+        self.assertIs(lazy_import("lazy_probe"), module)
+
+    def test_warm_loads_lazy_modules_and_templates(self):
+        module = lazy_import("lazy_probe")
+        self.addCleanup(lazy_modules.remove, module)
+        with mock.patch("myapp.startup.connections") as connections:
+            stats = warm()
+        connections.close_all.assert_called_once_with()
+        self.assertTrue(sys.lazy_probe_loaded)
+        self.assertGreater(stats["templates"], 0)
+        self.assertIn("comuse/home.html", engines["django"].engine.template_loaders[0].get_template_cache)
@@ -15,5 +15,14 @@ urlpatterns = [
     path("<int:pk>/deletebookmark/", views.DeleteBookmarkView.as_view(), name='deleteBookmark'),
     path("<int:pk>/comment/", views.CommentView.as_view(), name="comment"),
     path("<int:pk>/deletecomment/<int:comment_pk>", views.DeleteCommentView.as_view(), name='deleteComment'),
+    path("<int:pk>/similar/", views.SimilarPiecesView.as_view(), name="similar"),
     path("search/", views.SearchView.as_view(), name="search"),
+    path("search/autocomplete/", views.AutocompleteView.as_view(), name="autocomplete"),
+    path("tags/", views.TagCloudView.as_view(), name="tags"),
+    path("tags/<str:name>/", views.TagPiecesView.as_view(), name="tag"),
+    path("mentions/", views.MentionListView.as_view(), name="mentions"),
+    path("viewer-state/", views.ViewerStateView.as_view(), name="viewer_state"),
+    path("uploads/", views.UploadCreateView.as_view(), name="upload_create"),
+    path("uploads/<uuid:upload_pk>/", views.UploadChunkView.as_view(), name="upload_chunk"),
+    path("uploads/<uuid:upload_pk>/finish/", views.UploadFinishView.as_view(), name="upload_finish"),
 ]
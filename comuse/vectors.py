@@ -0,0 +1,247 @@
+import fcntl
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .audio import EMBEDDING_DIM, np
+
+INITIAL_CAPACITY = 1024
+EMPTY = 0
+REMOVED = -1
+UNASSIGNED = -1
+JOURNAL_RECORD = struct.Struct("<qq")
+
+
+def nearest(vectors, centroids, batch_size=10000):
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch_size):
+        assignments[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+    return assignments
+
+
+def kmeans(vectors, clusters, iterations=10, seed=0):
+    random = np.random.default_rng(seed)
+    centroids = vectors[random.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=clusters) == 0
+        sums[empty] = vectors[random.choice(len(vectors), int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if not k:
+        return np.zeros(0, dtype=int)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+class VectorStore:
+    def __init__(self, path, dim=EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.local = threading.Lock()
+        self.state = None
+        self.matrix = self.ids = self.lists = None
+
+    def file(self, suffix):
+        return "%s.%s" % (self.path, suffix)
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.local, open(self.file("lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.exists(self.file("ids"))
+
+    def stamp(self):
+        return os.path.getsize(self.file("ids")), *(
+            (stat.st_size, stat.st_mtime_ns) if stat else None
+            for stat in (self.stat("generation"), self.stat("centroids.npy"))
+        )
+
+    def stat(self, suffix):
+        try:
+            return os.stat(self.file(suffix))
+        except FileNotFoundError:
+            return None
+
+    def journal_size(self):
+        stat = self.stat("journal")
+        return stat.st_size if stat else 0
+
+    def touch(self):
+        with open(self.file("generation"), "w") as f:
+            f.write(str(time.time_ns()))
+        self.state = None
+
+    def record(self, row, piece_id):
+        with open(self.file("journal"), "ab") as f:
+            f.write(JOURNAL_RECORD.pack(row, piece_id))
+
+    def allocate(self, capacity):
+        old = os.path.getsize(self.file("ids")) // 8 if self.exists() else 0
+        for suffix, dtype, width in (("f32", np.float32, self.dim), ("lists", np.int32, 1), ("ids", np.int64, 1)):
+            with open(self.file(suffix), "ab") as f:
+                f.truncate(capacity * width * np.dtype(dtype).itemsize)
+        lists = np.memmap(self.file("lists"), dtype=np.int32, mode="r+", shape=(capacity,))
+        lists[old:] = UNASSIGNED
+        lists.flush()
+        self.state = None
+
+    def load(self):
+        stamp = self.stamp()
+        if stamp != self.state:
+            offset = self.journal_size()
+            capacity = os.path.getsize(self.file("ids")) // 8
+            self.matrix = np.memmap(self.file("f32"), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            self.ids = np.memmap(self.file("ids"), dtype=np.int64, mode="r+", shape=(capacity,))
+            self.lists = np.memmap(self.file("lists"), dtype=np.int32, mode="r+", shape=(capacity,))
+            used = np.flatnonzero(self.ids)
+            self.size = int(used[-1]) + 1 if len(used) else 0
+            live = np.flatnonzero(self.ids[:self.size] > 0)
+            self.rows = dict(zip(self.ids[live].tolist(), live.tolist()))
+            self.centroids = np.load(self.file("centroids.npy")) if os.path.exists(self.file("centroids.npy")) else None
+            self.build_lists()
+            self.state, self.journal_offset = stamp, offset
+        self.replay()
+
+    def replay(self):
+        available = (self.journal_size() - self.journal_offset) // JOURNAL_RECORD.size
+        if available <= 0:
+            return
+        with open(self.file("journal"), "rb") as f:
+            f.seek(self.journal_offset)
+            data = f.read(available * JOURNAL_RECORD.size)
+        self.journal_offset += len(data)
+        changed = []
+        for row, piece_id in JOURNAL_RECORD.iter_unpack(data):
+            if piece_id > 0:
+                self.rows[piece_id] = row
+                self.size = max(self.size, row + 1)
+            else:
+                self.rows.pop(-piece_id, None)
+            changed.append(row)
+        self.unassigned = np.union1d(self.unassigned, changed)
+
+    def build_lists(self):
+        live = self.ids[:self.size] > 0
+        assigned = np.asarray(self.lists[:self.size])
+        order = np.flatnonzero(live & (assigned >= 0))
+        order = order[np.argsort(assigned[order], kind="stable")]
+        clusters = 0 if self.centroids is None else len(self.centroids)
+        self.offsets = np.searchsorted(assigned[order], np.arange(clusters + 1))
+        self.order = order
+        self.unassigned = np.flatnonzero(live & (assigned < 0))
+
+    def add(self, piece_id, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        with self.locked():
+            if not self.exists():
+                self.allocate(INITIAL_CAPACITY)
+            self.load()
+            row = self.rows.get(piece_id)
+            if row is None:
+                row = self.size
+                if row >= len(self.ids):
+                    self.allocate(2 * len(self.ids))
+                    self.load()
+            self.matrix[row] = vector
+            self.lists[row] = nearest(vector[None], self.centroids)[0] if self.centroids is not None else UNASSIGNED
+            self.ids[row] = piece_id
+            self.flush()
+            self.record(row, piece_id)
+
+    def remove(self, *piece_ids):
+        if not self.exists():
+            return
+        with self.locked():
+            self.load()
+            removed = [(self.rows[piece_id], piece_id) for piece_id in piece_ids if piece_id in self.rows]
+            for row, _ in removed:
+                self.ids[row] = REMOVED
+            if removed:
+                self.flush()
+            for row, piece_id in removed:
+                self.record(row, -piece_id)
+
+    def flush(self):
+        for array in (self.matrix, self.ids, self.lists):
+            array.flush()
+
+    def get(self, piece_id):
+        if not self.exists():
+            return None
+        self.load()
+        row = self.rows.get(piece_id)
+        return None if row is None else np.array(self.matrix[row])
+
+    def live_rows(self):
+        self.load()
+        return np.flatnonzero(self.ids[:self.size] > 0)
+
+    def candidates(self, vector, probes):
+        if self.centroids is None:
+            return self.live_rows()
+        best = top_k(self.centroids @ vector, probes)
+        rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in best] + [self.unassigned])
+        return np.unique(rows[self.ids[rows] > 0])
+
+    def rank(self, rows, vector, k, exclude):
+        if exclude:
+            rows = rows[~np.isin(self.ids[rows], list(exclude))]
+        scores = self.matrix[rows] @ vector
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top_k(scores, k)]
+
+    def search(self, vector, k=10, probes=None, exclude=()):
+        if not self.exists():
+            return []
+        self.load()
+        vector = np.asarray(vector, dtype=np.float32)
+        return self.rank(self.candidates(vector, probes or settings.VECTOR_INDEX_PROBES), vector, k, exclude)
+
+    def brute_force(self, vector, k=10, exclude=()):
+        if not self.exists():
+            return []
+        self.load()
+        return self.rank(self.live_rows(), np.asarray(vector, dtype=np.float32), k, exclude)
+
+    def train(self, clusters=None, iterations=10, sample=100000):
+        with self.locked():
+            self.load()
+            rows = self.live_rows()
+            clusters = min(clusters or max(1, int(np.sqrt(len(rows)))), len(rows))
+            if not clusters:
+                return 0
+            random = np.random.default_rng(0)
+            training = rows if len(rows) <= sample else random.choice(rows, sample, replace=False)
+            centroids = kmeans(np.asarray(self.matrix[training]), clusters, iterations)
+            self.lists[rows] = nearest(np.asarray(self.matrix[rows]), centroids)
+            np.save(self.file("centroids.npy"), centroids)
+            self.flush()
+            self.touch()
+            return clusters
+
+
+_stores = {}
+
+
+def vector_store():
+    path = settings.VECTOR_STORE_PATH
+    if path not in _stores:
+        _stores[path] = VectorStore(path)
+    return _stores[path]
@@ -0,0 +1,20 @@
+from django.db.models import Count, Q, Value
+
+from .models import Like, Bookmark
+from .sharding import group_by_shard
+
+EMPTY_STATE = {"is_liked": False, "liked_count": 0, "is_bookmarked": False, "bookmarked_count": 0}
+
+
+def viewer_state(user, piece_ids):
+    state = {pk: dict(EMPTY_STATE) for pk in piece_ids}
+    for alias, ids in group_by_shard(piece_ids).items():
+        rows = [
+            model.objects.using(alias).filter(target_id__in=ids).order_by()
+            .values("target_id").annotate(n=Count("pk"), mine=Count("pk", filter=Q(user=user)), kind=Value(kind))
+            for model, kind in ((Like, "liked"), (Bookmark, "bookmarked"))
+        ]
+        for row in rows[0].union(rows[1], all=True):
+            state[row["target_id"]]["is_" + row["kind"]] = bool(row["mine"])
+            state[row["target_id"]][row["kind"] + "_count"] = row["n"]
+    return state
@@ -1,28 +1,54 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView, View
-from django.http import JsonResponse
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse, reverse_lazy
+from django.views.generic import CreateView, DeleteView, DetailView, ListView, TemplateView, View
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import redirect, get_object_or_404
 
-from .forms import PieceForm, CommentForm
-from .models import Piece, Like, Bookmark, Comment
-from django.db.models import Q
+import base64
+import binascii
+import hashlib
+from urllib.parse import unquote
+
+from .forms import PieceForm, CommentForm, PieceFilterForm
+from .mixins import ConditionalGetMixin, EdgeShellMixin, FeedIndexPageMixin, KeysetPageMixin, ReplicaReadMixin, ViewerStateListMixin
+from .models import Piece, Like, Bookmark, Comment, Mention, PieceTag, Tag, Upload
+from .partitions import decode_cursor, encode_cursor
+from .ratelimit import RateLimitMixin
+from .search import ranked_ids
+from .shells import comment_field, punch_comment_actions, render_fragments, render_shell, shell_version
+from .audio import np
+from .autocomplete import USER, KINDS, autocomplete_index
+from .hashtags import tag_cloud, tag_count, tag_name
+from .storage import CHUNK_SIZE
+from .vectors import vector_store
+from .viewer import viewer_state
+from registration.models import Friendship
+from registration.summary import adjust_summary
+from notifications.counters import unread_count
+from notifications.events import record
+from notifications.models import Notification
 
 User = get_user_model()
 
 
-class HomeView(LoginRequiredMixin, ListView):
+class HomeView(LoginRequiredMixin, ReplicaReadMixin, ConditionalGetMixin, KeysetPageMixin, ListView):
     template_name = "comuse/home.html"
     model = Piece
-    queryset = model.objects.select_related("user").prefetch_related("likes", "bookmarks").order_by("-created_at")
+    queryset = model.objects.select_related("user").with_like_counts().filter(user__is_active=True).order_by("-created_at")
+
+    def get_etag_parts(self):
+        return [self.page_state(Piece.objects.filter(user__is_active=True))]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        likes = Like.objects.select_related("target").filter(user=self.request.user).values_list("target", flat=True)
-        bookmarks = Bookmark.objects.select_related("target").filter(user=self.request.user).values_list("target", flat=True)
-        context["user_like_list"] = likes
-        context["user_bookmark_list"] = bookmarks
+        context["user_like_list"] = Like.objects.target_ids(user=self.request.user)
+        context["user_bookmark_list"] = Bookmark.objects.target_ids(user=self.request.user)
         return context
 
 
@@ -36,19 +62,45 @@ class PieceCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class PieceDetailView(LoginRequiredMixin, DetailView):
+class PieceDetailView(LoginRequiredMixin, EdgeShellMixin, ConditionalGetMixin, DetailView):
     template_name = "comuse/detail.html"
     model = Piece
-    queryset = model.objects.select_related("user").prefetch_related("likes", "bookmarks", "comments")
+    queryset = model.objects.select_related("user").filter(user__is_active=True)
+    comment_page_size = 50
+
+    def get_etag_parts(self):
+        pk = self.kwargs["pk"]
+        self.viewer_state = viewer_state(self.request.user, [pk])[pk]
+        return [
+            Piece.objects.filter(pk=pk, user__is_active=True).values_list("analyzed_at").first(),
+            shell_version(pk),
+            self.viewer_state,
+        ]
+
+    def get_viewer_state_params(self):
+        return {"pieces": self.object.pk}
+
+    def get_comment_page(self):
+        comments = Comment.objects.select_related("user").filter(target=self.object, user__is_active=True)
+        page = comments.keyset_page(self.comment_page_size + 1, decode_cursor(self.request.GET.get("comments_before")))
+        return page[:self.comment_page_size], encode_cursor(page[self.comment_page_size - 1]) if len(page) > self.comment_page_size else None
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["is_liked"] = self.object.likes.filter(user=self.request.user, target_id=self.kwargs["pk"]).exists()
-        context["liked_count"] = self.object.likes.filter(target_id=self.kwargs["pk"]).count()
-        context["is_bookmarked"] = self.object.bookmarks.filter(user=self.request.user, target_id=self.kwargs["pk"]).exists()
-        context["bookmarked_count"] = self.object.bookmarks.filter(target_id=self.kwargs["pk"]).count()
-        context["comment_form"] = CommentForm
-        context["comment_list"] = self.object.comments.filter(target=self.object).order_by("-created_at")
+        if "comments_before" in self.request.GET:
+            context["shell"] = render_fragments(self.object, self.get_comment_page)
+        else:
+            context["shell"] = render_shell(self.object, self.get_comment_page)
+        if self.edge_shell:
+            self.viewer_state = viewer_state(None, [self.object.pk])[self.object.pk]
+            context["comments"] = punch_comment_actions(context["shell"]["comments"], self.object)
+        else:
+            context["comments"] = punch_comment_actions(context["shell"]["comments"], self.object, self.request.user)
+        context.update(self.viewer_state)
+        context["comment_field"] = comment_field()
+        self.object._liked_count = self.viewer_state["liked_count"]
+        context["user_like_list"] = {self.object.pk} if self.viewer_state["is_liked"] else set()
+        context["user_bookmark_list"] = {self.object.pk} if self.viewer_state["is_bookmarked"] else set()
         return context
 
 
@@ -67,49 +119,67 @@ class PieceDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user == self.object.user
 
 
-class LikeView(LoginRequiredMixin, View):
+class LikeView(LoginRequiredMixin, RateLimitMixin, View):
+    ratelimit_scope = "like"
+    ratelimit_json = True
+
     def post(self, request, *args, **kwargs):
         user = request.user
         piece = get_object_or_404(Piece, pk=kwargs["pk"])
-        Like.objects.get_or_create(target=piece, user=user)
-        likes_count = Like.objects.filter(target=piece).count()
+        _, created = Like.objects.for_target(piece.pk).get_or_create(target=piece, user=user)
+        if created:
+            adjust_summary(piece.user_id, likes_received=1)
+            record(Notification.LIKE, user, piece.user_id, piece.pk)
+        likes_count = Like.objects.for_target(piece.pk).count()
         context = {"liked_count": likes_count}
         return JsonResponse(context)
 
 
-class UnlikeView(LoginRequiredMixin, View):
+class UnlikeView(LoginRequiredMixin, RateLimitMixin, View):
+    ratelimit_scope = "like"
+    ratelimit_json = True
+
     def post(self, request, *args, **kwargs):
         user = request.user
         piece = get_object_or_404(Piece, pk=kwargs["pk"])
-        like = Like.objects.filter(target=piece, user=user)
-        like.delete()
-        likes_count = Like.objects.prefetch_related("target").filter(target=piece).count()
+        like = Like.objects.for_target(piece.pk).filter(user=user)
+        deleted, _ = like.delete()
+        if deleted:
+            adjust_summary(piece.user_id, likes_received=-deleted)
+        likes_count = Like.objects.for_target(piece.pk).count()
         context = {"liked_count": likes_count}
         return JsonResponse(context)
 
 
-class BookmarkView(LoginRequiredMixin, View):
+class BookmarkView(LoginRequiredMixin, RateLimitMixin, View):
+    ratelimit_scope = "bookmark"
+    ratelimit_json = True
+
     def post(self, request, *args, **kwargs):
         user = request.user
         piece = get_object_or_404(Piece, pk=kwargs["pk"])
-        Bookmark.objects.get_or_create(target=piece, user=user)
-        bookmarks_count = Bookmark.objects.filter(target=piece).count()
+        Bookmark.objects.for_target(piece.pk).get_or_create(target=piece, user=user)
+        bookmarks_count = Bookmark.objects.for_target(piece.pk).count()
         context = {"bookmarked_count": bookmarks_count}
         return JsonResponse(context)
 
 
-class DeleteBookmarkView(LoginRequiredMixin, View):
+class DeleteBookmarkView(LoginRequiredMixin, RateLimitMixin, View):
+    ratelimit_scope = "bookmark"
+    ratelimit_json = True
+
     def post(self, request, *args, **kwargs):
         user = request.user
         piece = get_object_or_404(Piece, pk=kwargs["pk"])
-        bookmark = Bookmark.objects.filter(target=piece, user=user)
+        bookmark = Bookmark.objects.for_target(piece.pk).filter(user=user)
         bookmark.delete()
-        bookmarks_count = Bookmark.objects.prefetch_related("target").filter(target=piece).count()
+        bookmarks_count = Bookmark.objects.for_target(piece.pk).count()
         context = {"bookmarked_count": bookmarks_count}
         return JsonResponse(context)
 
 
-class CommentView(LoginRequiredMixin, CreateView):
+class CommentView(LoginRequiredMixin, RateLimitMixin, CreateView):
+    ratelimit_scope = "comment"
     model = Comment
     form_class = CommentForm
 
@@ -120,6 +190,7 @@ class CommentView(LoginRequiredMixin, CreateView):
         comment = form.save(commit=False)
         comment.target = piece
         comment.save()
+        record(Notification.COMMENT, self.request.user, piece.user_id, piece.pk)
         return redirect("comuse:detail", pk=piece_pk)
 
 
@@ -138,16 +209,234 @@ class DeleteCommentView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return reverse_lazy("comuse:detail", kwargs={"pk": self.kwargs["pk"]})
 
 
-class SearchView(ListView):
+class SearchView(ReplicaReadMixin, ListView):
     template_name = "comuse/result.html"
-    model = Piece
-    
+    context_object_name = "piece_list"
+    paginate_by = 20
+
     def get_queryset(self):
-        result = super(SearchView, self).get_queryset()
-        query = self.request.GET.get("q")
-
-        if query:
-            result = Piece.objects.filter(Q(title__icontains=query) | Q(caption__icontains=query))
-        
-        return result
-    
\ No newline at end of file
+        self.filter_form = PieceFilterForm(self.request.GET)
+        return ranked_ids(self.request.GET.get("q"), self.filter_form)
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        found = Piece.objects.select_related("user").defer("search_text").filter(user__is_active=True).in_bulk(object_list)
+        page.object_list = [found[pk] for pk in object_list if pk in found]
+        self.viewer_state = viewer_state(self.request.user if self.request.user.is_authenticated else None, [piece.pk for piece in page.object_list])
+        for piece in page.object_list:
+            piece._liked_count = self.viewer_state[piece.pk]["liked_count"]
+        return paginator, page, page.object_list, is_paginated
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        state = self.viewer_state
+        query = self.request.GET.copy()
+        query.pop("page", None)
+        context["filter_form"] = self.filter_form
+        context["page_query"] = query.urlencode()
+        context["user_like_list"] = {pk for pk, values in state.items() if values["is_liked"]}
+        context["user_bookmark_list"] = {pk for pk, values in state.items() if values["is_bookmarked"]}
+        return context
+
+
+class SimilarPiecesView(LoginRequiredMixin, ReplicaReadMixin, ViewerStateListMixin, ListView):
+    template_name = "comuse/result.html"
+    context_object_name = "piece_list"
+    similar_count = 20
+
+    def get_queryset(self):
+        self.piece = get_object_or_404(Piece, pk=self.kwargs["pk"], user__is_active=True)
+        vector = vector_store().get(self.piece.pk) if np is not None else None
+        if vector is None:
+            return []
+        ranked = [pk for pk, _ in vector_store().search(vector, self.similar_count * 2, exclude=[self.piece.pk])]
+        found = Piece.objects.select_related("user").with_like_counts().filter(pk__in=ranked, user__is_active=True).in_bulk()
+        return [found[pk] for pk in ranked if pk in found][:self.similar_count]
+
+    def get_context_data(self, **kwargs):
+        kwargs["heading"] = "「%s」に似ている曲" % self.piece.title
+        return super().get_context_data(**kwargs)
+
+
+class TagPiecesView(LoginRequiredMixin, ReplicaReadMixin, ViewerStateListMixin, FeedIndexPageMixin, ListView):
+    template_name = "comuse/result.html"
+    context_object_name = "piece_list"
+
+    def get_queryset(self):
+        self.tag = get_object_or_404(Tag, name=tag_name(self.kwargs["name"]))
+        return PieceTag.objects.filter(tag=self.tag)
+
+    def get_context_data(self, **kwargs):
+        kwargs["heading"] = "#%s (%d件)" % (self.tag.name, tag_count(self.tag))
+        return super().get_context_data(**kwargs)
+
+
+class MentionListView(LoginRequiredMixin, ReplicaReadMixin, ViewerStateListMixin, FeedIndexPageMixin, ListView):
+    template_name = "comuse/result.html"
+    context_object_name = "piece_list"
+
+    def get_queryset(self):
+        return Mention.objects.filter(user=self.request.user)
+
+    def get_context_data(self, **kwargs):
+        kwargs["heading"] = "あなたへのメンション"
+        return super().get_context_data(**kwargs)
+
+
+class TagCloudView(LoginRequiredMixin, TemplateView):
+    template_name = "comuse/tags.html"
+
+    def get_context_data(self, **kwargs):
+        cloud = tag_cloud()
+        largest = max((count for _, count in cloud), default=1)
+        kwargs["tag_list"] = [(name, count, "%.2f" % (1 + count / largest)) for name, count in sorted(cloud)]
+        return super().get_context_data(**kwargs)
+
+
+class AutocompleteView(View):
+    max_length = 50
+
+    def get(self, request, *args, **kwargs):
+        results = autocomplete_index().search(request.GET.get("q", "")[:self.max_length])
+        for result in results:
+            if result["kind"] == KINDS[USER]:
+                result["url"] = reverse("registration:user_profile", kwargs={"username": result["label"]})
+            else:
+                result["url"] = reverse("comuse:detail", kwargs={"pk": result["id"]})
+        response = JsonResponse({"results": results})
+        response["Cache-Control"] = "max-age=30"
+        return response
+
+
+class ViewerStateView(LoginRequiredMixin, View):
+    max_items = 100
+
+    def get(self, request, *args, **kwargs):
+        piece_ids = [int(pk) for pk in request.GET.get("pieces", "").split(",") if pk.isdigit()][:self.max_items]
+        usernames = [name for name in request.GET.get("users", "").split(",") if name][:self.max_items]
+
+        user = request.user
+        following = set()
+        if usernames:
+            following = set(Friendship.objects.filter(follower=user, following__username__in=usernames).values_list("following__username", flat=True))
+
+        response = JsonResponse({
+            "viewer": {
+                "id": user.pk,
+                "csrf_token": get_token(request),
+                "unread_notification_count": unread_count(user.pk),
+                "links": {
+                    "timeline": reverse("registration:timeline", kwargs={"username": user.username}),
+                    "bookmarks": reverse("registration:bookmarkList", kwargs={"username": user.username}),
+                    "profile": reverse("registration:user_profile", kwargs={"username": user.username}),
+                },
+            },
+            "pieces": viewer_state(user, piece_ids),
+            "following": {name: name in following for name in usernames},
+        })
+        response["Cache-Control"] = "private, no-store"
+        return response
+
+
+class UploadCreateView(LoginRequiredMixin, View):
+    def post(self, request, *args, **kwargs):
+        try:
+            length = int(request.headers.get("Upload-Length", ""))
+        except ValueError:
+            return JsonResponse({"error": "Upload-Length が不正です。"}, status=400)
+        if length <= 0 or length > settings.CHUNKED_UPLOAD_MAX_LENGTH:
+            return JsonResponse({"error": "ファイルサイズが大きすぎます。"}, status=413)
+
+        upload = Upload(user=request.user, filename=unquote(request.headers.get("Upload-Filename", "")), length=length)
+        try:
+            upload.full_clean()
+        except ValidationError as e:
+            return JsonResponse({"error": e.message_dict}, status=400)
+        upload.save()
+        open(default_storage.staging_path(str(upload.pk)), "wb").close()
+
+        response = JsonResponse({"id": str(upload.pk), "offset": upload.offset}, status=201)
+        response["Location"] = reverse("comuse:upload_chunk", kwargs={"upload_pk": upload.pk})
+        response["Upload-Offset"] = upload.offset
+        return response
+
+
+class UploadChunkView(LoginRequiredMixin, View):
+    http_method_names = ["head", "patch", "delete"]
+
+    def get_upload(self):
+        return get_object_or_404(Upload, pk=self.kwargs["upload_pk"], user=self.request.user)
+
+    def head(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        response = HttpResponse()
+        response["Upload-Offset"] = upload.offset
+        response["Upload-Length"] = upload.length
+        response["Cache-Control"] = "no-store"
+        return response
+
+    def patch(self, request, *args, **kwargs):
+        with transaction.atomic():
+            upload = Upload.objects.select_for_update().filter(pk=self.kwargs["upload_pk"], user=request.user).first()
+            if upload is None:
+                return HttpResponse(status=404)
+            if request.headers.get("Upload-Offset") != str(upload.offset):
+                response = HttpResponse(status=409)
+                response["Upload-Offset"] = upload.offset
+                return response
+
+            checksum = request.headers.get("Upload-Checksum", "")
+            algorithm, _, expected = checksum.partition(" ")
+            if checksum:
+                try:
+                    expected = base64.b64decode(expected, validate=True)
+                except binascii.Error:
+                    return HttpResponse(status=400)
+                if algorithm != "sha256":
+                    return HttpResponse(status=400)
+
+            digest = hashlib.sha256()
+            written = 0
+            with open(default_storage.staging_path(str(upload.pk)), "r+b") as partial:
+                partial.seek(upload.offset)
+                for chunk in iter(lambda: request.read(CHUNK_SIZE), b""):
+                    written += len(chunk)
+                    if upload.offset + written > upload.length:
+                        partial.truncate(upload.offset)
+                        return HttpResponse(status=413)
+                    digest.update(chunk)
+                    partial.write(chunk)
+                if checksum and expected != digest.digest():
+                    partial.truncate(upload.offset)
+                    return HttpResponse(status=460)
+
+            upload.offset += written
+            upload.save(update_fields=["offset"])
+
+        response = HttpResponse(status=204)
+        response["Upload-Offset"] = upload.offset
+        return response
+
+    def delete(self, request, *args, **kwargs):
+        upload = self.get_upload()
+        default_storage.discard_staged(str(upload.pk))
+        upload.delete()
+        return HttpResponse(status=204)
+
+
+class UploadFinishView(LoginRequiredMixin, View):
+    def post(self, request, *args, **kwargs):
+        upload = get_object_or_404(Upload, pk=self.kwargs["upload_pk"], user=request.user)
+        if not upload.is_complete:
+            return JsonResponse({"offset": upload.offset, "length": upload.length}, status=409)
+
+        form = PieceForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({"error": form.errors}, status=400)
+
+        path = default_storage.staging_path(str(upload.pk))
+        form.instance.user = request.user
+        form.instance.uploadedFile.name = default_storage.save_staged(path, upload.filename, "audio/mpeg")
+        piece = form.save()
+        upload.delete()
+        return JsonResponse({"pk": piece.pk, "url": reverse("comuse:detail", kwargs={"pk": piece.pk})}, status=201)
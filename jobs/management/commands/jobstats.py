@@ -0,0 +1,21 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from jobs.queue import stats
+
+
+class Command(BaseCommand):
+    help = "Show per-task job counts and run times."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24)
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(hours=options["hours"])
+        for row in stats(since):
+            self.stdout.write(
+                "%-50s %-8s %6d  avg %8.1f ms  max %8.1f ms"
+                % (row["name"], row["status"], row["count"], (row["avg_duration"] or 0) * 1000, (row["max_duration"] or 0) * 1000)
+            )
@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+import socket
+import time
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+
+def work(worker_id, burst, sleep, max_jobs, verbosity):
+    if not apps.ready:
+        django.setup()
+    from jobs.queue import claim, perform, requeue_stale
+
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        close_old_connections()
+        job = claim(worker_id)
+        if job is None:
+            if burst:
+                break
+            requeue_stale()
+            time.sleep(sleep)
+            continue
+        perform(job)
+        processed += 1
+        if verbosity > 1:
+            print("%s %s %s in %.1f ms" % (worker_id, job, job.status, job.duration * 1000), flush=True)
+    return processed
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in one or more worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1)
+        parser.add_argument("--burst", action="store_true", help="Exit once the queue is empty.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--max-jobs", type=int, help="Exit each worker after this many jobs.")
+
+    def handle(self, *args, **options):
+        prefix = "%s:%d" % (socket.gethostname(), os.getpid())
+        worker_args = (options["burst"], options["sleep"], options["max_jobs"], options["verbosity"])
+        if options["processes"] <= 1:
+            processed = work(prefix, *worker_args)
+            self.stdout.write("Processed %d jobs." % processed)
+            return
+
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=work, args=("%s/%d" % (prefix, i), *worker_args), daemon=True)
+            for i in range(options["processes"])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,152 @@
+import datetime
+import signal
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Avg, Count, F, Max
+from django.utils import timezone
+
+from .models import Job
+
+CLAIM_CANDIDATES = 10
+STALE_GRACE = 60
+
+registry = {}
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def task(func=None, *, name=None, priority=0, max_attempts=None, timeout=None):
+    def register(func):
+        func.job_name = name or "%s.%s" % (func.__module__, func.__name__)
+        func.job_priority = priority
+        func.job_max_attempts = max_attempts or getattr(settings, "JOB_MAX_ATTEMPTS", 5)
+        func.job_timeout = timeout or getattr(settings, "JOB_TIMEOUT", None)
+        registry[func.job_name] = func
+        return func
+
+    if func is not None:
+        return register(func)
+    return register
+
+
+def enqueue(func, args=(), kwargs=None, priority=None, delay=None):
+    return Job.objects.create(
+        name=func.job_name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=func.job_priority if priority is None else priority,
+        max_attempts=func.job_max_attempts,
+        run_at=timezone.now() + datetime.timedelta(seconds=delay or 0),
+    )
+
+
+def retry_delay(attempts):
+    base = getattr(settings, "JOB_RETRY_BACKOFF", 5)
+    limit = getattr(settings, "JOB_RETRY_BACKOFF_MAX", 3600)
+    return min(base * 2 ** (attempts - 1), limit)
+
+
+def claim(worker_id):
+    now = timezone.now()
+    queryset = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by("-priority", "run_at", "pk")
+    claimed = {"status": Job.RUNNING, "locked_by": worker_id, "started_at": now}
+    if connections[router.db_for_write(Job)].features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queryset.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(attempts=F("attempts") + 1, **claimed)
+    else:
+        for pk in queryset.values_list("pk", flat=True)[:CLAIM_CANDIDATES]:
+            if Job.objects.filter(pk=pk, status=Job.QUEUED).update(attempts=F("attempts") + 1, **claimed):
+                break
+        else:
+            return None
+        job = Job(pk=pk)
+    job.refresh_from_db()
+    return job
+
+
+def stale_after(older_than=None):
+    longest = max((func.job_timeout or 0 for func in registry.values()), default=0)
+    return max(older_than or getattr(settings, "JOB_STALE_AFTER", 3600), longest + STALE_GRACE)
+
+
+def requeue_stale(older_than=None):
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, started_at__lt=now - datetime.timedelta(seconds=stale_after(older_than)))
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, locked_by="", finished_at=now, last_error="Worker stopped responding on the last attempt."
+    )
+    return stale.update(status=Job.QUEUED, locked_by="")
+
+
+@contextmanager
+def time_limit(seconds):
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise JobTimeout("Job exceeded %s seconds." % seconds)
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def perform(job):
+    started = time.monotonic()
+    try:
+        func = registry.get(job.name)
+        if func is None:
+            raise LookupError("No task registered as %r." % job.name)
+        with time_limit(func.job_timeout):
+            func(*job.args, **job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + datetime.timedelta(seconds=retry_delay(job.attempts))
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.duration = time.monotonic() - started
+    job.locked_by = ""
+    job.save(update_fields=["status", "run_at", "finished_at", "duration", "locked_by", "last_error"])
+    return job
+
+
+def run_pending(worker_id="inline", limit=None):
+    done = []
+    while limit is None or len(done) < limit:
+        job = claim(worker_id)
+        if job is None:
+            break
+        done.append(perform(job))
+    return done
+
+
+def stats(since=None):
+    queryset = Job.objects.all()
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return (
+        queryset.order_by("name", "status")
+        .values("name", "status")
+        .annotate(count=Count("pk"), avg_duration=Avg("duration"), max_duration=Max("duration"))
+    )
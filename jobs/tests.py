@@ -0,0 +1,116 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+import datetime
+import io
+
+from .models import Job
+from .queue import claim, enqueue, perform, requeue_stale, run_pending, task
+
+calls = []
+
+
+@task(name="jobs.tests.record")
+def record(value):
+    calls.append(value)
+
+
+@task(name="jobs.tests.slow", timeout=5400)
+def slow():
+    pass
+
+
+@task(name="jobs.tests.fail", max_attempts=2)
+def fail():
+    raise ValueError("boom")
+
+
+class TestQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        job = enqueue(record, ["a"])
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(len(run_pending()), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.duration)
+        self.assertEqual(calls, ["a"])
+
+    def test_priority_order(self):
+        enqueue(record, ["low"], priority=-1)
+        enqueue(record, ["high"], priority=10)
+        enqueue(record, ["normal"])
+        run_pending()
+        self.assertEqual(calls, ["high", "normal", "low"])
+
+    def test_delayed_job_waits(self):
+        enqueue(record, ["later"], delay=60)
+        self.assertEqual(run_pending(), [])
+        self.assertEqual(calls, [])
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        enqueue(record, ["once"])
+        self.assertIsNotNone(claim("worker-1"))
+        self.assertIsNone(claim("worker-2"))
+
+    @override_settings(JOB_RETRY_BACKOFF=10)
+    def test_retry_with_backoff_then_fail(self):
+        job = enqueue(fail)
+        before = timezone.now()
+        perform(claim("worker"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreaterEqual(job.run_at, before + datetime.timedelta(seconds=10))
+        self.assertIn("ValueError", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        perform(claim("worker"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_unknown_task_fails(self):
+        Job.objects.create(name="jobs.tests.missing", max_attempts=1)
+        job = run_pending()[0]
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("LookupError", job.last_error)
+
+    def test_requeue_stale(self):
+        job = enqueue(record, ["stale"])
+        claim("worker")
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertEqual(requeue_stale(3600), 1)
+        run_pending()
+        self.assertEqual(calls, ["stale"])
+
+    def test_stale_cutoff_outlasts_longest_timeout(self):
+        job = enqueue(record, ["running"])
+        claim("worker")
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(seconds=5400))
+        self.assertEqual(requeue_stale(3600), 0)
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(seconds=5400 + 120))
+        self.assertEqual(requeue_stale(3600), 1)
+
+    def test_stale_job_out_of_attempts_fails(self):
+        job = enqueue(fail)
+        Job.objects.filter(pk=job.pk).update(attempts=1)
+        claim("worker")
+        Job.objects.filter(pk=job.pk).update(started_at=timezone.now() - datetime.timedelta(hours=3))
+        self.assertEqual(requeue_stale(3600), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.locked_by, "")
+        self.assertIsNotNone(job.finished_at)
+
+    def test_runjobs_command(self):
+        enqueue(record, ["a"])
+        enqueue(record, ["b"])
+        out = io.StringIO()
+        call_command("runjobs", "--burst", stdout=out)
+        self.assertIn("Processed 2 jobs.", out.getvalue())
+        out = io.StringIO()
+        call_command("jobstats", stdout=out)
+        self.assertIn("jobs.tests.record", out.getvalue())
@@ -2,6 +2,9 @@
 ASGI config for myapp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+With WARMUP_ON_LOAD the URLconf, admin and templates are loaded here, so a
+server that imports this module before forking (gunicorn --preload) shares
+them across its workers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +12,14 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from myapp.startup import warm
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myapp.settings")
 
 application = get_asgi_application()
+
+if settings.WARMUP_ON_LOAD:
+    warm()
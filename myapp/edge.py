@@ -0,0 +1,171 @@
+"""
+A small shared-cache reverse proxy that stands in for a CDN/edge in front of
+the WSGI application, so cache hit rates can be measured locally.
+
+Anonymous responses are cached by their public Cache-Control. Requests with a
+session cookie may be served a page shell that the application marked with
+``Surrogate-Control``; the shell holds no per-viewer data, and each of its
+``<esi:include>`` tags is filled in per request from the application with the
+viewer's own cookies. A fragment that does not answer 200, such as a login
+redirect for an expired session, is returned in place of the page.
+
+Run it with ``python -m myapp.edge [port]``.
+"""
+
+import html
+import os
+import re
+import sys
+import threading
+import time
+from urllib.parse import unquote
+from wsgiref.simple_server import make_server
+
+MAX_AGE_RE = re.compile(r"(?:^|,)\s*(s-maxage|max-age)\s*=\s*(\d+)")
+ESI_INCLUDE_RE = re.compile(rb'<esi:include\s+src="([^"]+)"\s*/>')
+SURROGATE_CAPABILITY = 'edge="ESI/1.0"'
+
+
+def shared_ttl(cache_control):
+    directives = [d.strip().lower() for d in cache_control.split(",")]
+    if "public" not in directives or {"private", "no-store", "no-cache"} & set(directives):
+        return 0
+    ages = dict(MAX_AGE_RE.findall(cache_control.lower()))
+    return int(ages.get("s-maxage", ages.get("max-age", 0)))
+
+
+def surrogate_ttl(surrogate_control):
+    return int(dict(MAX_AGE_RE.findall(surrogate_control.lower())).get("max-age", 0))
+
+
+class EdgeCache:
+    def __init__(self, app, session_cookies=("sessionid",), bypass_cookies=("edge_bypass",)):
+        self.app = app
+        self.session_cookies = session_cookies
+        self.bypass_cookies = bypass_cookies
+        self.entries = {}
+        self.variants = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses + self.bypasses
+        return self.hits / total if total else 0.0
+
+    def cache_key(self, environ, vary):
+        values = tuple(environ.get("HTTP_" + header.upper().replace("-", "_"), "") for header in vary)
+        return environ["REQUEST_METHOD"], environ.get("PATH_INFO", ""), environ.get("QUERY_STRING", ""), values
+
+    def shell_key(self, environ):
+        return "shell", environ["REQUEST_METHOD"], environ.get("PATH_INFO", ""), environ.get("QUERY_STRING", "")
+
+    def has_cookie(self, environ, names):
+        cookies = environ.get("HTTP_COOKIE", "")
+        return any(name + "=" in cookies for name in names)
+
+    def fetch(self, environ):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured["status"], captured["headers"] = status, headers
+
+        body = b"".join(self.app(environ, capture))
+        return captured["status"], captured["headers"], body
+
+    def assemble(self, environ, status, headers, body):
+        parts, cookies, end = [], [], 0
+        for match in ESI_INCLUDE_RE.finditer(body):
+            path, _, query = html.unescape(match.group(1).decode()).partition("?")
+            fragment = self.fetch(dict(environ, REQUEST_METHOD="GET", PATH_INFO=unquote(path), QUERY_STRING=query))
+            if not fragment[0].startswith("200"):
+                return fragment
+            parts += [body[end:match.start()], fragment[2]]
+            cookies += [header for header in fragment[1] if header[0].lower() == "set-cookie"]
+            end = match.end()
+        body = b"".join(parts + [body[end:]])
+        headers = [header for header in headers if header[0].lower() not in ("content-length", "surrogate-control")]
+        return status, headers + cookies + [("Content-Length", str(len(body)))], body
+
+    def serve_shell(self, environ, start_response):
+        key = self.shell_key(environ)
+        with self.lock:
+            entry = self.entries.get(key)
+            fresh = entry and entry[0] > time.monotonic()
+            if fresh:
+                self.hits += 1
+        if fresh:
+            _, status, headers, body = entry
+            cache_status = "HIT"
+        else:
+            status, headers, body = self.fetch(environ)
+            names = dict((name.lower(), value) for name, value in headers)
+            surrogate_control = names.get("surrogate-control", "")
+            if "esi/1.0" not in surrogate_control.lower():
+                with self.lock:
+                    self.bypasses += 1
+                start_response(status, headers)
+                return [body]
+            ttl = surrogate_ttl(surrogate_control)
+            with self.lock:
+                self.misses += 1
+                if status.startswith("200") and ttl and "set-cookie" not in names:
+                    self.entries[key] = (time.monotonic() + ttl, status, headers, body)
+            cache_status = "MISS"
+        status, headers, body = self.assemble(environ, status, headers, body)
+        start_response(status, headers + [("X-Cache", cache_status)])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        if environ["REQUEST_METHOD"] not in ("GET", "HEAD") or self.has_cookie(environ, self.bypass_cookies):
+            with self.lock:
+                self.bypasses += 1
+            return self.app(environ, start_response)
+
+        environ["HTTP_SURROGATE_CAPABILITY"] = SURROGATE_CAPABILITY
+        if self.has_cookie(environ, self.session_cookies):
+            return self.serve_shell(environ, start_response)
+
+        resource = environ.get("PATH_INFO", ""), environ.get("QUERY_STRING", "")
+        with self.lock:
+            vary = self.variants.get(resource, ())
+            entry = self.entries.get(self.cache_key(environ, vary))
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                _, status, headers, body = entry
+                start_response(status, headers + [("X-Cache", "HIT")])
+                return [body]
+            self.misses += 1
+
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured["status"], captured["headers"] = status, headers
+            return start_response(status, headers + [("X-Cache", "MISS")], exc_info)
+
+        body = b"".join(self.app(environ, capture))
+        headers = dict((name.lower(), value) for name, value in captured["headers"])
+        ttl = shared_ttl(headers.get("cache-control", ""))
+        if captured["status"].startswith("200") and ttl and "set-cookie" not in headers:
+            vary = tuple(v.strip() for v in headers.get("vary", "").split(",") if v.strip())
+            with self.lock:
+                self.variants[resource] = vary
+                self.entries[self.cache_key(environ, vary)] = (time.monotonic() + ttl, captured["status"], captured["headers"], body)
+        return [body]
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myapp.settings")
+    from myapp.wsgi import application
+    from django.conf import settings
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    edge = EdgeCache(application, (settings.SESSION_COOKIE_NAME,), (settings.EDGE_BYPASS_COOKIE,))
+    with make_server("", port, edge) as server:
+        print("Edge cache stand-in on http://127.0.0.1:%d/ (Ctrl-C prints the hit rate)" % port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("hits=%d misses=%d bypasses=%d hit rate=%.1f%%" % (edge.hits, edge.misses, edge.bypasses, edge.hit_rate * 100))
@@ -0,0 +1,73 @@
+"""
+Primary/replica database routing for myapp.
+
+Reads made inside ``replica_reads()`` go to one of settings.DATABASE_REPLICAS.
+Every other query, and every write, uses the primary. A user who has just
+written is pinned to the primary for REPLICA_STICKY_SECONDS so that their
+next page shows their own change. For the same reason they carry the
+EDGE_BYPASS_COOKIE for EDGE_SHELL_TIMEOUT seconds, which makes the edge skip
+its cached page shells.
+"""
+
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+reading_from_replica = contextvars.ContextVar("reading_from_replica", default=False)
+
+
+def pin_key(user_id):
+    return "replica:pinned:%s" % user_id
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(pin_key(user_id), False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = reading_from_replica.set(enabled and bool(settings.DATABASE_REPLICAS))
+    try:
+        yield
+    finally:
+        reading_from_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if reading_from_replica.get():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, "user", None)
+        if request.method == "POST" and response.status_code < 400 and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+            response.set_cookie(settings.EDGE_BYPASS_COOKIE, "1", max_age=settings.EDGE_SHELL_TIMEOUT, httponly=True, samesite="Lax")
+        return response
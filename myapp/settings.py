@@ -11,9 +11,13 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
-from .settings_local import *
 import os
 
+try:
+    from .settings_local import *
+except ImportError:
+    pass
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -21,6 +25,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
+# SECURITY WARNING: keep the secret key used in production secret!
+if "DJANGO_SECRET_KEY" in os.environ:
+    SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -31,7 +38,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    "django.contrib.admin",
+    "django.contrib.admin.apps.SimpleAdminConfig",
     "django.contrib.auth",
     "django.contrib.contenttypes",
     "django.contrib.sessions",
@@ -40,7 +47,9 @@ INSTALLED_APPS = [
     "registration.apps.RegistrationConfig",
     "comuse.apps.ComuseConfig",
     "welcome.apps.WelcomeConfig",
-    "django_cleanup.apps.CleanupConfig",
+    "jobs.apps.JobsConfig",
+    "notifications.apps.NotificationsConfig",
+    "profiling.apps.ProfilingConfig",
 ]
 
 MIDDLEWARE = [
@@ -48,9 +57,11 @@ MIDDLEWARE = [
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "registration.middleware.CachedAuthenticationMiddleware",
+    "myapp.routers.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "profiling.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "myapp.urls"
@@ -66,6 +77,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "notifications.context_processors.unread_notifications",
             ],
         },
     },
@@ -81,9 +93,54 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db-replica.sqlite3",
+    },
+    "shard1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db-shard1.sqlite3",
+    },
 }
 
+DATABASE_ROUTERS = ["comuse.sharding.EngagementShardRouter", "myapp.routers.PrimaryReplicaRouter"]
+
+DATABASE_REPLICAS = []
+
+REPLICA_STICKY_SECONDS = 10
+
+ENGAGEMENT_SHARDS = ["default"]
+
+
+# Sessions and authentication
+# https://docs.djangoproject.com/en/5.0/topics/http/sessions/#using-cached-sessions
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+elif os.environ.get("MEMCACHED_LOCATION"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": os.environ["MEMCACHED_LOCATION"].split(","),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+
+AUTHENTICATION_BACKENDS = ["django.contrib.auth.backends.ModelBackend"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -121,6 +178,8 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -134,5 +193,77 @@ LOGIN_REDIRECT_URL = "comuse:home"
 
 LOGOUT_REDIRECT_URL = "welcome:index"
 
+STORAGES = {
+    "default": {
+        "BACKEND": "comuse.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG else "comuse.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+UPLOAD_STAGING_ROOT = os.path.join(BASE_DIR, "var", "staging")
+UPLOAD_EXPIRE_AFTER = 60 * 60 * 24
+
+CHUNKED_UPLOAD_MAX_LENGTH = 200 * 1024 * 1024
+
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 5
+JOB_RETRY_BACKOFF_MAX = 3600
+JOB_TIMEOUT = 300
+JOB_STALE_AFTER = 3600
+
+NOTIFICATION_BUCKET_SECONDS = 60 * 60
+NOTIFICATION_BATCH_SIZE = 200
+NOTIFICATION_RECENT_ACTORS = 20
+NOTIFICATION_FLUSH_INTERVAL = 5
+NOTIFICATION_EVENT_TIMEOUT = 60 * 60 * 24
+NOTIFICATION_UNREAD_TIMEOUT = 60 * 60 * 24
+
+RATELIMIT_CACHE = "default"
+RATELIMITS = {
+    "like": "60/m",
+    "bookmark": "60/m",
+    "comment": "10/m",
+    "follow": "30/m",
+}
+
+HOT_PARTITION_MONTHS = 3
+
+PROFILE_SUMMARY_LATEST = 12
+PROFILE_SUMMARY_TIMEOUT = 60 * 60
+
+DETAIL_SHELL_TIMEOUT = 60 * 10
+
+EDGE_SHELL_TIMEOUT = 60
+EDGE_BYPASS_COOKIE = "edge_bypass"
+
+FFMPEG_BINARY = "ffmpeg"
+AUDIO_CHUNK_SECONDS = 10
+
+VECTOR_STORE_PATH = BASE_DIR / "var" / "embeddings"
+VECTOR_INDEX_PROBES = 8
+
+AUTOCOMPLETE_PATH = BASE_DIR / "var" / "autocomplete"
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_TOP = 32
+AUTOCOMPLETE_HEAVY_PREFIX = 256
+AUTOCOMPLETE_JOURNAL_LIMIT = 1000
+
+SEARCH_CACHE_TIMEOUT = 60 * 5
+SEARCH_CACHE_MAX_RESULTS = 1000
+
+TAG_CLOUD_SIZE = 50
+TAG_COUNT_TIMEOUT = 60 * 10
+
+PROFILING_SAMPLE_RATES = {}
+PROFILING_HEADER = "X-Profile"
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+PROFILING_INTERVAL = 0.005
+PROFILING_QUERY_LIMIT = 30
+PROFILING_RETENTION_DAYS = 14
+
+WARMUP_ON_LOAD = not DEBUG
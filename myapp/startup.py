@@ -0,0 +1,61 @@
+"""
+Startup helpers for myapp.
+
+lazy_import() returns a module whose body only runs on first attribute
+access, so optional heavy dependencies cost nothing for processes that
+never touch them. warm() does the work a worker would otherwise do on its
+first requests: it loads the URLconf, registers the admin, compiles every
+template into the cached loader and resolves lazy modules. Call it before
+forking so that workers share the result.
+"""
+
+import importlib.util
+import os
+import sys
+import time
+
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import get_resolver
+
+lazy_modules = []
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    lazy_modules.append(module)
+    return module
+
+
+def template_names(engine):
+    for directory in engine.template_dirs:
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                yield os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, "/")
+
+
+def warm():
+    started = time.perf_counter()
+    resolver = get_resolver()
+    resolver.reverse_dict
+    for module in lazy_modules:
+        module.__file__
+    templates = 0
+    for engine in engines.all():
+        for name in dict.fromkeys(template_names(engine)):
+            try:
+                engine.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError):
+                continue
+            templates += 1
+    connections.close_all()
+    return {"templates": templates, "seconds": time.perf_counter() - started}
@@ -0,0 +1,32 @@
+"""
+Test helpers for myapp.
+
+IsolatedStorageMixin gives each test its own temporary directory and points
+every setting that names a place on disk into it: uploaded media, the upload
+staging area, collected static files, the autocomplete index and the vector
+store. The directory is removed when the test finishes, so tests never write
+into var/ or media/ and never see each other's files. Subclasses that define
+setUp() must call super().setUp() first; the directory is self.tmp_dir.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+
+class IsolatedStorageMixin:
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp_dir, "media"),
+            UPLOAD_STAGING_ROOT=os.path.join(self.tmp_dir, "staging"),
+            STATIC_ROOT=os.path.join(self.tmp_dir, "static"),
+            AUTOCOMPLETE_PATH=os.path.join(self.tmp_dir, "autocomplete"),
+            VECTOR_STORE_PATH=os.path.join(self.tmp_dir, "vectors"),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        super().setUp()
@@ -3,13 +3,17 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from comuse.storage import serve_compressed, serve_immutable
+
+admin.autodiscover()
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("registration/", include("registration.urls")),
     path("comuse/", include("comuse.urls")),
+    path("notifications/", include("notifications.urls")),
     path("", include("welcome.urls")),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += static(settings.MEDIA_URL, view=serve_immutable, document_root=settings.MEDIA_ROOT)
+urlpatterns += static(settings.STATIC_URL, view=serve_compressed, document_root=settings.STATIC_ROOT)
@@ -2,6 +2,9 @@
 WSGI config for myapp project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+With WARMUP_ON_LOAD the URLconf, admin and templates are loaded here, so a
+server that imports this module before forking (gunicorn --preload) shares
+them across its workers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
@@ -9,8 +12,14 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
+from myapp.startup import warm
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myapp.settings")
 
 application = get_wsgi_application()
+
+if settings.WARMUP_ON_LOAD:
+    warm()
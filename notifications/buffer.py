@@ -0,0 +1,70 @@
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+SEQUENCE_KEY = "notifications:events:sequence"
+CURSOR_KEY = "notifications:events:cursor"
+SCHEDULED_KEY = "notifications:events:scheduled"
+
+Event = namedtuple("Event", ["verb", "actor_id", "recipient_id", "piece_id", "at"])
+
+
+def event_key(seq):
+    return "notifications:events:%d" % seq
+
+
+def missing_key(seq):
+    return "notifications:events:missing:%d" % seq
+
+
+def push(event):
+    try:
+        seq = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, None)
+        seq = cache.incr(SEQUENCE_KEY)
+    cache.set(event_key(seq), tuple(event), settings.NOTIFICATION_EVENT_TIMEOUT)
+
+
+def abandoned(seq):
+    now = time.time()
+    cache.add(missing_key(seq), now, settings.NOTIFICATION_EVENT_TIMEOUT)
+    return now - cache.get(missing_key(seq), now) > settings.NOTIFICATION_FLUSH_INTERVAL
+
+
+def pending(limit):
+    cursor = cache.get(CURSOR_KEY, 0)
+    last = cache.get(SEQUENCE_KEY, 0)
+    if last < cursor:
+        cursor = 0
+    seqs = range(cursor + 1, min(last, cursor + limit) + 1)
+    found = cache.get_many([event_key(seq) for seq in seqs])
+    events = []
+    for seq in seqs:
+        event = found.get(event_key(seq))
+        if event is None and not abandoned(seq):
+            break
+        if event is not None:
+            events.append(Event(*event))
+        cursor = seq
+    return events, cursor
+
+
+def consume(cursor):
+    previous = cache.get(CURSOR_KEY, 0)
+    cache.set(CURSOR_KEY, cursor, None)
+    cache.delete_many([event_key(seq) for seq in range(previous + 1, cursor + 1)])
+
+
+def has_pending():
+    return cache.get(SEQUENCE_KEY, 0) != cache.get(CURSOR_KEY, 0)
+
+
+def claim_delivery():
+    return cache.add(SCHEDULED_KEY, True, settings.JOB_STALE_AFTER)
+
+
+def release_delivery():
+    cache.delete(SCHEDULED_KEY)
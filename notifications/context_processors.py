@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
+from .counters import unread_count
+
+
+def unread_notifications(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {"unread_notification_count": SimpleLazyObject(lambda: unread_count(user.pk))}
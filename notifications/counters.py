@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Notification
+
+
+def unread_key(user_id):
+    return "notifications:unread:%s" % user_id
+
+
+def unread_count(user_id):
+    key = unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.add(key, count, settings.NOTIFICATION_UNREAD_TIMEOUT)
+    return count
+
+
+def increment_unread(counts):
+    for user_id, delta in counts.items():
+        try:
+            cache.incr(unread_key(user_id), delta)
+        except ValueError:
+            pass
+
+
+def mark_all_read(user_id):
+    Notification.objects.filter(recipient_id=user_id, is_read=False).update(is_read=True)
+    cache.set(unread_key(user_id), 0, settings.NOTIFICATION_UNREAD_TIMEOUT)
@@ -0,0 +1,21 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from jobs.queue import enqueue
+from . import buffer
+from .tasks import deliver
+
+
+def add_event(verb, actor_id, recipient_id, piece_id, at):
+    buffer.push(buffer.Event(verb, actor_id, recipient_id, piece_id, at))
+    if buffer.claim_delivery():
+        enqueue(deliver, delay=settings.NOTIFICATION_FLUSH_INTERVAL)
+
+
+def record(verb, actor, recipient_id, piece_id=None):
+    if actor.pk == recipient_id:
+        return
+    at = time.time()
+    transaction.on_commit(lambda: add_event(verb, actor.pk, recipient_id, piece_id, at))
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "verb",
+                    models.CharField(
+                        choices=[
+                            ("like", "いいね"),
+                            ("comment", "コメント"),
+                            ("follow", "フォロー"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("actor_id", models.BigIntegerField()),
+                ("recipient_id", models.BigIntegerField()),
+                ("piece_id", models.BigIntegerField(blank=True, null=True)),
+                ("at", models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="actor_ids",
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.0.7 on 2026-10-19 15:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0002_durable_events"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="PendingEvent",
+        ),
+    ]
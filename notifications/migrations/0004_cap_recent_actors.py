@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-19 15:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0003_buffer_events_in_cache"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="notification",
+            old_name="actor_ids",
+            new_name="recent_actor_ids",
+        ),
+    ]
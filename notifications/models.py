@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import models
+
+
+class Notification(models.Model):
+    LIKE = "like"
+    COMMENT = "comment"
+    FOLLOW = "follow"
+    VERB_CHOICES = [
+        (LIKE, "いいね"),
+        (COMMENT, "コメント"),
+        (FOLLOW, "フォロー"),
+    ]
+
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="notifications", on_delete=models.CASCADE)
+    verb = models.CharField(max_length=10, choices=VERB_CHOICES)
+    piece = models.ForeignKey("comuse.Piece", related_name="notifications", blank=True, null=True, on_delete=models.CASCADE)
+    bucket = models.DateTimeField()
+    actor_count = models.PositiveIntegerField(default=0)
+    recent_actor_ids = models.JSONField(default=list)
+    last_actor = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", blank=True, null=True, on_delete=models.SET_NULL)
+    is_read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["recipient", "verb", "piece", "bucket"], name="notification_unique"),
+            models.UniqueConstraint(
+                fields=["recipient", "verb", "bucket"], condition=models.Q(piece__isnull=True), name="notification_unique_without_piece"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["recipient", "-updated_at", "-id"], name="notification_feed_idx"),
+        ]
+
+    def __str__(self):
+        return "%s: %s x%d" % (self.recipient_id, self.verb, self.actor_count)
+
+    @property
+    def others_count(self):
+        return self.actor_count - 1
+
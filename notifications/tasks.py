@@ -0,0 +1,85 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from comuse.models import Piece
+from jobs.queue import enqueue, task
+from . import buffer
+from .counters import increment_unread
+from .models import Notification
+
+User = get_user_model()
+
+
+def bucket_start(at):
+    size = settings.NOTIFICATION_BUCKET_SECONDS
+    return datetime.datetime.fromtimestamp(at - at % size, tz=datetime.timezone.utc)
+
+
+def group_events(events):
+    groups = {}
+    for event in events:
+        actors = groups.setdefault((event.recipient_id, event.verb, event.piece_id, bucket_start(event.at)), {})
+        actors.pop(event.actor_id, None)
+        actors[event.actor_id] = event.at
+    return groups
+
+
+def deliverable(events):
+    user_ids = {event.recipient_id for event in events} | {event.actor_id for event in events}
+    users = set(User.objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+    pieces = set(Piece.objects.filter(pk__in={event.piece_id for event in events if event.piece_id}).values_list("pk", flat=True))
+    return [
+        event for event in events
+        if event.recipient_id in users and event.actor_id in users and (event.piece_id is None or event.piece_id in pieces)
+    ]
+
+
+def write_notifications(events):
+    groups = group_events(deliverable(events))
+    now = timezone.now()
+    unread = {}
+    with transaction.atomic():
+        existing = Notification.objects.select_for_update().filter(
+            recipient_id__in={key[0] for key in groups},
+            bucket__in={key[3] for key in groups},
+        )
+        existing = {(n.recipient_id, n.verb, n.piece_id, n.bucket): n for n in existing}
+        created, updated = [], []
+        for key, actors in groups.items():
+            recipient_id, verb, piece_id, bucket = key
+            notification = existing.get(key)
+            if notification is None:
+                notification = Notification(recipient_id=recipient_id, verb=verb, piece_id=piece_id, bucket=bucket)
+                created.append(notification)
+            else:
+                updated.append(notification)
+            if notification.pk is None or notification.is_read:
+                unread[recipient_id] = unread.get(recipient_id, 0) + 1
+            known = set(notification.recent_actor_ids)
+            notification.actor_count += sum(1 for actor_id in actors if actor_id not in known)
+            recent = [actor_id for actor_id in notification.recent_actor_ids if actor_id not in actors] + list(actors)
+            notification.recent_actor_ids = recent[-settings.NOTIFICATION_RECENT_ACTORS:]
+            notification.last_actor_id = next(reversed(actors))
+            notification.is_read = False
+            notification.updated_at = now
+        Notification.objects.bulk_create(created)
+        Notification.objects.bulk_update(updated, ["actor_count", "recent_actor_ids", "last_actor", "is_read", "updated_at"])
+        transaction.on_commit(lambda: increment_unread(unread))
+
+
+@task(priority=5)
+def deliver():
+    events, cursor = buffer.pending(settings.NOTIFICATION_BATCH_SIZE)
+    if events:
+        write_notifications(events)
+    buffer.consume(cursor)
+    if buffer.has_pending():
+        enqueue(deliver, delay=0 if len(events) == settings.NOTIFICATION_BATCH_SIZE else settings.NOTIFICATION_FLUSH_INTERVAL)
+        return
+    buffer.release_delivery()
+    if buffer.has_pending() and buffer.claim_delivery():
+        enqueue(deliver, delay=settings.NOTIFICATION_FLUSH_INTERVAL)
@@ -0,0 +1,211 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
+import datetime
+import time
+
+from comuse.models import Piece
+from comuse.partitions import encode_cursor
+from jobs.models import Job
+from jobs.queue import run_pending
+
+from . import buffer
+from .counters import unread_count
+from .events import add_event
+from .models import Notification
+
+User = get_user_model()
+
+
+class NotificationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        Job.objects.all().delete()
+        self.owner = User.objects.create_user(username="owner", password="password")
+        self.piece = Piece.objects.create(user=self.owner, title="song", caption="post")
+        self.fans = [User.objects.create_user(username="fan%d" % i, password="password") for i in range(3)]
+
+    def like_as(self, user):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("comuse:like", kwargs={"pk": self.piece.pk}))
+
+    def unlike_as(self, user):
+        self.client.force_login(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("comuse:unlike", kwargs={"pk": self.piece.pk}))
+
+    def deliver(self):
+        Job.objects.update(run_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending()
+
+
+class TestFanOut(NotificationTestCase):
+    def test_likes_are_aggregated(self):
+        for fan in self.fans:
+            self.like_as(fan)
+        self.assertFalse(Notification.objects.exists())
+        self.deliver()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.recipient, self.owner)
+        self.assertEqual(notification.verb, Notification.LIKE)
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.last_actor, self.fans[-1])
+        self.assertEqual(Job.objects.filter(name="notifications.tasks.deliver").count(), 1)
+
+    def test_later_batch_joins_bucket(self):
+        self.like_as(self.fans[0])
+        self.deliver()
+        self.like_as(self.fans[1])
+        self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+
+    def test_own_actions_are_not_notified(self):
+        self.like_as(self.owner)
+        self.deliver()
+        self.assertFalse(Notification.objects.exists())
+
+    def test_comment_and_follow(self):
+        self.client.force_login(self.fans[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("comuse:comment", kwargs={"pk": self.piece.pk}), {"content": "nice"})
+            self.client.post(reverse("registration:follow", kwargs={"username": self.owner.username}))
+        self.deliver()
+        self.assertEqual(set(Notification.objects.values_list("verb", flat=True)), {Notification.COMMENT, Notification.FOLLOW})
+
+    def test_events_are_buffered_until_delivered(self):
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[1])
+        events, _ = buffer.pending(10)
+        self.assertEqual([event.actor_id for event in events], [self.fans[0].pk, self.fans[1].pk])
+        self.assertTrue(Job.objects.get().run_at > timezone.now())
+        self.deliver()
+        self.assertFalse(buffer.has_pending())
+
+    def test_buffering_needs_no_queries_once_delivery_is_scheduled(self):
+        add_event(Notification.LIKE, self.fans[0].pk, self.owner.pk, self.piece.pk, time.time())
+        with self.assertNumQueries(0):
+            for fan in self.fans[1:]:
+                add_event(Notification.LIKE, fan.pk, self.owner.pk, self.piece.pk, time.time())
+        self.assertEqual(Job.objects.count(), 1)
+        self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 3)
+
+    def test_delivery_waits_for_an_event_still_being_written(self):
+        self.like_as(self.fans[0])
+        cache.incr(buffer.SEQUENCE_KEY)
+        self.like_as(self.fans[1])
+        self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 1)
+        self.assertTrue(buffer.has_pending())
+        with mock.patch("notifications.buffer.time.time", return_value=time.time() + 60):
+            self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+        self.assertFalse(buffer.has_pending())
+
+    @override_settings(NOTIFICATION_BATCH_SIZE=2)
+    def test_backlog_is_delivered_in_batches(self):
+        for fan in self.fans:
+            self.like_as(fan)
+        self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 3)
+        self.assertEqual(Job.objects.filter(name="notifications.tasks.deliver", status=Job.DONE).count(), 2)
+
+    def test_repeat_actors_are_counted_once(self):
+        self.like_as(self.fans[0])
+        self.unlike_as(self.fans[0])
+        self.like_as(self.fans[0])
+        self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 1)
+        self.unlike_as(self.fans[0])
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[1])
+        self.deliver()
+        self.assertEqual(Notification.objects.get().actor_count, 2)
+
+    @override_settings(NOTIFICATION_RECENT_ACTORS=2)
+    def test_only_recent_actors_are_kept(self):
+        for fan in self.fans:
+            self.like_as(fan)
+            self.deliver()
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.recent_actor_ids, [self.fans[1].pk, self.fans[2].pk])
+        self.unlike_as(self.fans[1])
+        self.like_as(self.fans[1])
+        self.deliver()
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.recent_actor_ids, [self.fans[2].pk, self.fans[1].pk])
+
+    def test_deleted_targets_are_skipped(self):
+        self.like_as(self.fans[0])
+        self.client.force_login(self.fans[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("registration:follow", kwargs={"username": self.owner.username}))
+        self.piece.delete()
+        self.deliver()
+        self.assertEqual(list(Notification.objects.values_list("verb", flat=True)), [Notification.FOLLOW])
+        self.assertFalse(buffer.has_pending())
+
+
+class TestUnreadCount(NotificationTestCase):
+    def test_cached_counter(self):
+        self.assertEqual(unread_count(self.owner.pk), 0)
+        self.like_as(self.fans[0])
+        self.deliver()
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.owner.pk), 1)
+
+        self.client.force_login(self.owner)
+        self.client.post(reverse("notifications:read"))
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.owner.pk), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    def test_read_notification_becomes_unread_again(self):
+        self.like_as(self.fans[0])
+        self.deliver()
+        self.client.force_login(self.owner)
+        self.client.post(reverse("notifications:read"))
+        self.like_as(self.fans[1])
+        self.deliver()
+        self.assertEqual(unread_count(self.owner.pk), 1)
+
+
+class TestNotificationListView(NotificationTestCase):
+    def setUp(self):
+        super().setUp()
+        now = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self.notifications = [
+            Notification.objects.create(
+                recipient=self.owner, verb=Notification.LIKE, piece=self.piece, bucket=now - datetime.timedelta(hours=i),
+                actor_count=1, last_actor=self.fans[0], updated_at=now - datetime.timedelta(hours=i // 2),
+            )
+            for i in range(25)
+        ]
+        self.client.force_login(self.owner)
+        self.url = reverse("notifications:list")
+
+    def test_keyset_pagination(self):
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, "notifications/list.html")
+        first_page = list(response.context["notification_list"])
+        self.assertEqual(len(first_page), 20)
+        self.assertEqual(response.context["next_cursor"], encode_cursor(first_page[-1], "updated_at"))
+
+        response = self.client.get(self.url, {"before": response.context["next_cursor"]})
+        second_page = list(response.context["notification_list"])
+        self.assertEqual(len(second_page), 5)
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertCountEqual(first_page + second_page, self.notifications)
+
+    def test_only_own_notifications(self):
+        self.client.force_login(self.fans[0])
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["notification_list"]), [])
@@ -0,0 +1,38 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.views.generic import ListView, View
+
+from comuse.partitions import decode_cursor, encode_cursor
+from .counters import mark_all_read
+from .models import Notification
+
+
+class NotificationListView(LoginRequiredMixin, ListView):
+    template_name = "notifications/list.html"
+    context_object_name = "notification_list"
+    page_size = 20
+
+    def get_queryset(self):
+        queryset = (
+            Notification.objects.filter(recipient=self.request.user)
+            .select_related("piece", "last_actor")
+            .order_by("-updated_at", "-pk")
+        )
+        cursor = decode_cursor(self.request.GET.get("before"))
+        if cursor is not None:
+            updated_at, pk = cursor
+            queryset = queryset.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, pk__lt=pk))
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        page = list(self.object_list[:self.page_size + 1])
+        kwargs["object_list"] = page[:self.page_size]
+        kwargs["next_cursor"] = encode_cursor(page[self.page_size - 1], "updated_at") if len(page) > self.page_size else None
+        return super().get_context_data(**kwargs)
+
+
+class NotificationReadView(LoginRequiredMixin, View):
+    def post(self, request, *args, **kwargs):
+        mark_all_read(request.user.pk)
+        return redirect("notifications:list")
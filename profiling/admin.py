@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.contrib import admin
+from django.http import HttpResponse
+from django.utils.html import format_html, format_html_join
+
+from .models import ProfiledRequest
+
+
+@admin.register(ProfiledRequest)
+class ProfiledRequestAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "view_name", "path", "duration_ms", "cpu_ms", "query_count", "query_ms", "status_code", "trigger")
+    list_filter = ("view_name", "trigger", "status_code")
+    search_fields = ("path",)
+    date_hierarchy = "created_at"
+    ordering = ("-duration",)
+    actions = ["download_stacks"]
+    fields = (
+        "created_at", "view_name", "method", "path", "status_code", "trigger", "user_id",
+        "duration_ms", "cpu_ms", "query_count", "query_ms", "sample_count", "query_table", "template_table",
+    )
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("stacks")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="duration (ms)", ordering="duration")
+    def duration_ms(self, obj):
+        return "%.1f" % (obj.duration * 1000)
+
+    @admin.display(description="CPU (ms)", ordering="cpu_time")
+    def cpu_ms(self, obj):
+        return "%.1f" % (obj.cpu_time * 1000)
+
+    @admin.display(description="SQL (ms)", ordering="query_time")
+    def query_ms(self, obj):
+        return "%.1f" % (obj.query_time * 1000)
+
+    @admin.display(description="SQL")
+    def query_table(self, obj):
+        rows = format_html_join(
+            "", "<tr><td>{}</td><td>{}</td><td>{}</td><td><code>{}</code></td></tr>",
+            ((query["count"], "%.2f" % (query["time"] * 1000), query["alias"], query["sql"]) for query in obj.queries),
+        )
+        return format_html("<table><tr><th>count</th><th>ms</th><th>db</th><th>statement</th></tr>{}</table>", rows)
+
+    @admin.display(description="templates")
+    def template_table(self, obj):
+        rows = format_html_join(
+            "", "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>",
+            ((entry["name"], entry["count"], "%.2f" % (entry["exclusive"] * 1000), "%.2f" % (entry["inclusive"] * 1000)) for entry in obj.templates),
+        )
+        return format_html("<table><tr><th>template</th><th>renders</th><th>self ms</th><th>total ms</th></tr>{}</table>", rows)
+
+    @admin.action(description="Download collapsed stacks for a flame graph")
+    def download_stacks(self, request, queryset):
+        merged = Counter()
+        for stacks in queryset.values_list("stacks", flat=True):
+            for line in stacks.splitlines():
+                stack, _, count = line.rpartition(" ")
+                merged[stack] += int(count)
+        response = HttpResponse("".join("%s %d\n" % item for item in merged.most_common()), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="profile.folded"'
+        return response
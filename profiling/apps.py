@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ProfilingConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "profiling"
+
+    def ready(self):
+        from .profiler import instrument_templates
+        instrument_templates()
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profiling.profiler import profile_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed header value that forces profiling of the requests carrying it."
+
+    def handle(self, *args, **options):
+        self.stdout.write("%s: %s" % (settings.PROFILING_HEADER, profile_token()))
+        self.stdout.write("Valid for %d seconds." % settings.PROFILING_TOKEN_MAX_AGE)
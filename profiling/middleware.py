@@ -0,0 +1,62 @@
+import datetime
+import random
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ProfiledRequest
+from .profiler import Profile, valid_token
+
+PRUNE_EVERY = 100
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        profile = getattr(request, "_profile", None)
+        if profile is not None:
+            profile.stop()
+            response["X-Profile-Id"] = self.store(request, response, profile).pk
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trigger = self.trigger(request)
+        if trigger is not None:
+            request._profile = Profile(trigger)
+            request._profile.start()
+
+    def trigger(self, request):
+        token = request.headers.get(settings.PROFILING_HEADER)
+        if token and valid_token(token):
+            return ProfiledRequest.HEADER
+        rates = settings.PROFILING_SAMPLE_RATES
+        rate = rates.get(request.resolver_match.view_name, rates.get("*", 0))
+        if rate and random.random() < rate:
+            return ProfiledRequest.SAMPLED
+        return None
+
+    def store(self, request, response, profile):
+        user = getattr(request, "user", None)
+        profiled = ProfiledRequest.objects.create(
+            view_name=request.resolver_match.view_name,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            status_code=response.status_code,
+            trigger=profile.trigger,
+            user_id=user.pk if user is not None and user.is_authenticated else None,
+            duration=profile.duration,
+            cpu_time=profile.cpu_time,
+            query_count=len(profile.queries),
+            query_time=sum(elapsed for _, _, elapsed in profile.queries),
+            queries=profile.query_summary(),
+            templates=profile.template_summary(),
+            sample_count=sum(profile.sampler.stacks.values()),
+            stacks=profile.collapsed_stacks(),
+        )
+        if profiled.pk % PRUNE_EVERY == 0:
+            cutoff = timezone.now() - datetime.timedelta(days=settings.PROFILING_RETENTION_DAYS)
+            ProfiledRequest.objects.filter(created_at__lt=cutoff).delete()
+        return profiled
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfiledRequest",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("view_name", models.CharField(max_length=200)),
+                ("method", models.CharField(max_length=10)),
+                ("path", models.CharField(max_length=500)),
+                ("status_code", models.PositiveSmallIntegerField()),
+                (
+                    "trigger",
+                    models.CharField(
+                        choices=[("sampled", "sampled"), ("header", "header")],
+                        max_length=10,
+                    ),
+                ),
+                ("user_id", models.IntegerField(blank=True, null=True)),
+                ("duration", models.FloatField()),
+                ("cpu_time", models.FloatField()),
+                ("query_count", models.PositiveIntegerField()),
+                ("query_time", models.FloatField()),
+                ("queries", models.JSONField(blank=True, default=list)),
+                ("templates", models.JSONField(blank=True, default=list)),
+                ("sample_count", models.PositiveIntegerField()),
+                ("stacks", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-duration"], name="profiled_duration_idx"),
+                    models.Index(
+                        fields=["view_name", "-duration"],
+                        name="profiled_view_duration_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
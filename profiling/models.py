@@ -0,0 +1,35 @@
+from django.db import models
+
+
+class ProfiledRequest(models.Model):
+    SAMPLED = "sampled"
+    HEADER = "header"
+    TRIGGER_CHOICES = [
+        (SAMPLED, "sampled"),
+        (HEADER, "header"),
+    ]
+
+    view_name = models.CharField(max_length=200)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    user_id = models.IntegerField(blank=True, null=True)
+    duration = models.FloatField()
+    cpu_time = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_time = models.FloatField()
+    queries = models.JSONField(default=list, blank=True)
+    templates = models.JSONField(default=list, blank=True)
+    sample_count = models.PositiveIntegerField()
+    stacks = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-duration"], name="profiled_duration_idx"),
+            models.Index(fields=["view_name", "-duration"], name="profiled_view_duration_idx"),
+        ]
+
+    def __str__(self):
+        return "%s %s (%.0f ms)" % (self.method, self.path, self.duration * 1000)
@@ -0,0 +1,151 @@
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.template.base import Template
+
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+def token_signer():
+    return signing.TimestampSigner(salt="profiling")
+
+
+def profile_token():
+    return token_signer().sign("profile")
+
+
+def valid_token(value):
+    try:
+        token_signer().unsign(value, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def short_path(filename):
+    roots = sorted({str(settings.BASE_DIR), *(path for path in sys.path if path)}, key=len, reverse=True)
+    for root in roots:
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+@functools.lru_cache(maxsize=4096)
+def frame_label(code):
+    return "%s (%s:%d)" % (code.co_name, short_path(code.co_filename), code.co_firstlineno)
+
+
+def collapse(frame):
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+            del frame
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.queries = []
+        self.templates = defaultdict(lambda: [0, 0.0, 0.0])
+        self.template_stack = []
+        self.sampler = Sampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+        self.stack = ExitStack()
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context["connection"].alias, sql, time.perf_counter() - started))
+
+    def start(self):
+        self.token = current_profile.set(self)
+        for connection in connections.all():
+            self.stack.enter_context(connection.execute_wrapper(self.record_query))
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+        self.cpu_time = time.thread_time() - self.cpu_started
+        self.stack.close()
+        current_profile.reset(self.token)
+
+    def query_summary(self):
+        grouped = {}
+        for alias, sql, elapsed in self.queries:
+            entry = grouped.setdefault((alias, sql), {"alias": alias, "sql": sql, "count": 0, "time": 0.0})
+            entry["count"] += 1
+            entry["time"] += elapsed
+        return sorted(grouped.values(), key=lambda entry: -entry["time"])[:settings.PROFILING_QUERY_LIMIT]
+
+    def template_summary(self):
+        return sorted(
+            ({"name": name, "count": count, "inclusive": inclusive, "exclusive": exclusive}
+             for name, (count, inclusive, exclusive) in self.templates.items()),
+            key=lambda entry: -entry["exclusive"],
+        )
+
+    def collapsed_stacks(self):
+        return "\n".join("%s %d" % (stack, count) for stack, count in self.sampler.stacks.most_common())
+
+
+def instrument_templates():
+    original = Template.render
+    if getattr(original, "profiled", False):
+        return
+
+    @functools.wraps(original)
+    def render(self, context):
+        profile = current_profile.get()
+        if profile is None:
+            return original(self, context)
+        profile.template_stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = profile.template_stack.pop()
+            if profile.template_stack:
+                profile.template_stack[-1] += elapsed
+            entry = profile.templates[self.origin.template_name or self.name or "<string>"]
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] += elapsed - children
+
+    render.profiled = True
+    Template.render = render
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from comuse.models import Piece
+
+from .models import ProfiledRequest
+from .profiler import profile_token
+
+User = get_user_model()
+
+
+@override_settings(PROFILING_INTERVAL=0.0001, PROFILING_SAMPLE_RATES={})
+class TestProfilingMiddleware(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user", password="password")
+        Piece.objects.create(user=self.user, title="song", caption="post")
+        self.client.force_login(self.user)
+
+    def test_unsampled_request_is_not_profiled(self):
+        response = self.client.get(reverse("comuse:home"))
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(ProfiledRequest.objects.exists())
+
+    def test_signed_header_forces_profile(self):
+        response = self.client.get(reverse("comuse:home"), headers={"X-Profile": profile_token()})
+        profiled = ProfiledRequest.objects.get()
+        self.assertEqual(response["X-Profile-Id"], str(profiled.pk))
+        self.assertEqual(profiled.trigger, ProfiledRequest.HEADER)
+        self.assertEqual(profiled.view_name, "comuse:home")
+        self.assertEqual(profiled.user_id, self.user.pk)
+        self.assertEqual(profiled.status_code, 200)
+        self.assertGreater(profiled.query_count, 0)
+        self.assertEqual(profiled.query_count, sum(query["count"] for query in profiled.queries))
+        self.assertIn("comuse/home.html", [entry["name"] for entry in profiled.templates])
+        self.assertGreaterEqual(profiled.duration, profiled.query_time)
+
+    def test_invalid_header_is_ignored(self):
+        self.client.get(reverse("comuse:home"), headers={"X-Profile": "profile:forged:signature"})
+        self.assertFalse(ProfiledRequest.objects.exists())
+
+    def test_sample_rate_per_view(self):
+        with self.settings(PROFILING_SAMPLE_RATES={"comuse:home": 1.0}):
+            self.client.get(reverse("comuse:home"))
+            self.client.get(reverse("comuse:search"), {"q": "song"})
+        profiled = ProfiledRequest.objects.get()
+        self.assertEqual(profiled.trigger, ProfiledRequest.SAMPLED)
+        self.assertEqual(profiled.view_name, "comuse:home")
+
+    def test_default_sample_rate(self):
+        with self.settings(PROFILING_SAMPLE_RATES={"*": 1.0, "comuse:search": 0}):
+            self.client.get(reverse("comuse:home"))
+            self.client.get(reverse("comuse:search"), {"q": "song"})
+        self.assertEqual(list(ProfiledRequest.objects.values_list("view_name", flat=True)), ["comuse:home"])
+
+
+class TestProfilingAdmin(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="admin", password="password")
+        self.client.force_login(self.admin)
+        self.slow = ProfiledRequest.objects.create(
+            view_name="comuse:home", method="GET", path="/comuse/home/", status_code=200, trigger=ProfiledRequest.SAMPLED,
+            duration=0.5, cpu_time=0.2, query_count=2, query_time=0.25, sample_count=3,
+            queries=[{"alias": "default", "sql": "SELECT slow", "count": 2, "time": 0.25}],
+            templates=[{"name": "comuse/home.html", "count": 1, "inclusive": 0.1, "exclusive": 0.1}],
+            stacks="main;view;query 2\nmain;view 1",
+        )
+        self.fast = ProfiledRequest.objects.create(
+            view_name="comuse:search", method="GET", path="/comuse/search/", status_code=200, trigger=ProfiledRequest.HEADER,
+            duration=0.05, cpu_time=0.01, query_count=1, query_time=0.01, sample_count=1, stacks="main;view 1",
+        )
+
+    def test_changelist_orders_by_duration(self):
+        response = self.client.get(reverse("admin:profiling_profiledrequest_changelist"))
+        self.assertEqual(list(response.context["cl"].result_list), [self.slow, self.fast])
+
+    def test_detail_shows_breakdown(self):
+        response = self.client.get(reverse("admin:profiling_profiledrequest_change", args=[self.slow.pk]))
+        self.assertContains(response, "SELECT slow")
+        self.assertContains(response, "comuse/home.html")
+
+    def test_download_merges_stacks(self):
+        response = self.client.post(reverse("admin:profiling_profiledrequest_changelist"), {
+            "action": "download_stacks",
+            "_selected_action": [self.slow.pk, self.fast.pk],
+        })
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="profile.folded"')
+        self.assertEqual(sorted(response.content.decode().splitlines()), ["main;view 2", "main;view;query 2"])
@@ -1,6 +1,13 @@
 from django.contrib import admin
 
-from .models import User, Friendship
+from .models import User, Friendship, ProfileSummary
 
 admin.site.register(User)
 admin.site.register(Friendship)
+
+
+@admin.register(ProfileSummary)
+class ProfileSummaryAdmin(admin.ModelAdmin):
+    list_display = ("user", "piece_count", "following_count", "follower_count", "likes_received", "updated_at")
+    readonly_fields = ("latest_piece_ids", "updated_at")
+    search_fields = ("user__username",)
@@ -0,0 +1,100 @@
+import csv
+import json
+import posixpath
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from comuse.models import Piece, Like, Bookmark, Comment
+from comuse.storage import CHUNK_SIZE
+from .models import Friendship
+
+ITERATOR_CHUNK_SIZE = 500
+
+EXPORT_MODELS = {
+    "piece": ("id", "title", "caption", "uploadedFile", "commentAllowance", "created_at"),
+    "like": ("id", "target_id"),
+    "bookmark": ("id", "target_id"),
+    "comment": ("id", "target_id", "content", "created_at"),
+    "friendship": ("id", "following__username", "follower__username", "created_at"),
+}
+
+
+def export_queryset(user, model):
+    if model == "piece":
+        querysets = [Piece.objects.filter(user=user)]
+    elif model == "like":
+        querysets = Like.objects.scatter(user=user)
+    elif model == "bookmark":
+        querysets = Bookmark.objects.scatter(user=user)
+    elif model == "comment":
+        querysets = [Comment.objects.filter(user=user)]
+    else:
+        querysets = [Friendship.objects.filter(Q(following=user) | Q(follower=user))]
+    for queryset in querysets:
+        yield from queryset.order_by("pk").values(*EXPORT_MODELS[model]).iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+
+
+def iter_rows(user, models=EXPORT_MODELS):
+    for model in models:
+        for row in export_queryset(user, model):
+            yield model, row
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(user):
+    for model, row in iter_rows(user):
+        yield json.dumps(dict(row, model=model), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def stream_csv(user, model):
+    writer = csv.writer(_Echo())
+    fields = EXPORT_MODELS[model]
+    yield writer.writerow(fields)
+    for _, row in iter_rows(user, [model]):
+        yield writer.writerow([row[field] for field in fields])
+
+
+class _ZipBuffer:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(user):
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("data.ndjson", mode="w") as entry:
+            for line in stream_ndjson(user):
+                entry.write(line.encode())
+                yield buffer.pop()
+
+        files = Piece.objects.filter(user=user).exclude(uploadedFile="").exclude(uploadedFile=None)
+        names = files.order_by().values_list("uploadedFile", flat=True).distinct()
+        for name in names.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            if not default_storage.exists(name):
+                continue
+            info = zipfile.ZipInfo(posixpath.join("media", name))
+            info.compress_type = zipfile.ZIP_STORED
+            with default_storage.open(name) as source, archive.open(info, mode="w") as entry:
+                for chunk in source.chunks(CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield buffer.pop()
+    yield buffer.pop()
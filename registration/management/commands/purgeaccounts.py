@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from registration.purge import PURGE_BATCH_SIZE, purge_user
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Purge accounts whose deletion was requested through SignoutView."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        pending = User.objects.filter(deletion_requested_at__isnull=False).values_list("pk", "username")
+        for user_id, username in pending:
+            purge_user(user_id, options["batch_size"])
+            self.stdout.write("Purged %s" % username)
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from registration.summary import rebuild_in_batches
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized profile summaries from pieces, follows and likes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="Only rebuild these users. Defaults to every active user.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        rebuilt = rebuild_in_batches(users.values_list("pk", flat=True).iterator(), options["batch_size"])
+        self.stdout.write("Rebuilt %d profile summaries." % rebuilt)
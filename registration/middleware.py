@@ -0,0 +1,85 @@
+import copy
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+USER_CACHE_SIZE = 1024
+
+
+class UserLRU:
+    def __init__(self, maxsize=USER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.users = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            user = self.users.get(key)
+            if user is not None:
+                self.users.move_to_end(key)
+            return user
+
+    def set(self, key, user):
+        with self.lock:
+            self.users[key] = user
+            self.users.move_to_end(key)
+            while len(self.users) > self.maxsize:
+                self.users.popitem(last=False)
+
+    def evict(self, user_id):
+        with self.lock:
+            for key in [key for key in self.users if key[0] == str(user_id)]:
+                del self.users[key]
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+
+
+user_cache = UserLRU()
+
+
+def user_version_key(user_id):
+    return "auth-user-version:%s" % user_id
+
+
+def invalidate_user(user_id):
+    key = user_version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+    user_cache.evict(user_id)
+
+
+def get_cached_user(request):
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    if user_id is None or session.get(auth.BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    key = (str(user_id), session_hash, cache.get(user_version_key(user_id), 0))
+    user = user_cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            user_cache.set(key, copy.copy(user))
+        return user
+    if not session_hash or not constant_time_compare(session_hash, user.get_session_auth_hash()):
+        session.flush()
+        return AnonymousUser()
+    return copy.copy(user)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-19 13:44
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0005_user_deletion_requested_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileSummary",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("piece_count", models.IntegerField(default=0)),
+                ("following_count", models.IntegerField(default=0)),
+                ("follower_count", models.IntegerField(default=0)),
+                ("likes_received", models.IntegerField(default=0)),
+                ("latest_piece_ids", models.JSONField(blank=True, default=list)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
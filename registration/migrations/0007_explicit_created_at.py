@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-19 14:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("registration", "0006_profilesummary"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="friendship",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
@@ -1,19 +1,34 @@
 from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 
 class User(AbstractUser):
     email = models.EmailField()
     username_updated_at = models.DateField(auto_now_add=True)
+    deletion_requested_at = models.DateTimeField(blank=True, null=True)
 
 
 class Friendship(models.Model):
     following = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="follower")
     follower = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="following")
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["following", "follower"], name="follow_unique"),
         ]
+
+
+class ProfileSummary(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, primary_key=True, on_delete=models.CASCADE, related_name="summary")
+    piece_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+    follower_count = models.IntegerField(default=0)
+    likes_received = models.IntegerField(default=0)
+    latest_piece_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return str(self.user_id)
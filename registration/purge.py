@@ -0,0 +1,96 @@
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from comuse.audio import np
+from comuse.autocomplete import PIECE
+from comuse.hashtags import TAG_CLOUD_KEY, tag_count_key
+from comuse.models import Piece, Like, Bookmark, Comment, Mention, PieceTag, Upload
+from comuse.search import invalidate_search
+from comuse.shells import invalidate_shell
+from comuse.signals import update_autocomplete
+from comuse.vectors import vector_store
+from notifications.models import Notification
+from .models import Friendship
+from .summary import rebuild_in_batches
+
+User = get_user_model()
+
+PURGE_BATCH_SIZE = 500
+
+
+def delete_in_batches(queryset, batch_size=PURGE_BATCH_SIZE):
+    model = queryset.model
+    deleted = 0
+    while True:
+        with transaction.atomic(using=queryset.db):
+            ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += model.objects.filter(pk__in=ids)._raw_delete(queryset.db)
+
+
+def purge_pieces(user_id, batch_size=PURGE_BATCH_SIZE):
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Piece.objects.filter(user_id=user_id).values_list("pk", "uploadedFile")[:batch_size])
+            if not batch:
+                return deleted
+            ids = [pk for pk, _ in batch]
+            tag_ids = set(PieceTag.objects.filter(piece_id__in=ids).values_list("tag_id", flat=True))
+            for model in (Like, Bookmark):
+                for queryset in model.objects.gather(ids):
+                    queryset._raw_delete(queryset.db)
+            PieceTag.objects.filter(piece_id__in=ids)._raw_delete(PieceTag.objects.db)
+            Mention.objects.filter(piece_id__in=ids)._raw_delete(Mention.objects.db)
+            Comment.objects.filter(target_id__in=ids)._raw_delete(Comment.objects.db)
+            Notification.objects.filter(piece_id__in=ids)._raw_delete(Notification.objects.db)
+            deleted += Piece.objects.filter(pk__in=ids)._raw_delete(Piece.objects.db)
+        forget_pieces(ids, tag_ids)
+        for _, name in batch:
+            if name:
+                default_storage.delete(name)
+
+
+def forget_pieces(ids, tag_ids):
+    if np is not None:
+        vector_store().remove(*ids)
+    update_autocomplete([(PIECE, pk, None, 0) for pk in ids])
+    cache.delete_many([TAG_CLOUD_KEY] + [tag_count_key(pk) for pk in tag_ids])
+    invalidate_shell(*ids)
+    invalidate_search()
+
+
+def affected_users(user_id):
+    friends = Friendship.objects.filter(Q(following_id=user_id) | Q(follower_id=user_id)).values_list("following_id", "follower_id")
+    liked = Piece.objects.filter(pk__in=Like.objects.target_ids(user_id=user_id)).values_list("user_id", flat=True)
+    return ({pk for pair in friends for pk in pair} | set(liked)) - {user_id}
+
+
+def purge_user(user_id, batch_size=PURGE_BATCH_SIZE):
+    affected = affected_users(user_id)
+    for model in (Like, Bookmark):
+        for queryset in model.objects.scatter(user_id=user_id):
+            delete_in_batches(queryset, batch_size)
+    delete_in_batches(Mention.objects.filter(Q(user_id=user_id) | Q(comment__user_id=user_id)), batch_size)
+    delete_in_batches(Comment.objects.filter(user_id=user_id), batch_size)
+    delete_in_batches(Friendship.objects.filter(Q(following_id=user_id) | Q(follower_id=user_id)), batch_size)
+
+    for upload_id in Upload.objects.filter(user_id=user_id).values_list("pk", flat=True):
+        default_storage.discard_staged(str(upload_id))
+    delete_in_batches(Upload.objects.filter(user_id=user_id), batch_size)
+
+    purge_pieces(user_id, batch_size)
+    User.objects.filter(pk=user_id).delete()
+    rebuild_in_batches(affected, batch_size)
+
+
+def request_deletion(user):
+    user.is_active = False
+    user.deletion_requested_at = timezone.now()
+    user.save(update_fields=["is_active", "deletion_requested_at"])
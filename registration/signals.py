@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from comuse.models import Piece
+from .middleware import invalidate_user
+from .models import Friendship
+from .summary import adjust_follow, discard_neighbour_summaries, discard_summary, push_piece
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def recount_neighbours(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and getattr(instance, "_activation_changed", False):
+        discard_neighbour_summaries(instance.pk)
+
+
+@receiver(post_save, sender=Piece)
+def count_new_piece(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        push_piece(instance.user_id, instance.pk)
+
+
+@receiver(post_delete, sender=Piece)
+def discard_owner_summary(sender, instance, **kwargs):
+    discard_summary(instance.user_id)
+
+
+@receiver(post_save, sender=Friendship)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_follow(instance.follower_id, instance.following_id, 1)
+
+
+@receiver(post_delete, sender=Friendship)
+def count_unfollow(sender, instance, **kwargs):
+    adjust_follow(instance.follower_id, instance.following_id, -1)
@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from comuse.models import Piece, Like
+from .models import Friendship, ProfileSummary
+
+User = get_user_model()
+
+SUMMARY_FIELDS = ["piece_count", "following_count", "follower_count", "likes_received", "latest_piece_ids", "updated_at"]
+
+
+def summary_key(user_id):
+    return "profile-summary:%s" % user_id
+
+
+def forget(*user_ids):
+    keys = [summary_key(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def rebuild_summaries(user_ids):
+    user_ids = list(user_ids)
+    pieces = defaultdict(list)
+    for pk, user_id in Piece.objects.filter(user_id__in=user_ids).order_by("-created_at", "-pk").values_list("pk", "user_id"):
+        pieces[user_id].append(pk)
+    likes = Like.objects.counts([pk for ids in pieces.values() for pk in ids])
+    following = dict(
+        Friendship.objects.filter(follower_id__in=user_ids, following__is_active=True)
+        .order_by().values_list("follower_id").annotate(n=Count("pk"))
+    )
+    followers = dict(
+        Friendship.objects.filter(following_id__in=user_ids, follower__is_active=True)
+        .order_by().values_list("following_id").annotate(n=Count("pk"))
+    )
+    now = timezone.now()
+    summaries = [
+        ProfileSummary(
+            user_id=user_id,
+            piece_count=len(pieces[user_id]),
+            following_count=following.get(user_id, 0),
+            follower_count=followers.get(user_id, 0),
+            likes_received=sum(likes.get(pk, 0) for pk in pieces[user_id]),
+            latest_piece_ids=pieces[user_id][:settings.PROFILE_SUMMARY_LATEST],
+            updated_at=now,
+        )
+        for user_id in user_ids
+    ]
+    ProfileSummary.objects.bulk_create(summaries, update_conflicts=True, unique_fields=["user"], update_fields=SUMMARY_FIELDS)
+    cache.delete_many([summary_key(user_id) for user_id in user_ids])
+    return summaries
+
+
+def rebuild_in_batches(user_ids, batch_size=1000):
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        rebuild_summaries(user_ids[start:start + batch_size])
+    return len(user_ids)
+
+
+def get_summary(user_id):
+    key = summary_key(user_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = ProfileSummary.objects.filter(user_id=user_id).first() or rebuild_summaries([user_id])[0]
+        cache.set(key, summary, settings.PROFILE_SUMMARY_TIMEOUT)
+    return summary
+
+
+def adjust_summary(user_id, **deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    ProfileSummary.objects.filter(user_id=user_id).update(updated_at=timezone.now(), **updates)
+    forget(user_id)
+
+
+def adjust_follow(follower_id, following_id, delta):
+    active = set(User.objects.filter(pk__in=[follower_id, following_id], is_active=True).values_list("pk", flat=True))
+    if following_id in active:
+        adjust_summary(follower_id, following_count=delta)
+    if follower_id in active:
+        adjust_summary(following_id, follower_count=delta)
+
+
+def discard_summary(user_id):
+    ProfileSummary.objects.filter(user_id=user_id).delete()
+    forget(user_id)
+
+
+def discard_neighbour_summaries(user_id):
+    friendships = Friendship.objects.filter(Q(follower_id=user_id) | Q(following_id=user_id))
+    user_ids = {pk for pair in friendships.values_list("follower_id", "following_id") for pk in pair} - {user_id}
+    ProfileSummary.objects.filter(user_id__in=user_ids).delete()
+    forget(*user_ids)
+
+
+def push_piece(user_id, piece_id):
+    with transaction.atomic():
+        summary = ProfileSummary.objects.select_for_update().filter(user_id=user_id).first()
+        if summary is not None:
+            summary.piece_count += 1
+            summary.latest_piece_ids = [piece_id, *summary.latest_piece_ids][:settings.PROFILE_SUMMARY_LATEST]
+            summary.updated_at = timezone.now()
+            summary.save(update_fields=["piece_count", "latest_piece_ids", "updated_at"])
+    forget(user_id)
@@ -0,0 +1,7 @@
+from jobs.queue import task
+from .purge import purge_user
+
+
+@task(name="registration.purge_user", priority=-10, timeout=3600)
+def purge_account(user_id):
+    purge_user(user_id)
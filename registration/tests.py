@@ -1,13 +1,32 @@
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 import datetime
-
-from comuse.models import Piece, Bookmark
-
-from .models import Friendship
+import io
+import json
+import zipfile
+from unittest import mock
+
+from comuse.audio import np
+from comuse.autocomplete import autocomplete_index, piece_entries
+from comuse.hashtags import tag_cloud
+from comuse.models import Piece, Bookmark, Comment, Like, Tag
+from comuse.vectors import vector_store
+from jobs.models import Job
+from jobs.queue import run_pending
+from myapp.testing import IsolatedStorageMixin
+
+from .models import Friendship, ProfileSummary
 from .forms import UserNameUpdateForm
+from .middleware import CachedAuthenticationMiddleware, user_cache
+from .summary import get_summary, rebuild_summaries
 
 User = get_user_model()
 
@@ -286,6 +305,8 @@ class TestLogoutView(TestCase):
 
 class TestUserProfileView(TestCase):
     def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
         self.login_user = User.objects.create_user(username="testuser", password="testpassword")
         self.target_user = User.objects.create_user(username="testuser2", password="testpassword2")
         self.client.force_login(self.login_user)
@@ -306,6 +327,101 @@ class TestUserProfileView(TestCase):
         ct_following = Friendship.objects.filter(follower__exact=self.target_user).count()
         self.assertEqual(context["following_num"], ct_following)
 
+    def test_not_modified_until_followed(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        Friendship.objects.create(follower=self.login_user, following=self.target_user)
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+
+    @override_settings(PROFILE_SUMMARY_LATEST=1)
+    def test_older_pieces_are_paged(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["piece_list"], [self.target_piece2])
+        response = self.client.get(self.url, {"before": response.context["next_cursor"]})
+        self.assertEqual(response.context["piece_list"], [self.target_piece1])
+        self.assertIsNone(response.context["next_cursor"])
+
+    def test_header_served_from_summary(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(8):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["summary"].piece_count, 2)
+
+
+class TestProfileSummary(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user1 = User.objects.create_user(username="test1", password="password1")
+        self.user2 = User.objects.create_user(username="test2", password="password2")
+        self.piece = Piece.objects.create(user=self.user1, title="test1", caption="post1")
+        Friendship.objects.create(follower=self.user2, following=self.user1)
+        Like.objects.create(user=self.user2, target=self.piece)
+
+    def test_rebuild(self):
+        summary, = rebuild_summaries([self.user1.pk])
+        self.assertEqual(summary.piece_count, 1)
+        self.assertEqual(summary.follower_count, 1)
+        self.assertEqual(summary.following_count, 0)
+        self.assertEqual(summary.likes_received, 1)
+        self.assertEqual(summary.latest_piece_ids, [self.piece.pk])
+
+    def test_maintained_incrementally(self):
+        get_summary(self.user1.pk)
+        get_summary(self.user2.pk)
+        piece = Piece.objects.create(user=self.user1, title="test2", caption="post2")
+        Friendship.objects.create(follower=self.user1, following=self.user2)
+        self.client.force_login(self.user2)
+        self.client.post(reverse("comuse:like", kwargs={"pk": piece.pk}))
+
+        summary = get_summary(self.user1.pk)
+        self.assertEqual(summary.piece_count, 2)
+        self.assertEqual(summary.following_count, 1)
+        self.assertEqual(summary.likes_received, 2)
+        self.assertEqual(summary.latest_piece_ids, [piece.pk, self.piece.pk])
+        self.assertEqual(get_summary(self.user2.pk).follower_count, 1)
+
+        self.client.post(reverse("comuse:unlike", kwargs={"pk": piece.pk}))
+        Friendship.objects.filter(follower=self.user2).delete()
+        summary = get_summary(self.user1.pk)
+        self.assertEqual(summary.likes_received, 1)
+        self.assertEqual(summary.follower_count, 0)
+
+    def test_inactive_followers_are_not_counted(self):
+        inactive = User.objects.create_user(username="inactive", password="password", is_active=False)
+        get_summary(self.user1.pk)
+        Friendship.objects.create(follower=inactive, following=self.user1)
+        self.assertEqual(get_summary(self.user1.pk).follower_count, 1)
+        Friendship.objects.filter(follower=inactive).delete()
+        self.assertEqual(get_summary(self.user1.pk).follower_count, 1)
+
+    def test_deactivation_recounts_neighbours(self):
+        self.assertEqual(get_summary(self.user1.pk).follower_count, 1)
+        self.user2.is_active = False
+        self.user2.save()
+        self.assertEqual(get_summary(self.user1.pk).follower_count, 0)
+        self.user2.is_active = True
+        self.user2.save()
+        self.assertEqual(get_summary(self.user1.pk).follower_count, 1)
+
+    def test_deleted_piece_forces_rebuild(self):
+        get_summary(self.user1.pk)
+        self.piece.delete()
+        self.assertFalse(ProfileSummary.objects.exists())
+        summary = get_summary(self.user1.pk)
+        self.assertEqual((summary.piece_count, summary.likes_received, summary.latest_piece_ids), (0, 0, []))
+
+    def test_rebuild_command(self):
+        out = io.StringIO()
+        call_command("rebuildsummaries", stdout=out)
+        self.assertIn("Rebuilt 2 profile summaries.", out.getvalue())
+        self.assertEqual(ProfileSummary.objects.get(user=self.user2).following_count, 1)
+
 
 class TestFollowView(TestCase):
     def setUp(self):
@@ -433,6 +549,17 @@ class TestTimelineView(TestCase):
         self.assertTemplateUsed(response, "registration/timeline.html")
         self.assertQuerysetEqual(context["piece_list"], Piece.objects.select_related("user").prefetch_related("likes", "bookmarks").filter(user__in=followings).order_by("-created_at"))
 
+    def test_not_modified_until_followed_user_posts(self):
+        Friendship.objects.create(follower=self.login_user, following=self.target_user)
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+        Piece.objects.create(user=self.target_user, title="test3", caption="post3")
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
 
 class TestUserNameUpdateView(TestCase):
     def setUp(self):        
@@ -514,3 +641,172 @@ class TestUserNameUpdateView(TestCase):
         )
         self.assertIn("同じユーザー名が既に登録済みです。", form.errors["username"])
         User.objects.last().delete()
+
+
+class TestExportView(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user1 = User.objects.create_user(username="test1", password="password1")
+        self.user2 = User.objects.create_user(username="test2", password="password2")
+        self.client.force_login(self.user1)
+        self.piece = Piece.objects.create(user=self.user1, title="曲", caption="post")
+        self.piece.uploadedFile.save("song.mp3", ContentFile(b"sound"))
+        other_piece = Piece.objects.create(user=self.user2, title="test2", caption="post2")
+        Like.objects.create(user=self.user1, target=other_piece)
+        Bookmark.objects.create(user=self.user1, target=other_piece)
+        Comment.objects.create(user=self.user1, target=other_piece, content="comment")
+        Friendship.objects.create(follower=self.user1, following=self.user2)
+        self.url = reverse("registration:export", kwargs={"username": self.user1.username})
+
+    def test_success_get_ndjson(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["model"] for row in rows], ["piece", "like", "bookmark", "comment", "friendship"])
+        self.assertEqual(rows[0]["title"], "曲")
+        self.assertEqual(rows[4]["following__username"], "test2")
+
+    def test_success_get_csv(self):
+        response = self.client.get(self.url, {"format": "csv", "model": "comment"})
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,target_id,content,created_at")
+        self.assertEqual(len(lines), 2)
+
+    def test_success_get_zip(self):
+        response = self.client.get(self.url, {"format": "zip"})
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(len(archive.read("data.ndjson").splitlines()), 5)
+        self.assertEqual(archive.read("media/" + self.piece.uploadedFile.name), b"sound")
+
+    def test_failure_get_with_other_user(self):
+        response = self.client.get(reverse("registration:export", kwargs={"username": self.user2.username}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_failure_get_with_unknown_format(self):
+        response = self.client.get(self.url, {"format": "xml"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestSignoutView(IsolatedStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user1 = User.objects.create_user(username="test1", password="password1")
+        self.user2 = User.objects.create_user(username="test2", password="password2")
+        self.client.force_login(self.user1)
+        self.piece = Piece.objects.create(user=self.user1, title="test1", caption="post1")
+        self.piece.uploadedFile.save("song.mp3", ContentFile(b"sound"))
+        other_piece = Piece.objects.create(user=self.user2, title="test2", caption="post2")
+        Like.objects.create(user=self.user2, target=self.piece)
+        Like.objects.create(user=self.user1, target=other_piece)
+        Bookmark.objects.create(user=self.user2, target=self.piece)
+        Comment.objects.create(user=self.user2, target=self.piece, content="comment")
+        Friendship.objects.create(follower=self.user2, following=self.user1)
+        self.url = reverse("registration:signout", kwargs={"username": self.user1.username})
+
+    def test_success_post(self):
+        response = self.client.post(self.url)
+        self.assertRedirects(response, reverse("welcome:index"), status_code=302, target_status_code=200)
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+        user = User.objects.get(pk=self.user1.pk)
+        self.assertFalse(user.is_active)
+        self.assertIsNotNone(user.deletion_requested_at)
+        self.assertTrue(Piece.objects.filter(user=user).exists())
+
+        self.client.force_login(self.user2)
+        response = self.client.get(reverse("comuse:home"))
+        self.assertNotIn(self.piece, response.context["piece_list"])
+        response = self.client.get(reverse("registration:user_profile", kwargs={"username": self.user1.username}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_failure_post_with_other_user(self):
+        response = self.client.post(reverse("registration:signout", kwargs={"username": self.user2.username}))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(User.objects.get(pk=self.user2.pk).is_active)
+
+    def test_success_purge(self):
+        name = self.piece.uploadedFile.name
+        self.client.post(self.url)
+        call_command("purgeaccounts", "--batch-size", "1", stdout=io.StringIO())
+        run_pending()
+
+        self.assertFalse(User.objects.filter(pk=self.user1.pk).exists())
+        self.assertEqual(Piece.objects.count(), 1)
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Bookmark.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Friendship.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_purge_forgets_indexed_pieces(self):
+        self.piece.caption = "post1 #jazz"
+        self.piece.save()
+        autocomplete_index().apply(piece_entries(Piece.objects.all()))
+        if np is not None:
+            vector_store().add(self.piece.pk, np.ones(vector_store().dim))
+        self.assertEqual(tag_cloud(), [("jazz", 1)])
+        self.assertTrue(autocomplete_index().search("test1"))
+
+        self.client.post(self.url)
+        call_command("purgeaccounts", stdout=io.StringIO())
+
+        self.assertEqual(tag_cloud(), [])
+        self.assertEqual(cache.get("tag-count:%s" % Tag.objects.get(name="jazz").pk), None)
+        self.assertEqual(autocomplete_index().search("test1"), [])
+        if np is not None:
+            self.assertIsNone(vector_store().get(self.piece.pk))
+
+    def test_success_purge_in_background(self):
+        name = self.piece.uploadedFile.name
+        self.client.post(self.url)
+        self.assertTrue(User.objects.filter(pk=self.user1.pk).exists())
+        self.assertTrue(Job.objects.filter(name="registration.purge_user", args=[self.user1.pk]).exists())
+
+        run_pending()
+        self.assertFalse(User.objects.filter(pk=self.user1.pk).exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+
+class TestCachedAuthenticationMiddleware(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+
+    def get_user(self):
+        request = RequestFactory().get("/")
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = self.client.session.session_key
+        SessionMiddleware(lambda request: HttpResponse()).process_request(request)
+        CachedAuthenticationMiddleware(lambda request: HttpResponse()).process_request(request)
+        return request.user
+
+    def test_hot_user_needs_no_queries(self):
+        self.assertEqual(self.get_user(), self.user)
+        with self.assertNumQueries(0):
+            user = self.get_user()
+            self.assertEqual(user.username, "testuser")
+
+    def test_invalidated_on_username_update(self):
+        self.get_user()
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertEqual(self.get_user().username, "renamed")
+
+    def test_inactive_user_is_logged_out(self):
+        self.get_user()
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.get_user().is_authenticated)
+
+    def test_password_change_in_another_process(self):
+        self.get_user()
+        with mock.patch.object(user_cache, "evict"):
+            self.user.set_password("changed")
+            self.user.save()
+        self.assertFalse(self.get_user().is_authenticated)
@@ -26,4 +26,5 @@ urlpatterns = [
     ),
     path("<str:username>/timeline/", views.TimelineView.as_view(), name="timeline"),
     path("<str:username>/editun/", views.UserNameUpdateView.as_view(), name="editun"),
+    path("<str:username>/export/", views.ExportView.as_view(), name="export"),
 ]
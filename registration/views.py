@@ -1,17 +1,27 @@
 from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import authenticate, get_user_model, login
+from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import HttpResponseBadRequest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import HttpResponseRedirect, get_object_or_404, render, redirect
 from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, View, FormView
 
 import datetime
 
+from . import export
+from .purge import request_deletion
+from .tasks import purge_account
 from .forms import SignupForm, UserNameUpdateForm
 from .models import Friendship
+from .summary import get_summary
+from comuse.mixins import ConditionalGetMixin, KeysetPageMixin, ReplicaReadMixin, queryset_version
 from comuse.models import Piece, Like, Bookmark
+from comuse.partitions import decode_cursor, encode_cursor
+from comuse.ratelimit import RateLimitMixin
+from jobs.queue import enqueue
+from notifications.events import record
+from notifications.models import Notification
 
 User = get_user_model()
 
@@ -47,27 +57,65 @@ class SignoutView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         self.object = self.get_object()
         return self.request.user == self.object
 
+    def form_valid(self, form):
+        request_deletion(self.object)
+        enqueue(purge_account, [self.object.pk])
+        logout(self.request)
+        return HttpResponseRedirect(self.get_success_url())
+
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+class UserProfileView(LoginRequiredMixin, ReplicaReadMixin, ConditionalGetMixin, DetailView):
     template_name = "registration/profile.html"
     model = User
+    queryset = model.objects.filter(is_active=True)
     context_object_name = "user"
     slug_url_kwarg = "username"
     slug_field = "username"
 
+    def get_object(self, queryset=None):
+        if not hasattr(self, "profile_user"):
+            self.profile_user = super().get_object(queryset)
+            self.summary = get_summary(self.profile_user.pk)
+        return self.profile_user
+
+    def get_etag_parts(self):
+        user = self.get_object()
+        return [
+            user.pk,
+            self.summary.updated_at,
+            *[queryset_version(likes) for likes in Like.objects.scatter(user=self.request.user)],
+            *[queryset_version(bookmarks) for bookmarks in Bookmark.objects.scatter(user=self.request.user)],
+        ]
+
+    def get_pieces(self):
+        pieces = Piece.objects.select_related("user").with_like_counts().filter(user=self.object)
+        before = decode_cursor(self.request.GET.get("before"))
+        if before is not None:
+            page = pieces.keyset_page(settings.PROFILE_SUMMARY_LATEST + 1, before)
+            return page[:settings.PROFILE_SUMMARY_LATEST], len(page) > settings.PROFILE_SUMMARY_LATEST
+        latest = self.summary.latest_piece_ids
+        found = {piece.pk: piece for piece in pieces.filter(pk__in=latest)}
+        return [found[pk] for pk in latest if pk in found], self.summary.piece_count > len(latest)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.object
-        context["piece_list"] = Piece.objects.select_related("user").filter(user=user).order_by("-created_at")
+        piece_list, has_more = self.get_pieces()
+        piece_ids = [piece.pk for piece in piece_list]
+        context["summary"] = self.summary
+        context["piece_list"] = piece_list
+        context["next_cursor"] = encode_cursor(piece_list[-1]) if has_more and piece_list else None
         context["is_following"] = Friendship.objects.filter(following=user, follower=self.request.user).exists()
-        context["following_num"] = Friendship.objects.filter(follower=user).count()
-        context["followers_num"] = Friendship.objects.filter(following=user).count()
-        context["user_like_list"] = Like.objects.filter(user=self.request.user).values_list("target", flat=True)
-        context["user_bookmark_list"] = Bookmark.objects.filter(user=self.request.user).values_list("target", flat=True)
+        context["following_num"] = self.summary.following_count
+        context["followers_num"] = self.summary.follower_count
+        context["user_like_list"] = set().union(*[likes.values_list("target_id", flat=True) for likes in Like.objects.gather(piece_ids, user=self.request.user)])
+        context["user_bookmark_list"] = set().union(*[bookmarks.values_list("target_id", flat=True) for bookmarks in Bookmark.objects.gather(piece_ids, user=self.request.user)])
         return context
 
 
-class FollowView(LoginRequiredMixin, View):
+class FollowView(LoginRequiredMixin, RateLimitMixin, View):
+    ratelimit_scope = "follow"
+
     def post(self, request, *args, **kwargs):
         following = get_object_or_404(User, username=self.kwargs["username"])
         follower = request.user
@@ -81,10 +129,13 @@ class FollowView(LoginRequiredMixin, View):
             return HttpResponseRedirect(reverse("registration:user_profile", kwargs={"username": following.username}))
 
         Friendship.objects.create(following=following, follower=follower)
+        record(Notification.FOLLOW, follower, following.pk)
         return HttpResponseRedirect(reverse("registration:user_profile", kwargs={"username": following.username}))
 
 
-class UnFollowView(LoginRequiredMixin, View):
+class UnFollowView(LoginRequiredMixin, RateLimitMixin, View):
+    ratelimit_scope = "follow"
+
     def post(self, request, *args, **kwargs):
         following = get_object_or_404(User, username=self.kwargs["username"])
         follower = request.user
@@ -101,25 +152,33 @@ class UnFollowView(LoginRequiredMixin, View):
             return HttpResponseBadRequest(render(request, "error/400.html"))
 
 
-class FollowingListView(LoginRequiredMixin, ListView):
+class FollowingListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
     template_name = "registration/following_list.html"
     context_object_name = "following_list"
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs["username"])
-        return Friendship.objects.select_related("following").filter(follower=user).order_by("-created_at")
+        self.user = get_object_or_404(User, username=self.kwargs["username"])
+        return Friendship.objects.select_related("following").filter(follower=self.user, following__is_active=True).order_by("-created_at")
+
+    def get_context_data(self, **kwargs):
+        kwargs["summary"] = get_summary(self.user.pk)
+        return super().get_context_data(**kwargs)
 
 
-class FollowerListView(LoginRequiredMixin, ListView):
+class FollowerListView(LoginRequiredMixin, ReplicaReadMixin, ListView):
     template_name = "registration/follower_list.html"
     context_object_name = "follower_list"
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs["username"])
-        return Friendship.objects.select_related("follower").filter(following=user).order_by("-created_at")
+        self.user = get_object_or_404(User, username=self.kwargs["username"])
+        return Friendship.objects.select_related("follower").filter(following=self.user, follower__is_active=True).order_by("-created_at")
+
+    def get_context_data(self, **kwargs):
+        kwargs["summary"] = get_summary(self.user.pk)
+        return super().get_context_data(**kwargs)
 
 
-class MyBookmarksView(LoginRequiredMixin, DetailView):
+class MyBookmarksView(LoginRequiredMixin, ReplicaReadMixin, DetailView):
     template_name = "registration/bookmark_list.html"
     model = User
     context_object_name = "user"
@@ -129,27 +188,30 @@ class MyBookmarksView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.object
-        bookmarked = Piece.objects.select_related("user").prefetch_related("likes", "bookmarks").filter(bookmarks__user=user).order_by("-created_at")
+        bookmark_ids = Bookmark.objects.target_ids(user=user)
+        bookmarked = Piece.objects.select_related("user").with_like_counts().filter(pk__in=bookmark_ids, user__is_active=True).order_by("-created_at")
         context["bookmarked_piece_list"] = bookmarked
-        context["user_like_list"] = Like.objects.filter(target__in=bookmarked).values_list("target", flat=True)
-        context["user_bookmark_list"] = Bookmark.objects.filter(user=user).values_list("target", flat=True)
+        context["user_like_list"] = set().union(*[likes.values_list("target_id", flat=True) for likes in Like.objects.gather(bookmark_ids)])
+        context["user_bookmark_list"] = bookmark_ids
         return context
 
 
-class TimelineView(LoginRequiredMixin, ListView):
+class TimelineView(LoginRequiredMixin, ReplicaReadMixin, ConditionalGetMixin, KeysetPageMixin, ListView):
     template_name = "registration/timeline.html"
     model = Piece
 
+    def get_etag_parts(self):
+        followings = Friendship.objects.filter(follower=self.request.user).values_list("following", flat=True)
+        return [self.page_state(Piece.objects.filter(user__in=followings, user__is_active=True))]
+
     def get_queryset(self):
         followings = Friendship.objects.filter(follower=self.request.user).values_list("following", flat=True)
-        return Piece.objects.select_related("user").prefetch_related("likes", "bookmarks").filter(user__in=followings).order_by("-created_at")
+        return Piece.objects.select_related("user").with_like_counts().filter(user__in=followings, user__is_active=True).order_by("-created_at")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        likes = Like.objects.select_related("target").filter(user=self.request.user).values_list("target", flat=True)
-        bookmarks = Bookmark.objects.select_related("target").filter(user=self.request.user).values_list("target", flat=True)
-        context["user_like_list"] = likes
-        context["user_bookmark_list"] = bookmarks
+        context["user_like_list"] = Like.objects.target_ids(user=self.request.user)
+        context["user_bookmark_list"] = Bookmark.objects.target_ids(user=self.request.user)
         return context
 
 
@@ -175,3 +237,28 @@ class UserNameUpdateView(LoginRequiredMixin, FormView):
             "username" : self.request.user.username,
         })
         return kwargs
+
+
+class ExportView(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.username == self.kwargs["username"]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        export_format = request.GET.get("format", "ndjson")
+        if export_format == "ndjson":
+            response = StreamingHttpResponse(export.stream_ndjson(user), content_type="application/x-ndjson; charset=utf-8")
+            filename = "comuse-%s.ndjson" % user.username
+        elif export_format == "csv":
+            model = request.GET.get("model", "piece")
+            if model not in export.EXPORT_MODELS:
+                raise Http404
+            response = StreamingHttpResponse(export.stream_csv(user, model), content_type="text/csv; charset=utf-8")
+            filename = "comuse-%s-%s.csv" % (user.username, model)
+        elif export_format == "zip":
+            response = StreamingHttpResponse(export.stream_zip(user), content_type="application/zip")
+            filename = "comuse-%s.zip" % user.username
+        else:
+            raise Http404
+        response["Content-Disposition"] = 'attachment; filename="%s"' % filename
+        return response
@@ -1,3 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.urls import reverse
 
-# Create your tests here.
+from myapp.edge import EdgeCache, shared_ttl
+
+User = get_user_model()
+
+
+class TestWelcomeView(TestCase):
+    def setUp(self):
+        self.url = reverse("welcome:index")
+
+    def test_success_get_anonymous_is_publicly_cacheable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "welcome.html")
+        self.assertGreater(shared_ttl(response["Cache-Control"]), 0)
+        self.assertFalse(response.cookies)
+
+    def test_success_get_authenticated_is_private(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(shared_ttl(response["Cache-Control"]), 0)
+
+
+class TestEdgeCache(TestCase):
+    def request(self, edge, cookie="", method="get"):
+        environ = getattr(RequestFactory(), method)(reverse("welcome:index")).environ
+        if cookie:
+            environ["HTTP_COOKIE"] = cookie
+        status = {}
+        body = b"".join(edge(environ, lambda s, headers, exc_info=None: status.update(headers=dict(headers))))
+        return status["headers"], body
+
+    def test_anonymous_welcome_page_is_served_from_edge(self):
+        edge = EdgeCache(WSGIHandler())
+        headers, first = self.request(edge)
+        self.assertEqual(headers["X-Cache"], "MISS")
+        for _ in range(9):
+            headers, body = self.request(edge)
+            self.assertEqual(headers["X-Cache"], "HIT")
+            self.assertEqual(body, first)
+        self.assertEqual(edge.hit_rate, 0.9)
+
+    def test_head_responses_are_not_replayed_to_get(self):
+        edge = EdgeCache(WSGIHandler())
+        self.request(edge, method="head")
+        headers, body = self.request(edge)
+        self.assertEqual(headers["X-Cache"], "MISS")
+        self.assertTrue(body)
+        headers, _ = self.request(edge, method="head")
+        self.assertEqual(headers["X-Cache"], "HIT")
+
+    def test_logged_in_requests_bypass_edge(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(user)
+        cookie = "sessionid=%s" % self.client.session.session_key
+        edge = EdgeCache(WSGIHandler())
+        self.request(edge)
+        headers, body = self.request(edge, cookie=cookie)
+        self.assertNotIn("X-Cache", headers)
+        self.assertIn("testuser".encode(), body)
+        self.assertEqual(edge.bypasses, 1)
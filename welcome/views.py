@@ -1,5 +1,16 @@
+from django.utils.cache import patch_cache_control
 from django.views.generic import TemplateView
 
+SHARED_CACHE_SECONDS = 600
+
 
 class WelcomeView(TemplateView):
     template_name = "welcome.html"
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=60, s_maxage=SHARED_CACHE_SECONDS)
+        return response